@@ -0,0 +1,210 @@
+#! /usr/bin/python
+
+## LoggerBus.py -- Shared-memory sample bus for Combustion Monitoring
+## using BeagleBone Black (BBB) platform
+##
+## With sampleBus = True in LoggerConfig, the logger (the one process that owns the ADCs, DLVR, XBee and
+## GPIO) publishes each scan's values to a ring in shared memory (<siteName>_Bus.bin in BUS_PATH). Other
+## processes--a display, an uploader, diagnostics--attach and read the ring at their own pace, without
+## being patched into the scan loop or holding it up. The file is laid out as:
+##   MAGIC | generation (uint64, usec) | slots (uint32) | slot size (uint32) | layout length (uint32)
+##   | published (uint64): scans published so far | layout: JSON headers and units | slots
+## all little-endian. The layout is fixed for the life of the bus: "t" (the scan's UTC epoch sec) and the
+## number columns of the data record, each a double (NaN when there's no value). Slot n % slots holds
+## scan n, after a sequence number:
+##   sequence (uint64) | a double per column
+## The publisher sets the sequence to 2n+1 before writing the slot and to 2n+2 after, then bumps
+## published; a reader takes the slot only if it reads 2n+2 both before and after copying it, so a
+## reader that has fallen a whole ring behind skips (and counts) what was overwritten rather than
+## reading a torn sample. The publisher never waits for readers.
+## A restarted logger starts a new bus file (renamed into place); readers notice and attach to it.
+##   python LoggerBus.py /dev/shm/MN_08_Bus.bin                        ## a CSV line per scan as it comes
+##   python LoggerBus.py /dev/shm/MN_08_Bus.bin t t_out sys_state      ## just these columns
+##   python LoggerBus.py --status /dev/shm/MN_08_Bus.bin
+
+from __future__ import print_function
+import os, sys, mmap, json, struct, time
+
+MAGIC = b"CSLOGS1\n"
+BUS_PATH = "/dev/shm/" ## memory, not the SD card
+BUS_SLOTS = 600 ## ~10 min of scans
+POLL_SECONDS = 0.1 ## how often a following reader looks for new scans
+TIME_HEADER = "t"
+KIND_NUMBER = "number" ## as LoggerCodec.KIND_NUMBER
+NaN = float('NaN')
+
+busHead = struct.Struct("<8sQIII")
+publishedField = struct.Struct("<Q")
+sequenceField = struct.Struct("<Q")
+PUBLISHED_OFFSET = busHead.size
+LAYOUT_OFFSET = busHead.size + publishedField.size
+
+def busFilename(siteName, path=BUS_PATH):
+    return path+siteName+"_Bus.bin"
+
+def number(field):
+    try:
+        return float(field)
+    except (TypeError, ValueError):
+        return NaN
+
+class BusError(Exception):
+    """a bus file that can't be attached to: bad magic or layout"""
+    pass
+
+class Publisher(object):
+    """includes the bus file a scan's values are published to, and how many have been"""
+
+    def __init__(self, filename, layout, slots=BUS_SLOTS):
+        ## layout: the data record's, as Schema.describe() gives it; its number columns are published
+        self.filename = filename
+        self.columns = [index for index, kind in enumerate(layout["kinds"]) if kind == KIND_NUMBER]
+        self.headers = [TIME_HEADER] + [layout["headers"][index] for index in self.columns]
+        self.units = ["sec"] + [layout["units"][index] for index in self.columns]
+        self.row = struct.Struct("<" + "d"*len(self.headers))
+        self.slots = slots
+        self.slotSize = sequenceField.size + self.row.size
+        text = json.dumps({"headers": self.headers, "units": self.units}).encode("latin-1")
+        self.slotsOffset = ((LAYOUT_OFFSET + len(text) + 7) // 8) * 8
+        size = self.slotsOffset + slots*self.slotSize
+        self.published = 0
+        with open(filename+".tmp", 'w+b') as busFile:
+            busFile.truncate(size)
+            self.map = mmap.mmap(busFile.fileno(), size)
+        busHead.pack_into(self.map, 0, MAGIC, int(time.time()*1e6), slots, self.slotSize, len(text))
+        publishedField.pack_into(self.map, PUBLISHED_OFFSET, 0)
+        self.map[LAYOUT_OFFSET:LAYOUT_OFFSET + len(text)] = text
+        os.rename(filename+".tmp", filename) ## readers of a previous bus see a new file
+        pass
+
+    def publish(self, t, fields):
+        """publishes one scan: t and the data record's fields (as Schema.scanValues() gives them)"""
+        offset = self.slotsOffset + (self.published % self.slots)*self.slotSize
+        sequenceField.pack_into(self.map, offset, 2*self.published + 1)
+        self.row.pack_into(self.map, offset + sequenceField.size, t, *[number(fields[index]) for index in self.columns])
+        sequenceField.pack_into(self.map, offset, 2*self.published + 2)
+        self.published += 1
+        publishedField.pack_into(self.map, PUBLISHED_OFFSET, self.published)
+        pass
+
+    def close(self):
+        self.map.close() ## the file stays, so readers can take the last scans
+        pass
+
+class Subscriber(object):
+    """includes an attached bus and the next scan to read from it"""
+
+    def __init__(self, filename, backlog=False):
+        ## backlog: start with the scans the ring still holds, rather than the next one published
+        self.filename = filename
+        self.map = None
+        self.lost = 0 ## scans overwritten before they were read
+        self.attach(backlog)
+        pass
+
+    def attach(self, backlog=False):
+        with open(self.filename, 'rb') as busFile:
+            self.inode = os.fstat(busFile.fileno()).st_ino
+            self.map = mmap.mmap(busFile.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.generation, self.slots, self.slotSize, length = busHead.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            self.close()
+            raise BusError("{} is not a sample bus".format(self.filename))
+        try:
+            layout = json.loads(self.map[LAYOUT_OFFSET:LAYOUT_OFFSET + length].decode("latin-1"))
+        except ValueError:
+            self.close()
+            raise BusError("{} has a damaged layout".format(self.filename))
+        self.headers = [str(header) for header in layout["headers"]]
+        self.units = [str(unit) for unit in layout["units"]]
+        self.row = struct.Struct("<" + "d"*len(self.headers))
+        self.slotsOffset = ((LAYOUT_OFFSET + length + 7) // 8) * 8
+        published = self.published()
+        self.next = max(0, published - self.slots) if backlog else published
+        pass
+
+    def published(self):
+        return publishedField.unpack_from(self.map, PUBLISHED_OFFSET)[0]
+
+    def sample(self, n):
+        """[t, number columns...] of scan n, or None if it has been overwritten"""
+        offset = self.slotsOffset + (n % self.slots)*self.slotSize
+        sequence = sequenceField.unpack_from(self.map, offset)[0]
+        if sequence != 2*n + 2:
+            return None
+        values = self.row.unpack_from(self.map, offset + sequenceField.size)
+        if sequenceField.unpack_from(self.map, offset)[0] != sequence: ## overwritten while copying
+            return None
+        return list(values)
+
+    def read(self):
+        """the scans published since the last read, oldest first"""
+        published = self.published()
+        if published - self.next > self.slots:
+            self.lost += published - self.slots - self.next
+            self.next = published - self.slots
+        samples = list()
+        while self.next < published:
+            sample = self.sample(self.next)
+            if sample is None:
+                self.lost += 1
+            else:
+                samples.append(sample)
+            self.next += 1
+        return samples
+
+    def moved(self):
+        """True if the publisher has started a new bus file since this one was attached"""
+        try:
+            return os.stat(self.filename).st_ino != self.inode
+        except OSError:
+            return False
+
+    def follow(self, poll=POLL_SECONDS):
+        """yields each scan as it's published, attaching to a new bus when the logger restarts"""
+        while True:
+            samples = self.read()
+            for sample in samples:
+                yield sample
+            if len(samples) == 0:
+                if self.moved():
+                    self.close()
+                    self.attach(backlog=True)
+                else:
+                    time.sleep(poll)
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        pass
+
+if __name__ == "__main__":
+    if (len(sys.argv) == 3) and (sys.argv[1] == "--status"):
+        bus = Subscriber(sys.argv[2])
+        published = bus.published()
+        print("{}: {} columns, {} slots, started {}, {} scans published".format(sys.argv[2], len(bus.headers),
+              bus.slots, time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(bus.generation / 1e6)), published))
+        if published > 0:
+            last = bus.sample(published - 1)
+            if last is not None:
+                print("last scan {:.0f} sec ago".format(time.time() - last[0]))
+    elif (len(sys.argv) >= 2) and not sys.argv[1].startswith("-"):
+        bus = Subscriber(sys.argv[1])
+        names = sys.argv[2:] or bus.headers
+        missing = [name for name in names if name not in bus.headers]
+        if missing:
+            print("not on the bus: {}".format(", ".join(missing)))
+            sys.exit(2)
+        print(",".join(names))
+        try:
+            for sample in bus.follow():
+                columns = [bus.headers.index(name) for name in names] ## again, in case a new bus moved them
+                print(",".join(["{:.10g}".format(sample[column]) for column in columns]))
+                sys.stdout.flush()
+        except KeyboardInterrupt:
+            pass
+    else:
+        print("usage: python LoggerBus.py file_Bus.bin [column ...]")
+        print("       python LoggerBus.py --status file_Bus.bin")
+        sys.exit(2)
@@ -0,0 +1,333 @@
+#! /usr/bin/python
+
+## LoggerChunks.py -- Hourly column chunks of the data records, for analysis
+## using BeagleBone Black (BBB) platform
+##
+## With dataChunks = True in LoggerConfig, the records of each UTC hour are also written, when the
+## hour is over (or the logger stops), to a chunk file (<time of first record>_<siteName>_Data.chunk):
+##   MAGIC
+##   each column as its own zlib-compressed typed array, little-endian:
+##     'd' doubles (NaN for NaN), 'i' 32-bit ints (columns that were all whole numbers),
+##     's' strings (newline separated); the time column is 'd' UTC epoch sec
+##   footer: JSON of the column offsets, types and zone maps (count, NaNs, min, max) and the time range
+##   footer length (uint32) | MAGIC
+## A reader takes the footer from the end of the file, skips the chunk if its hour or zone map rules it
+## out, and reads and decompresses only the columns it wants:
+##   footer = readFooter(name); columns = readColumns(name, ["t_whbrn", "p_zone"])
+## or from the shell, for a time range (UTC epoch sec or "YYYY-mm-dd HH:MM:SS"):
+##   python LoggerChunks.py /srv/field-research/data t_whbrn,p_zone ["2015-01-01 00:00:00" ["2015-02-01 00:00:00"]]
+## The values are the records' values at full precision, not as rounded in the CSV.
+## The hour being collected is only in memory, so a reset loses its chunk; the data file still has the
+## records, and (with the logger stopped) the chunks they're missing from are written again with:
+##   python LoggerChunks.py --rebuild /srv/field-research/data/*_Data.csv
+## Only records no chunk file next to the data file holds are written, at the CSV's precision; .bin and
+## .gor data files are read through LoggerConvert.
+
+from __future__ import print_function
+import os, sys, glob, json, zlib, struct, array, math, time, calendar
+from decimal import Decimal
+import LoggerCodec as Codec
+import LoggerConvert as Convert
+
+MAGIC = b"CSLOGK1\n"
+TIME_HEADER = "time"
+TIME_FORMAT = "\"%Y-%m-%d %H:%M:%S\"" ## as LoggerLib.TIME() writes it
+CHUNK_SECONDS = 3600
+ZLIB_LEVEL = 6
+
+footerTail = struct.Struct("<I")
+
+INT32_MIN = -2**31
+INT32_MAX = 2**31 - 1
+
+try:
+    INTEGERS = (int, long)
+except NameError: ## python 3
+    INTEGERS = (int,)
+
+def chunkFilename(savePath, siteName, t):
+    return savePath+time.strftime("%Y-%m-%d_%H_%M_%S_",time.gmtime(t))+siteName+"_Data.chunk"
+
+def chunkValue(field):
+    """the double a number field is stored as (NaN for anything that isn't a number)"""
+    if isinstance(field, Decimal):
+        return float(field) ## NaN stays NaN
+    try:
+        return float(field)
+    except (TypeError, ValueError):
+        return float('NaN')
+
+def packArray(values, typecode):
+    packed = array.array(typecode, values)
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return packed.tobytes() if hasattr(packed, "tobytes") else packed.tostring()
+
+def unpackArray(data, typecode):
+    values = array.array(typecode)
+    if hasattr(values, "frombytes"):
+        values.frombytes(data)
+    else:
+        values.fromstring(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+class ChunkWriter(object):
+    """includes the records of the current hour, column by column, until they are written as a chunk"""
+
+    def __init__(self, savePath, siteName, seconds=CHUNK_SECONDS):
+        self.savePath = savePath
+        self.siteName = siteName
+        self.seconds = seconds
+        self.headers = None
+        self.units = None
+        self.kinds = None
+        self.chunkStart = None ## start (UTC epoch sec) of the hour being collected
+        self.columns = None
+        self.chunks = 0
+        pass
+
+    def writeHeader(self, schema, dataFile=None):
+        self.setLayout(schema.headers, schema.units, schema.kinds)
+        pass
+
+    def setLayout(self, headers, units, kinds):
+        """takes the column layout; a changed layout starts a new chunk"""
+        if headers != self.headers:
+            self.writeChunk()
+            self.headers = list(headers)
+            self.units = list(units)
+            self.kinds = list(kinds)
+            self.clear()
+        pass
+
+    def clear(self):
+        self.columns = [list() if kind == "string" else array.array('d') for kind in self.kinds]
+        self.whole = [True] * len(self.kinds) ## columns of whole numbers so far (stored as 'i')
+        self.times = array.array('d')
+        pass
+
+    def writeRecord(self, schema, fields):
+        """adds one record to the hour; writes the hour's chunk first if the record is in the next one"""
+        try:
+            t = calendar.timegm(time.strptime(fields[self.headers.index(TIME_HEADER)], TIME_FORMAT))
+        except ValueError:
+            t = self.times[-1] if len(self.times) > 0 else time.time()
+        start = int(t) - (int(t) % self.seconds)
+        if (self.chunkStart is not None) and (start != self.chunkStart):
+            self.writeChunk()
+        self.chunkStart = start
+        self.times.append(t)
+        for index, field in enumerate(fields):
+            column = self.columns[index]
+            if self.kinds[index] == "string":
+                column.append(str(field))
+                continue
+            value = chunkValue(field)
+            column.append(value)
+            if self.whole[index] and not (isinstance(field, INTEGERS) and (INT32_MIN <= field <= INT32_MAX)):
+                self.whole[index] = False
+        pass
+
+    def flush(self):
+        """nothing to commit until the hour is over (the data file has the records meanwhile)"""
+        pass
+
+    def tick(self):
+        pass
+
+    def close(self):
+        self.writeChunk()
+        pass
+
+    def writeChunk(self):
+        """writes the records collected so far as a chunk file"""
+        if (self.columns is None) or (len(self.times) == 0):
+            return
+        filename = chunkFilename(self.savePath, self.siteName, self.times[0])
+        footer = {"headers": self.headers, "units": self.units, "rows": len(self.times),
+                  "start": self.times[0], "end": self.times[-1], "columns": list()}
+        parts = [MAGIC]
+        offset = len(MAGIC)
+        for index, column in enumerate(self.columns):
+            zone = {"name": self.headers[index]}
+            if self.headers[index] == TIME_HEADER:
+                zone["type"] = 'd'
+                data = packArray(self.times, 'd')
+                zone.update({"count": len(self.times), "nans": 0, "min": min(self.times), "max": max(self.times)})
+            elif self.kinds[index] == "string":
+                zone["type"] = 's'
+                data = "\n".join(column)
+                if not isinstance(data, bytes): ## python 3
+                    data = data.encode("latin-1")
+                zone.update({"count": len(column), "nans": 0, "min": min(column), "max": max(column)})
+            else:
+                zone["type"] = 'i' if self.whole[index] else 'd'
+                data = packArray([int(value) for value in column] if self.whole[index] else column, zone["type"])
+                numbers = [int(value) if self.whole[index] else value for value in column if not math.isnan(value)]
+                zone.update({"count": len(numbers), "nans": len(column) - len(numbers),
+                             "min": min(numbers) if numbers else None, "max": max(numbers) if numbers else None})
+                if any(math.isinf(value) for value in numbers):
+                    zone.update({"min": None, "max": None}) ## JSON has no infinity; no zone map
+            data = zlib.compress(data, ZLIB_LEVEL)
+            zone.update({"offset": offset, "length": len(data)})
+            footer["columns"].append(zone)
+            parts.append(data)
+            offset += len(data)
+        footerData = json.dumps(footer, sort_keys=True).encode("latin-1")
+        parts.extend([footerData, footerTail.pack(len(footerData)), MAGIC])
+        try:
+            with open(filename+".tmp", 'wb') as chunkFile:
+                chunkFile.write(b"".join(parts))
+                chunkFile.flush()
+                os.fsync(chunkFile.fileno())
+            os.rename(filename+".tmp", filename) ## never a half-written chunk under the real name
+            self.chunks += 1
+        except (IOError, OSError) as err:
+            print("Unable to write CHUNK file {}: {}".format(filename, err))
+        self.clear()
+        pass
+
+def readFooter(filename):
+    """returns the footer dict of a chunk file (raises ValueError if it isn't one)"""
+    with open(filename, 'rb') as chunkFile:
+        chunkFile.seek(-(footerTail.size + len(MAGIC)), os.SEEK_END)
+        tail = chunkFile.read()
+        if tail[footerTail.size:] != MAGIC:
+            raise ValueError("{} is not a complete chunk file".format(filename))
+        length = footerTail.unpack(tail[:footerTail.size])[0]
+        chunkFile.seek(-(footerTail.size + len(MAGIC) + length), os.SEEK_END)
+        return json.loads(chunkFile.read(length).decode("latin-1"))
+
+def readColumns(filename, headers, footer=None):
+    """returns a dict of header: values (an array, or a list of strings) for each of headers in the chunk"""
+    footer = footer or readFooter(filename)
+    columns = dict()
+    with open(filename, 'rb') as chunkFile:
+        for zone in footer["columns"]:
+            if zone["name"] not in headers:
+                continue
+            chunkFile.seek(zone["offset"])
+            data = zlib.decompress(chunkFile.read(zone["length"]))
+            if zone["type"] == 's':
+                columns[zone["name"]] = data.decode("latin-1").split("\n") if data else [""] * footer["rows"]
+            else:
+                columns[zone["name"]] = unpackArray(data, zone["type"])
+    return columns
+
+def zoneMap(footer, header):
+    """the zone map (count, nans, min, max) of a column of the chunk, or None if it has no such column"""
+    for zone in footer["columns"]:
+        if zone["name"] == header:
+            return zone
+    return None
+
+def mayContain(footer, header, low=None, high=None):
+    """whether the chunk may have values of header from low to high, by its zone map--e.g. to skip
+    the hours a burner wasn't lit: mayContain(footer, "t_whbrn", 300)"""
+    zone = zoneMap(footer, header)
+    if (zone is None) or (zone["count"] == 0):
+        return False
+    if zone["min"] is None:
+        return True
+    return ((low is None) or (zone["max"] >= low)) and ((high is None) or (zone["min"] <= high))
+
+def overlaps(footer, start=None, end=None):
+    """whether the chunk has records from start to end (UTC epoch sec, inclusive; None for open ended)"""
+    return ((start is None) or (footer["end"] >= start)) and ((end is None) or (footer["start"] <= end))
+
+def select(filenames, headers, start=None, end=None):
+    """yields [time, value per header] of the records from start to end in the chunk files, skipping
+    chunks outside the range unread but for their footers"""
+    chunks = list()
+    for filename in filenames:
+        try:
+            footer = readFooter(filename)
+        except (IOError, ValueError) as err:
+            print("Skipping {}: {}".format(filename, err), file=sys.stderr)
+            continue
+        if overlaps(footer, start, end):
+            chunks.append([footer["start"], filename, footer])
+    for chunkStart, filename, footer in sorted(chunks):
+        columns = readColumns(filename, [TIME_HEADER] + list(headers), footer)
+        missing = [float('NaN')] * footer["rows"]
+        values = [columns.get(header, missing) for header in headers]
+        for row, t in enumerate(columns[TIME_HEADER]):
+            if ((start is None) or (t >= start)) and ((end is None) or (t <= end)):
+                yield [t] + [column[row] for column in values]
+
+def csvField(text):
+    """a CSV field as the value to chunk: an int, a float (NaN included) or the text"""
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+def dataLines(dataFile):
+    """the lines (without newlines) of a CSV data file, or of a .bin/.gor one converted"""
+    if dataFile.name.endswith(".csv"):
+        return (Codec.toText(line.rstrip(b"\r\n")) for line in dataFile)
+    return Convert.readRows(dataFile)
+
+def rebuild(dataFilename, seconds=CHUNK_SECONDS):
+    """writes chunks of the records of a data file that no chunk file next to it holds (e.g. the hour a
+    reset lost); returns the number of chunks written"""
+    savePath = os.path.join(os.path.dirname(dataFilename), "")
+    name = os.path.basename(dataFilename)
+    siteName = name[len("YYYY-mm-dd_HH_MM_SS_"):name.rindex("_Data")]
+    held = list() ## [start, end] of the chunks already written
+    for filename in glob.glob(savePath+"*_"+siteName+"_Data.chunk"):
+        try:
+            footer = readFooter(filename)
+        except (IOError, ValueError):
+            continue
+        held.append([footer["start"], footer["end"]])
+    writer = ChunkWriter(savePath, siteName, seconds)
+    headers = None
+    with open(dataFilename, 'rb') as dataFile:
+        for line in dataLines(dataFile):
+            fields = line.split(",")
+            if TIME_HEADER in fields: ## a header row: the first, or a changed layout after a restart
+                headers = fields
+                continue
+            if (headers is None) or (len(fields) != len(headers)):
+                continue
+            try:
+                t = calendar.timegm(time.strptime(fields[headers.index(TIME_HEADER)], TIME_FORMAT))
+            except ValueError:
+                continue
+            if any([start <= t <= end for start, end in held]):
+                continue
+            values = [csvField(field) for field in fields]
+            writer.setLayout(headers, [""] * len(headers),
+                             ["string" if isinstance(value, str) else "number" for value in values])
+            writer.writeRecord(None, values)
+    writer.close()
+    return writer.chunks
+
+def parseTime(text):
+    if text.isdigit():
+        return int(text)
+    return calendar.timegm(time.strptime(text, "%Y-%m-%d %H:%M:%S"))
+
+if __name__ == "__main__":
+    if (len(sys.argv) > 2) and (sys.argv[1] == "--rebuild"):
+        for dataFilename in sys.argv[2:]:
+            print("{}: {} chunks written".format(dataFilename, rebuild(dataFilename)))
+        sys.exit(0)
+    if len(sys.argv) < 3:
+        print("usage: python LoggerChunks.py data_directory_or_chunk_file column[,column...] [start [end]]")
+        print("       python LoggerChunks.py --rebuild file_Data.csv ...")
+        sys.exit(2)
+    where = sys.argv[1]
+    filenames = sorted(glob.glob(os.path.join(where, "*_Data.chunk"))) if os.path.isdir(where) else [where]
+    headers = sys.argv[2].split(",")
+    limits = [parseTime(arg) for arg in sys.argv[3:5]]
+    print(",".join([TIME_HEADER] + headers))
+    for row in select(filenames, headers, *limits):
+        print(",".join([time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(row[0]))] + [repr(value) if isinstance(value, float) else str(value) for value in row[1:]]))
@@ -0,0 +1,366 @@
+#! /usr/bin/python
+
+## LoggerCodec.py -- Record formatting and the binary data file format for Combustion Monitoring
+## using BeagleBone Black (BBB) platform
+##
+## Binary data files (dataFormat = "binary" in LoggerConfig) are MAGIC followed by blocks:
+##   kind (1 byte) | payload length (uint32) | payload | CRC32 of kind+length+payload (uint32)
+## all little-endian. Block kinds:
+##   BLOCK_SCHEMA - JSON: the headers, units, formatter and kind of every column (one per file, first)
+##   BLOCK_ROWS   - entry count (uint32), then entries--one block per group commit
+## Each entry is ENTRY_ROW and one fixed-width row, or (for the odd row that can't be packed exactly)
+## ENTRY_TEXT, a text length (uint32) and the row's CSV text.
+## A row is each number column as the whole number of its CSV text's digits (213.4 in tenths is 2134), in
+## the column's storage type, then the time column as UTC epoch sec (uint32), then each other string column
+## null-padded to its width. The storage type is picked once per column from the schema (storageType()):
+## int16 for tenths (temps), hundredths (pressures, fan volts) and whole-number readings (ppm, positions),
+## uint8 for states and modes, int32 for counters (rec_num, seconds); its lowest codes (highest for uint8)
+## stand for the NaN/inf texts. Rows are rebuilt as text, so the converter reproduces the CSV byte for byte.
+## A row with a value that doesn't fit (out of range, text that isn't a plain number, a time that doesn't
+## print back the same) is stored as its CSV text.
+## A row takes about half the bytes of its CSV line. Fixed-width rows can't shrink much further, as most
+## CSV fields are only 3-6 characters to begin with; for several-fold smaller files use dataFormat = "columns".
+
+from __future__ import print_function
+import struct, json, zlib, numbers, time, calendar
+from decimal import Decimal
+
+## record formatting
+## Each column of the data file gets a formatter, picked once from its param's first header:
+## temps to tenths, positions/ppm/xbee volts/seconds to whole numbers, anything else by type.
+## Floats take the fast %-formatting path (same text as str.format for floats); anything else--the
+## Decimal NaN/Infinity values, ints, strings--goes through str.format as it always has.
+
+def formatTenths(field):
+    if field.__class__ is float:
+        return "%.1f" % field
+    return str.format("{:.1f}",field)
+
+def formatWhole(field):
+    if field.__class__ is float:
+        return "%.0f" % field
+    return str.format("{:.0f}",field)
+
+def formatGeneric(field):
+    if field.__class__ is float:
+        return "%.2f" % field
+    elif isinstance(field,int):
+        return str(field)
+    elif isinstance(field, numbers.Number): #it's still a number
+        return str.format("{:.2f}",field)
+    else:
+        return str(field)
+
+recordFormats = [ ## [header prefix, formatter]--first match wins
+        ['t_', formatTenths], ## temps
+        ['pos', formatWhole],
+        ['ppm', formatWhole], ## ppm applies to both CO and CO2
+        ['v', formatWhole], ## v applies to all XBee analog readings
+        ['sec', formatWhole], ## seconds run time should be integers
+    ]
+
+formatters = dict([[formatter.__name__, formatter] for formatter in [formatTenths, formatWhole, formatGeneric]])
+
+def formatRow(formats, fields):
+    return ','.join([formatter(field) for formatter, field in zip(formats, fields)])
+
+#####################################################
+## binary data files
+
+MAGIC = b"CSLOGB3\n"
+BLOCK_SCHEMA = b'S'
+BLOCK_ROWS = b'R'
+ENTRY_ROW = b'R'
+ENTRY_TEXT = b'T'
+
+KIND_NUMBER = "number"
+KIND_STRING = "string"
+
+## what a stored double stands for (column data files, see LoggerColumns)
+TYPE_FLOAT = 0
+TYPE_INT = 1
+TYPE_LONG = 2
+TYPE_BOOL = 3
+TYPE_DECIMAL = 4 ## a Decimal equal to the double (NaN and Infinity included)
+
+EXACT_INT = 2**53 ## ints beyond this don't fit a double exactly
+
+## number column storage in binary rows: struct format and digits after the point of the stored whole number
+STORE_TENTHS = "h1" ## temps, to +-3276.7
+STORE_READING = "h0" ## whole-number readings--positions, ppm, xbee volts--to +-32767
+STORE_WHOLE = "i0" ## rec_num, seconds, and other int columns
+STORE_STATE = "B0" ## states, modes and statuses
+STORE_HUNDREDTHS = "h2" ## other numbers, printed to hundredths (formatGeneric): pressures, fan volts, to +-327.67
+STATE_SUFFIXES = ["_state", "_mode", "_status"]
+INTEGER_UNIT = "integer" ## formatGeneric columns of ints, printed as whole numbers
+SPECIAL_TEXTS = ["NaN", "nan", "inf", "-inf", "Infinity", "-Infinity"] ## stored as reserved codes
+STORE_RANGES = {"h": [-2**15, 2**15 - 1], "i": [-2**31, 2**31 - 1], "B": [0, 2**8 - 1]}
+
+TIME_HEADER = "time"
+TIME_FORMAT = "\"%Y-%m-%d %H:%M:%S\"" ## as LoggerLib.TIME() writes it
+
+blockHead = struct.Struct("<cI")
+blockTail = struct.Struct("<I")
+countField = struct.Struct("<I")
+
+def packNumber(field, formatter):
+    """[type, double] standing for field as formatter prints it, or None if no double does"""
+    if field.__class__ is float:
+        return [TYPE_FLOAT, field]
+    elif field.__class__ is int:
+        if not (-EXACT_INT < field < EXACT_INT):
+            return None
+        return [TYPE_INT, float(field)]
+    elif field.__class__ is bool:
+        return [TYPE_BOOL, float(field)]
+    elif isinstance(field, numbers.Integral) and (-EXACT_INT < field < EXACT_INT): ## python 2 long
+        return [TYPE_LONG, float(field)]
+    elif isinstance(field, Decimal):
+        if field.is_nan():
+            if field.is_signed() or field.is_snan():
+                return None
+            return [TYPE_DECIMAL, float(field)]
+        elif field == Decimal(float(field)):
+            return [TYPE_DECIMAL, float(field)]
+        elif formatter(field) == formatter(float(field)):
+            return [TYPE_FLOAT, float(field)] ## e.g. a pressure range (DIFF) finer than a double; same text
+    return None
+
+def unpackNumber(kind, number):
+    """the Python value a packed [type, double] stands for"""
+    if kind == TYPE_FLOAT:
+        return number
+    elif kind == TYPE_INT:
+        return int(number)
+    elif kind == TYPE_LONG:
+        return long(number) if str is bytes else int(number) ## python 3 has no long
+    elif kind == TYPE_BOOL:
+        return bool(number)
+    return Decimal(number)
+
+class CodecError(Exception):
+    """a binary data file that can't be read: bad magic, bad CRC or truncated block"""
+    pass
+
+def toBytes(text):
+    """the bytes of a CSV text (python 2: the same str)"""
+    return text if isinstance(text, bytes) else text.encode("latin-1")
+
+def toText(data):
+    """a CSV text from its bytes, as the str of this python"""
+    return data if isinstance(data, str) else data.decode("latin-1")
+
+def packBlock(kind, payload):
+    head = blockHead.pack(kind, len(payload))
+    return head + payload + blockTail.pack(zlib.crc32(head + payload) & 0xffffffff)
+
+def storageType(formatName, header, unit):
+    """how a number column is stored in binary rows, from its formatter, header and unit"""
+    if formatName == "formatTenths":
+        return STORE_TENTHS
+    elif formatName == "formatWhole":
+        return STORE_WHOLE if unit == INTEGER_UNIT else STORE_READING
+    elif unit == INTEGER_UNIT:
+        for suffix in STATE_SUFFIXES:
+            if header.endswith(suffix):
+                return STORE_STATE
+        return STORE_WHOLE
+    return STORE_HUNDREDTHS
+
+def printedText(whole, decimals):
+    """the CSV text of a stored whole number: 2134 with 1 decimal is 213.4"""
+    digits = str(abs(whole)).rjust(decimals + 1, '0')
+    if decimals > 0:
+        digits = digits[:-decimals] + '.' + digits[-decimals:]
+    return ('-' if whole < 0 else '') + digits
+
+def printedWhole(text, decimals):
+    """the whole number of a CSV text with decimals digits after the point, or None if it isn't one"""
+    digits = text[1:] if text.startswith('-') else text
+    if decimals > 0:
+        if (len(digits) < decimals + 2) or (digits[-decimals - 1] != '.'):
+            return None
+        digits = digits[:-decimals - 1] + digits[-decimals:]
+    if not digits.isdigit():
+        return None
+    whole = -int(digits) if text.startswith('-') else int(digits)
+    if printedText(whole, decimals) != text: ## "-0.0", leading zeros
+        return None
+    return whole
+
+def timeSeconds(text):
+    """the UTC epoch sec of a time column's text, or None if it doesn't print back the same"""
+    if text.__class__ is not str:
+        return None
+    try:
+        seconds = calendar.timegm((int(text[1:5]), int(text[6:8]), int(text[9:11]),
+                                   int(text[12:14]), int(text[15:17]), int(text[18:20])))
+    except (ValueError, OverflowError):
+        return None
+    if not (0 <= seconds < 2**32) or (timeText(seconds) != text):
+        return None
+    return seconds
+
+def timeText(seconds):
+    return time.strftime(TIME_FORMAT, time.gmtime(seconds))
+
+class RowCodec(object):
+    """includes the fixed-width row layout of a binary data file, from its schema"""
+
+    def __init__(self, schema):
+        ## schema: dict of "headers", "units", "formats" (formatter names), "kinds" and "widths" per column
+        self.schema = schema
+        self.headers = schema["headers"]
+        self.formats = [formatters[name] for name in schema["formats"]]
+        self.kinds = schema["kinds"]
+        self.widths = schema["widths"]
+        self.numbers = list() ## [index, formatter, decimals, lowest, highest, codes of SPECIAL_TEXTS] per number column
+        self.texts = list() ## the SPECIAL_TEXTS of each number column's codes
+        self.times = [index for index, kind in enumerate(self.kinds)
+                      if (kind == KIND_STRING) and (self.headers[index] == TIME_HEADER)]
+        self.strings = [index for index, kind in enumerate(self.kinds)
+                        if (kind == KIND_STRING) and (index not in self.times)]
+        codes = ""
+        for index, kind in enumerate(self.kinds):
+            if kind != KIND_NUMBER:
+                continue
+            storage = storageType(schema["formats"][index], self.headers[index], schema["units"][index])
+            code, decimals = storage[0], int(storage[1:])
+            lowest, highest = STORE_RANGES[code]
+            if code == "B":
+                specials = range(highest, highest - len(SPECIAL_TEXTS), -1)
+                highest -= len(SPECIAL_TEXTS)
+            else:
+                specials = range(lowest, lowest + len(SPECIAL_TEXTS))
+                lowest += len(SPECIAL_TEXTS)
+            self.numbers.append([index, self.formats[index], decimals, lowest, highest,
+                                 dict(zip(SPECIAL_TEXTS, specials))])
+            self.texts.append(dict(zip(specials, SPECIAL_TEXTS)))
+            codes += code
+        self.row = struct.Struct("<" + codes + "I"*len(self.times) + "".join(["{}s".format(self.widths[index]) for index in self.strings]))
+        pass
+
+    def schemaBlock(self):
+        return packBlock(BLOCK_SCHEMA, json.dumps(self.schema, sort_keys=True).encode("latin-1"))
+
+    def headerRow(self):
+        return ','.join([str(field) for field in self.headers])
+
+    def encode(self, fields):
+        """returns the packed row, or None if a field can't be packed exactly"""
+        if len(fields) != len(self.kinds):
+            return None
+        values = list()
+        for index, formatter, decimals, lowest, highest, specials in self.numbers:
+            text = formatter(fields[index])
+            whole = printedWhole(text, decimals)
+            if whole is None:
+                whole = specials.get(text)
+                if whole is None:
+                    return None
+            elif not (lowest <= whole <= highest):
+                return None
+            values.append(whole)
+        for index in self.times:
+            seconds = timeSeconds(fields[index])
+            if seconds is None:
+                return None
+            values.append(seconds)
+        for index in self.strings:
+            field = fields[index]
+            if (field.__class__ is not str) or (len(field) > self.widths[index]) or ('\0' in field):
+                return None
+            values.append(toBytes(field))
+        return self.row.pack(*values)
+
+    def decode(self, row):
+        """returns the CSV text of each field of a packed row"""
+        values = self.row.unpack(row)
+        count = len(self.numbers)
+        fields = [None]*len(self.kinds)
+        for position, column in enumerate(self.numbers):
+            whole = values[position]
+            text = self.texts[position].get(whole)
+            fields[column[0]] = printedText(whole, column[2]) if text is None else text
+        for index in self.times:
+            fields[index] = timeText(values[count])
+            count += 1
+        for position, index in enumerate(self.strings):
+            fields[index] = toText(values[count + position].rstrip(b'\0'))
+        return fields
+
+    def rowsBlock(self, entries):
+        """entries: packed rows, or [CSV text] for rows that couldn't be packed"""
+        parts = [countField.pack(len(entries))]
+        for entry in entries:
+            if isinstance(entry, list):
+                text = toBytes(entry[0])
+                parts.append(ENTRY_TEXT + countField.pack(len(text)) + text)
+            else:
+                parts.append(ENTRY_ROW + entry)
+        return packBlock(BLOCK_ROWS, b"".join(parts))
+
+class Layout(object):
+    """includes a column layout as Schema.describe() gives it (from a schema block or the journal), in
+    the form the data writers take a schema"""
+
+    def __init__(self, layout):
+        self.layout = layout
+        self.headers = [str(header) for header in layout["headers"]]
+        self.units = [str(unit) for unit in layout["units"]]
+        self.formats = [formatters[name] for name in layout["formats"]]
+        self.kinds = layout["kinds"]
+        self.widths = layout["widths"]
+        pass
+
+    def describe(self):
+        return self.layout
+
+    def header(self):
+        return ','.join(self.headers)
+
+def readBlocks(stream):
+    """yields [kind, payload] for each block of a binary data file; raises CodecError on damage"""
+    if stream.read(len(MAGIC)) != MAGIC:
+        raise CodecError("not a binary data file")
+    while True:
+        head = stream.read(blockHead.size)
+        if len(head) == 0:
+            return
+        if len(head) < blockHead.size:
+            raise CodecError("truncated block header")
+        kind, length = blockHead.unpack(head)
+        payload = stream.read(length)
+        tail = stream.read(blockTail.size)
+        if (len(payload) < length) or (len(tail) < blockTail.size):
+            raise CodecError("truncated block")
+        if blockTail.unpack(tail)[0] != (zlib.crc32(head + payload) & 0xffffffff):
+            raise CodecError("CRC mismatch in block at {}".format(stream.tell() - length - blockHead.size - blockTail.size))
+        yield [kind, payload]
+
+def readRows(stream):
+    """yields the CSV lines (without newlines) of a binary data file--header first, as in the CSV file.
+    A file carried on after a restart has a schema block per start; the header is only repeated if it changed."""
+    codec = None
+    for kind, payload in readBlocks(stream):
+        if kind == BLOCK_SCHEMA:
+            header = None if codec is None else codec.headerRow()
+            codec = RowCodec(json.loads(payload.decode("latin-1")))
+            if codec.headerRow() != header:
+                yield codec.headerRow()
+        elif kind == BLOCK_ROWS:
+            if codec is None:
+                raise CodecError("rows before schema")
+            count = countField.unpack_from(payload, 0)[0]
+            offset = countField.size
+            for x in range(count):
+                entry = payload[offset:offset + 1]
+                offset += 1
+                if entry == ENTRY_TEXT:
+                    length = countField.unpack_from(payload, offset)[0]
+                    offset += countField.size
+                    yield toText(payload[offset:offset + length])
+                    offset += length
+                else:
+                    yield ','.join(codec.decode(payload[offset:offset + codec.row.size]))
+                    offset += codec.row.size
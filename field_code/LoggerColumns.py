@@ -0,0 +1,422 @@
+#! /usr/bin/python
+
+## LoggerColumns.py -- Compressed column data files for Combustion Monitoring
+## using BeagleBone Black (BBB) platform
+##
+## Column data files (dataFormat = "columns" in LoggerConfig, _Data.gor) store each column of the
+## records on its own, compressed the way time-series databases (Gorilla) do it:
+##   timestamps - delta-of-delta: a steady record interval costs 1 bit a record
+##   numbers    - as the CSV prints them (temps in tenths, ppm in whole numbers...), so the noise below
+##                that costs nothing, and the CSV converted back is the same as the logger's. Those are
+##                whole numbers (213.4 in tenths is 2134): each is stored as its change from the one
+##                before--1 bit unchanged, 9 bits for a change of up to 63 tenths. Other values (NaN,
+##                and the odd one the CSV text can't be rebuilt from) are XORed with the one before.
+##   strings    - runs of the same text (the site name)
+##
+## The file is MAGIC, a schema block (as in LoggerCodec binary files), then a group per commit:
+##   BLOCK_GROUP block: row count (uint32) | first time | last time (int64 UTC sec) | slice count (uint16)
+##                      | [column index (uint16), length (uint32), CRC32 (uint32)] per slice | timestamps
+##   then the slices: the bits of each column but the time column, one after another
+## A time range of one column is read from the groups in range, reading only their directory blocks
+## and that column's slice--every other slice is skipped unread.
+
+from __future__ import print_function
+import struct, json, zlib, time, calendar
+import LoggerCodec as Codec
+
+MAGIC = b"CSLOGG1\n"
+BLOCK_GROUP = b'G'
+TIME_HEADER = Codec.TIME_HEADER
+TIME_FORMAT = Codec.TIME_FORMAT
+
+groupHead = struct.Struct("<IqqH")
+sliceEntry = struct.Struct("<HII")
+floatBits = struct.Struct("<d")
+wordBits = struct.Struct("<Q")
+
+## signed number buckets: [control bits, control length, value bits]; the last is the catch-all
+TIME_BUCKETS = [[0b10, 2, 7], [0b110, 3, 9], [0b1110, 4, 12], [0b1111, 4, 32]] ## delta-of-delta
+WHOLE_BUCKETS = [[0b10, 2, 7], [0b110, 3, 12], [0b1110, 4, 20], [0b1111, 4, 64]] ## changes and counts
+
+## number types, besides LoggerCodec's
+TYPE_PRINTED = 8 ## a float, stored as the whole number of its CSV text's digits
+PRINTED_DECIMALS = {"formatTenths": 1, "formatWhole": 0, "formatGeneric": 2} ## digits after the point for floats
+
+class BitWriter(object):
+    """includes the bytes written so far and the bits not yet making a byte"""
+
+    def __init__(self):
+        self.out = bytearray()
+        self.acc = 0
+        self.bits = 0
+        pass
+
+    def write(self, value, bits):
+        self.acc = (self.acc << bits) | value
+        self.bits += bits
+        while self.bits >= 8:
+            self.bits -= 8
+            self.out.append((self.acc >> self.bits) & 0xff)
+        self.acc &= (1 << self.bits) - 1
+        pass
+
+    def getBytes(self):
+        if self.bits > 0:
+            return bytes(self.out + bytearray([(self.acc << (8 - self.bits)) & 0xff]))
+        return bytes(self.out)
+
+class BitReader(object):
+    """includes the bytes to read and the bits read but not yet used"""
+
+    def __init__(self, data, offset=0):
+        self.data = bytearray(data)
+        self.next = offset
+        self.acc = 0
+        self.bits = 0
+        pass
+
+    def read(self, bits):
+        while self.bits < bits:
+            if self.next >= len(self.data):
+                raise Codec.CodecError("column block ends early")
+            self.acc = (self.acc << 8) | self.data[self.next]
+            self.next += 1
+            self.bits += 8
+        self.bits -= bits
+        value = self.acc >> self.bits
+        self.acc &= (1 << self.bits) - 1
+        return value
+
+def signed(value, bits):
+    return value - (1 << bits) if value >= (1 << (bits - 1)) else value
+
+def writeSigned(writer, value, buckets):
+    """0 as a single 0 bit, else the first bucket value fits in"""
+    if value == 0:
+        writer.write(0, 1)
+        return
+    for control, controlBits, bits in buckets:
+        if -(1 << (bits - 1)) <= value < (1 << (bits - 1)):
+            writer.write(control, controlBits)
+            writer.write(value & ((1 << bits) - 1), bits)
+            return
+    raise ValueError("{} too large to store".format(value))
+
+def signedBits(value, buckets):
+    """bits writeSigned takes for value"""
+    if value == 0:
+        return 1
+    for control, controlBits, bits in buckets:
+        if -(1 << (bits - 1)) <= value < (1 << (bits - 1)):
+            return controlBits + bits
+    return None
+
+def readSigned(reader, buckets):
+    if reader.read(1) == 0:
+        return 0
+    for control, controlBits, bits in buckets:
+        if (control == buckets[-1][0]) or (reader.read(1) == 0): ## the catch-all ends on a 1
+            return signed(reader.read(bits), bits)
+
+def writeTimes(writer, times):
+    delta = 0
+    for prev, t in zip(times, times[1:]):
+        writeSigned(writer, (t - prev) - delta, TIME_BUCKETS)
+        delta = t - prev
+    pass
+
+def readTimes(reader, first, count):
+    times = [first]
+    delta = 0
+    for x in range(count - 1):
+        delta += readSigned(reader, TIME_BUCKETS)
+        times.append(times[-1] + delta)
+    return times
+
+def writeRuns(writer, values):
+    """runs of equal values: the number of runs, then [length, value (4 bits)] per run"""
+    runs = list()
+    for value in values:
+        if runs and runs[-1][1] == value:
+            runs[-1][0] += 1
+        else:
+            runs.append([1, value])
+    writeSigned(writer, len(runs), WHOLE_BUCKETS)
+    for length, value in runs:
+        writeSigned(writer, length, WHOLE_BUCKETS)
+        writer.write(value, 4)
+    pass
+
+def readRuns(reader):
+    values = list()
+    for x in range(readSigned(reader, WHOLE_BUCKETS)):
+        length = readSigned(reader, WHOLE_BUCKETS)
+        values.extend([reader.read(4)] * length)
+    return values
+
+class XorCoder(object):
+    """includes the last double written/read and its window of meaningful bits (Gorilla XOR coding)"""
+
+    def __init__(self):
+        self.prev = None
+        self.lead = None
+        self.trail = None
+        pass
+
+    def write(self, writer, number):
+        bits = wordBits.unpack(floatBits.pack(number))[0]
+        if self.prev is None:
+            writer.write(bits, 64)
+        else:
+            xor = bits ^ self.prev
+            if xor == 0:
+                writer.write(0, 1)
+            else:
+                lead = min(64 - xor.bit_length(), 31)
+                trail = (xor & -xor).bit_length() - 1
+                if (self.lead is not None) and (lead >= self.lead) and (trail >= self.trail):
+                    writer.write(0b10, 2) ## fits the last window
+                else:
+                    self.lead, self.trail = lead, trail
+                    writer.write(0b11, 2)
+                    writer.write(lead, 5)
+                    writer.write(64 - lead - trail - 1, 6)
+                writer.write(xor >> self.trail, 64 - self.lead - self.trail)
+        self.prev = bits
+        pass
+
+    def read(self, reader):
+        if self.prev is None:
+            bits = reader.read(64)
+        elif reader.read(1) == 0:
+            bits = self.prev
+        else:
+            if reader.read(1) == 1:
+                self.lead = reader.read(5)
+                self.trail = 64 - self.lead - (reader.read(6) + 1)
+            bits = self.prev ^ (reader.read(64 - self.lead - self.trail) << self.trail)
+        self.prev = bits
+        return floatBits.unpack(wordBits.pack(bits))[0]
+
+def writeStrings(writer, strings):
+    """runs of equal text: the number of runs, then [length, text length, text] per run"""
+    runs = list()
+    for text in strings:
+        if runs and runs[-1][1] == text:
+            runs[-1][0] += 1
+        else:
+            runs.append([1, text])
+    writeSigned(writer, len(runs), WHOLE_BUCKETS)
+    for length, text in runs:
+        writeSigned(writer, length, WHOLE_BUCKETS)
+        writeSigned(writer, len(text), WHOLE_BUCKETS)
+        for char in bytearray(Codec.toBytes(text)):
+            writer.write(char, 8)
+    pass
+
+def readStrings(reader):
+    strings = list()
+    for x in range(readSigned(reader, WHOLE_BUCKETS)):
+        length = readSigned(reader, WHOLE_BUCKETS)
+        text = Codec.toText(bytes(bytearray([reader.read(8) for y in range(readSigned(reader, WHOLE_BUCKETS))])))
+        strings.extend([text] * length)
+    return strings
+
+WHOLE_TYPES = (TYPE_PRINTED, Codec.TYPE_INT, Codec.TYPE_LONG, Codec.TYPE_BOOL)
+
+def recordTime(field):
+    """UTC epoch sec of a record's time column"""
+    return calendar.timegm(time.strptime(field, TIME_FORMAT))
+
+class ColumnCodec(object):
+    """includes the column layout of a column data file, from its schema"""
+
+    def __init__(self, schema):
+        self.schema = schema
+        self.headers = schema["headers"]
+        self.formats = [Codec.formatters[name] for name in schema["formats"]]
+        self.kinds = schema["kinds"]
+        self.decimals = [PRINTED_DECIMALS.get(name) for name in schema["formats"]]
+        self.timeColumn = self.headers.index(TIME_HEADER)
+        self.inexact = 0 ## values that had to be stored as the nearest float
+        pass
+
+    def schemaBlock(self):
+        return Codec.packBlock(Codec.BLOCK_SCHEMA, json.dumps(self.schema, sort_keys=True).encode("latin-1"))
+
+    def headerRow(self):
+        return ','.join([str(field) for field in self.headers])
+
+    def pack(self, index, field):
+        """[type, number] to store for a number column: a whole number (TYPE_PRINTED, ints) or a double"""
+        formatter = self.formats[index]
+        packed = Codec.packNumber(field, formatter)
+        if packed is None:
+            self.inexact += 1
+            try:
+                return [Codec.TYPE_FLOAT, float(field)]
+            except (TypeError, ValueError):
+                return [Codec.TYPE_FLOAT, float('NaN')]
+        if (packed[0] == Codec.TYPE_FLOAT) and (self.decimals[index] is not None):
+            text = formatter(packed[1])
+            whole = text.replace('.', '', 1)
+            if whole.lstrip('-').isdigit() and (len(whole) < 16): ## finite, and exact in a double
+                whole = int(whole)
+                if Codec.printedText(whole, self.decimals[index]) == text: ## not "-0.0"
+                    return [TYPE_PRINTED, whole]
+        elif packed[0] in WHOLE_TYPES:
+            packed[1] = int(packed[1])
+        return packed
+
+    def unpack(self, index, kind, number):
+        if kind == TYPE_PRINTED:
+            return float(Codec.printedText(number, self.decimals[index]))
+        return Codec.unpackNumber(kind, number)
+
+    def encodeColumn(self, index, fields):
+        writer = BitWriter()
+        if self.kinds[index] == Codec.KIND_STRING:
+            writeStrings(writer, [str(field) for field in fields])
+            return writer.getBytes()
+        packed = [self.pack(index, field) for field in fields]
+        writeRuns(writer, [kind for kind, number in packed])
+        ## whole numbers as changes (noisy readings) or changes of changes (counters, rec_num)--whichever is smaller
+        wholes = [number for kind, number in packed if kind in WHOLE_TYPES]
+        changes = [[number - last for last, number in zip([0] + wholes, wholes)]]
+        changes.append([change - last for last, change in zip([0] + changes[0], changes[0])])
+        costs = [sum([signedBits(change, WHOLE_BUCKETS) for change in order]) for order in changes]
+        order = 1 if costs[1] < costs[0] else 0
+        writer.write(order, 1)
+        changes = iter(changes[order])
+        xor = XorCoder()
+        for kind, number in packed:
+            if kind in WHOLE_TYPES:
+                writeSigned(writer, next(changes), WHOLE_BUCKETS)
+            else:
+                xor.write(writer, number)
+        return writer.getBytes()
+
+    def decodeColumn(self, index, count, data):
+        reader = BitReader(data)
+        if self.kinds[index] == Codec.KIND_STRING:
+            return readStrings(reader)
+        values = list()
+        kinds = readRuns(reader)
+        order = reader.read(1)
+        xor = XorCoder()
+        whole = change = 0
+        for kind in kinds:
+            if kind in WHOLE_TYPES:
+                if order == 1:
+                    change += readSigned(reader, WHOLE_BUCKETS)
+                else:
+                    change = readSigned(reader, WHOLE_BUCKETS)
+                whole += change
+                values.append(self.unpack(index, kind, whole))
+            else:
+                values.append(self.unpack(index, kind, xor.read(reader)))
+        return values
+
+    def group(self, times, rows):
+        """the bytes of one group commit: the directory block, then a slice per column of rows"""
+        entries = list()
+        slices = list()
+        for index in range(len(self.kinds)):
+            if index == self.timeColumn:
+                continue
+            data = self.encodeColumn(index, [row[index] for row in rows])
+            entries.append(sliceEntry.pack(index, len(data), zlib.crc32(data) & 0xffffffff))
+            slices.append(data)
+        writer = BitWriter()
+        writeTimes(writer, times)
+        directory = (groupHead.pack(len(rows), times[0], times[-1], len(entries)) + b"".join(entries)
+                     + writer.getBytes())
+        return Codec.packBlock(BLOCK_GROUP, directory) + b"".join(slices)
+
+def readBlock(stream):
+    """returns [kind, payload] of the next block (None at the end of the file); raises CodecError on damage"""
+    head = stream.read(Codec.blockHead.size)
+    if len(head) == 0:
+        return None
+    if len(head) < Codec.blockHead.size:
+        raise Codec.CodecError("truncated block header")
+    kind, length = Codec.blockHead.unpack(head)
+    payload = stream.read(length)
+    tail = stream.read(Codec.blockTail.size)
+    if (len(payload) < length) or (len(tail) < Codec.blockTail.size):
+        raise Codec.CodecError("truncated block")
+    if Codec.blockTail.unpack(tail)[0] != (zlib.crc32(head + payload) & 0xffffffff):
+        raise Codec.CodecError("CRC mismatch in block at {}".format(stream.tell() - length - len(head) - len(tail)))
+    return [kind, payload]
+
+def readSchema(stream):
+    """reads MAGIC and the schema block; returns the ColumnCodec of the file"""
+    if stream.read(len(MAGIC)) != MAGIC:
+        raise Codec.CodecError("not a column data file")
+    block = readBlock(stream)
+    if (block is None) or (block[0] != Codec.BLOCK_SCHEMA):
+        raise Codec.CodecError("no schema block")
+    return ColumnCodec(json.loads(block[1].decode("latin-1")))
+
+def readGroups(stream, header=None, start=None, end=None):
+    """yields [codec, times, columns] for each group with records from start to end (UTC epoch sec,
+    inclusive; None for open ended). columns is a dict of index: values, of the header column only
+    if given (other slices are skipped unread), else of every column. Each schema block (one per
+    logger start) yields [codec, None, None] first."""
+    codec = readSchema(stream)
+    yield [codec, None, None]
+    while True:
+        block = readBlock(stream)
+        if block is None:
+            return
+        kind, payload = block
+        if kind == Codec.BLOCK_SCHEMA:
+            codec = ColumnCodec(json.loads(payload.decode("latin-1")))
+            yield [codec, None, None]
+            continue
+        if kind != BLOCK_GROUP:
+            raise Codec.CodecError("unknown block kind {!r}".format(kind))
+        count, first, last, slices = groupHead.unpack_from(payload, 0)
+        entries = [sliceEntry.unpack_from(payload, groupHead.size + n*sliceEntry.size) for n in range(slices)]
+        groupEnd = stream.tell() + sum([length for index, length, crc in entries])
+        if ((start is not None) and (last < start)) or ((end is not None) and (first > end)):
+            stream.seek(groupEnd)
+            continue
+        reader = BitReader(payload, groupHead.size + slices*sliceEntry.size)
+        times = readTimes(reader, first, count)
+        columns = dict()
+        for index, length, crc in entries:
+            if (header is not None) and (codec.headers[index] != header):
+                stream.seek(length, 1)
+                continue
+            data = stream.read(length)
+            if len(data) < length:
+                raise Codec.CodecError("truncated group")
+            if (zlib.crc32(data) & 0xffffffff) != crc:
+                raise Codec.CodecError("CRC mismatch in column {} at {}".format(codec.headers[index], stream.tell() - length))
+            columns[index] = codec.decodeColumn(index, count, data)
+        stream.seek(groupEnd)
+        yield [codec, times, columns]
+
+def readColumn(stream, header, start=None, end=None):
+    """returns [time, value] of every record of one column from start to end (UTC epoch sec, inclusive)"""
+    records = list()
+    for codec, times, columns in readGroups(stream, header, start, end):
+        for values in (columns or dict()).values():
+            for t, value in zip(times, values):
+                if ((start is None) or (t >= start)) and ((end is None) or (t <= end)):
+                    records.append([t, value])
+    return records
+
+def readRows(stream):
+    """yields the CSV lines (without newlines) of a column data file, as LoggerCodec.readRows does"""
+    header = None
+    for codec, times, columns in readGroups(stream):
+        if times is None:
+            if codec.headerRow() != header:
+                header = codec.headerRow()
+                yield header
+            continue
+        columns[codec.timeColumn] = [time.strftime(TIME_FORMAT, time.gmtime(t)) for t in times]
+        for row in zip(*[columns[index] for index in range(len(codec.kinds))]):
+            yield Codec.formatRow(codec.formats, row)
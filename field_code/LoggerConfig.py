@@ -28,5 +28,24 @@ reverseSSHport = 7000  ## Site specific port for contacting remotely
 ## Default Settings - DO NOT CHANGE ##
 savePath = "/srv/field-research/data/" ## location to store data on BBB - Don't Change This
 maxFileSize = 750000000  ## Maximum data filesize before creating a new data file (don't exceed 1GB)
+dataCommitRecords = 60   ## Data records are buffered and committed to the data file in groups: once this many are waiting,
+dataCommitBytes = 65536  ## or this many bytes,
+dataCommitSeconds = 30   ## or the oldest has waited this long (also the most a watchdog reset can lose, without dataJournal), and on state changes
+dataFsync = "commit"     ## "commit": fsync every commit; "forced": only state changes/new files; "never": leave it to the OS
+dataRotate = "hourly"    ## Start a new data file each UTC "hourly" or "daily" as well as at maxFileSize, or "size" for size only
+dataFormat = "csv"       ## "csv" text records, "binary" packed rows (_Data.bin) or "columns" compressed columns (_Data.gor);
+                         ## LoggerConvert.py turns .bin/.gor files back into the CSV
+dataSqlite = False       ## Also store records in an SQLite database (<siteName>_Data.sqlite) for queries on the BBB
+dataChunks = False       ## Also write each UTC hour's records as a column chunk (_Data.chunk, see LoggerChunks) for analysis
+dataIndexEvery = 60      ## CSV data files get a time index (.idx, see LoggerIndex): every this many records and state changes (0: none)
+dataJournal = True       ## Journal records until their commit is synced (_Journal.bin, see LoggerJournal); after a reset
+                         ## the data file is repaired from it and rec_num and the burner/monitor states carry on
+dataJournalSync = 10     ## Journal entries are synced together this long (sec) after the oldest was written: the most a
+                         ## reset can lose with dataJournal (0: sync each record, an SD card write per scan)
+dataRollups = []         ## Also write rollups of the sensor values at these periods (sec) to their own daily files
+                         ## (<date>_<siteName>_Data_1m.csv etc.), e.g. [1, 60, 3600] for raw 1-sec, 1-min and 1-hour records
+sampleBus = False        ## Publish each scan's values to a ring in shared memory (/dev/shm/<siteName>_Bus.bin, see LoggerBus)
+                         ## that other processes (displays, uploaders) can read without slowing the scans
+profileInterval = 3600   ## Write the scan phase timings (p50/p95/p99/max, see LoggerProfile) to the _Info.csv this often (sec; 0: never)
 
 
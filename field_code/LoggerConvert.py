@@ -0,0 +1,77 @@
+#! /usr/bin/python
+
+## LoggerConvert.py -- Converts binary (dataFormat = "binary") and column (dataFormat = "columns")
+## data files to CSV
+## The CSV is the same, byte for byte, as the logger would have written in "csv" mode.
+## From the shell:
+##   python LoggerConvert.py 2015-01-01_00_00_00_MN_08_Data.bin [out.csv]
+## Without out.csv, writes next to the input with the extension changed to .csv.
+## Stops at the first damaged block (bad CRC, or the end of a file cut off by a reset), keeping the rows before it.
+##
+## One column of a column data file, for a time range (UTC, "YYYY-mm-dd HH:MM:SS" or epoch sec), to the console:
+##   python LoggerConvert.py 2015-01-01_00_00_00_MN_08_Data.gor t_zonhi ["2015-01-01 06:00:00" ["2015-01-01 07:00:00"]]
+## Only that column's blocks for the range are read.
+
+from __future__ import print_function
+import sys, time, calendar
+import LoggerCodec as Codec
+import LoggerColumns as Columns
+
+def readRows(inFile):
+    """the CSV lines of a binary or column data file, by its magic"""
+    magic = inFile.read(len(Codec.MAGIC))
+    inFile.seek(0)
+    if magic == Columns.MAGIC:
+        return Columns.readRows(inFile)
+    return Codec.readRows(inFile)
+
+def convert(inName, outName):
+    """returns the number of lines written; raises CodecError (after writing the good lines) on damage"""
+    lines = 0
+    with open(inName, 'rb') as inFile:
+        with open(outName, 'wb') as outFile:
+            for line in readRows(inFile):
+                outFile.write(Codec.toBytes(line+'\n'))
+                lines += 1
+    return lines
+
+def parseTime(text):
+    if text.isdigit():
+        return int(text)
+    return calendar.timegm(time.strptime(text, "%Y-%m-%d %H:%M:%S"))
+
+def printColumn(inName, header, start=None, end=None):
+    with open(inName, 'rb') as inFile:
+        codec = Columns.readSchema(inFile)
+        inFile.seek(0)
+        formatter = codec.formats[codec.headers.index(header)] if header in codec.headers else str
+        print("time,{}".format(header))
+        for t, value in Columns.readColumn(inFile, header, start, end):
+            print("{},{}".format(time.strftime(Columns.TIME_FORMAT, time.gmtime(t)), formatter(value)))
+    pass
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: python LoggerConvert.py file_Data.bin|file_Data.gor [out.csv]")
+        print("       python LoggerConvert.py file_Data.gor column [start [end]]")
+        sys.exit(2)
+    inName = sys.argv[1]
+    if inName.endswith(".gor") and (len(sys.argv) > 2) and not sys.argv[2].endswith(".csv"):
+        try:
+            printColumn(inName, sys.argv[2], *[parseTime(arg) for arg in sys.argv[3:5]])
+        except Codec.CodecError as err:
+            print("{}: {}".format(inName, err))
+            sys.exit(1)
+        sys.exit(0)
+    if len(sys.argv) > 2:
+        outName = sys.argv[2]
+    elif inName.endswith(".bin") or inName.endswith(".gor"):
+        outName = inName[:-len(".bin")]+".csv"
+    else:
+        outName = inName+".csv"
+    try:
+        lines = convert(inName, outName)
+    except Codec.CodecError as err:
+        print("{}: {} (lines before it written to {})".format(inName, err, outName))
+        sys.exit(1)
+    print("{} lines written to {}".format(lines, outName))
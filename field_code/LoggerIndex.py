@@ -0,0 +1,214 @@
+#! /usr/bin/python
+
+## LoggerIndex.py -- Time index sidecars for the CSV data files of Combustion Monitoring
+## using BeagleBone Black (BBB) platform
+##
+## The logger keeps an index next to each CSV data file (<data file>.idx, when dataIndexEvery in
+## LoggerConfig isn't 0): MAGIC, then an entry for every dataIndexEvery'th record and for every
+## record whose sys_state differs from the one before:
+##   UTC epoch sec (int64) | byte offset of the record's line (uint64) | sys_state (int32, -1 if none)
+## Entries are written after their records are committed, so they never point past the data; when a reset
+## loses commits that weren't synced, LoggerStore.recover() cuts the entries of the lost records (cut()).
+## A time window is then found by binary search of the index and a short scan of the (mmap'ed) file:
+##   lines = window("2015-01-01_00_00_00_MN_08_Data.csv", start, end)   ## UTC epoch sec
+## and from the shell (times as UTC epoch sec or "YYYY-mm-dd HH:MM:SS"):
+##   python LoggerIndex.py 2015-01-01_00_00_00_MN_08_Data.csv "2015-01-01 06:00:00" "2015-01-01 06:05:00"
+## Files written before the index (or whose index is lost) get one with:
+##   python LoggerIndex.py --rebuild *_Data.csv
+
+from __future__ import print_function
+import os, sys, mmap, struct, time, calendar
+
+MAGIC = b"CSLOGI1\n"
+TIME_HEADER = "time"
+STATE_HEADER = "sys_state"
+TIME_FORMAT = "\"%Y-%m-%d %H:%M:%S\"" ## as LoggerLib.TIME() writes it
+NO_STATE = -1
+INDEX_EVERY = 60
+
+indexEntry = struct.Struct("<qQi")
+
+def indexFilename(dataFilename):
+    return dataFilename+".idx"
+
+def recordTime(text):
+    """UTC epoch sec of a record's time field"""
+    return calendar.timegm(time.strptime(text, TIME_FORMAT))
+
+def timeText(t):
+    """a record's time field for UTC epoch sec t--these sort as the times do"""
+    return time.strftime(TIME_FORMAT, time.gmtime(t)).encode("ascii")
+
+def stateNumber(field):
+    try:
+        return int(field)
+    except (TypeError, ValueError):
+        return NO_STATE
+
+class Indexer(object):
+    """includes which records of a data file are due an index entry, and the entries not yet written"""
+
+    def __init__(self, headers, every=INDEX_EVERY):
+        self.every = every
+        self.timeColumn = headers.index(TIME_HEADER)
+        self.stateColumn = headers.index(STATE_HEADER) if STATE_HEADER in headers else None
+        self.records = 0
+        self.lastState = None
+        self.pending = list()
+        pass
+
+    def add(self, offset, fields):
+        """notes the record at offset (its fields, or the text of its fields) for the index, if due"""
+        state = NO_STATE if self.stateColumn is None else stateNumber(fields[self.stateColumn])
+        if (self.records % self.every == 0) or (state != self.lastState):
+            try:
+                t = recordTime(fields[self.timeColumn])
+            except ValueError:
+                t = None
+            if t is not None:
+                self.pending.append(indexEntry.pack(t, offset, state))
+        self.records += 1
+        self.lastState = state
+        pass
+
+    def take(self):
+        """the entries not yet written, as bytes"""
+        entries = b"".join(self.pending)
+        self.pending = list()
+        return entries
+
+class Index(object):
+    """includes an index sidecar, mapped into memory"""
+
+    def __init__(self, filename):
+        self.file = open(filename, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        self.map = None
+        self.count = 0
+        if size > len(MAGIC):
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            if self.map[0:len(MAGIC)] != MAGIC:
+                self.close()
+                raise ValueError("{} is not an index".format(filename))
+            self.count = (size - len(MAGIC)) // indexEntry.size ## a cut-off last entry is ignored
+        pass
+
+    def entry(self, n):
+        """[t, offset, state] of entry n"""
+        return list(indexEntry.unpack_from(self.map, len(MAGIC) + n*indexEntry.size))
+
+    def find(self, t):
+        """offset of the last entry before t (0 if none)--a record at t can't be before it"""
+        low, high = 0, self.count
+        while low < high: ## first entry at or after t
+            middle = (low + high) // 2
+            if self.entry(middle)[0] < t:
+                low = middle + 1
+            else:
+                high = middle
+        return self.entry(low - 1)[1] if low > 0 else 0
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.file.close()
+        pass
+
+def window(dataFilename, start, end):
+    """returns the lines (bytes, without newlines) of the records from start to end (UTC epoch sec,
+    inclusive) of a CSV data file, by its index--or from the top, if it has none"""
+    offset = 0
+    try:
+        index = Index(indexFilename(dataFilename))
+        offset = index.find(start)
+        index.close()
+    except (IOError, OSError, ValueError):
+        pass
+    lines = list()
+    with open(dataFilename, 'rb') as dataFile:
+        if os.fstat(dataFile.fileno()).st_size == 0:
+            return lines
+        data = mmap.mmap(dataFile.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            headerEnd = data.find(b"\n")
+            header = data[0:headerEnd].decode("ascii").split(",")
+            timeColumn = header.index(TIME_HEADER)
+            startText, endText = timeText(start), timeText(end)
+            offset = min(max(offset, headerEnd + 1), len(data))
+            if data[offset - 1:offset] != b"\n": ## not a line start: an index of a lost version of the file
+                offset = data.find(b"\n", offset) + 1 or len(data)
+            while offset < len(data):
+                lineEnd = data.find(b"\n", offset)
+                if lineEnd < 0:
+                    lineEnd = len(data)
+                line = data[offset:lineEnd]
+                offset = lineEnd + 1
+                fields = line.split(b",", timeColumn + 1)
+                if len(fields) <= timeColumn:
+                    continue
+                if fields[timeColumn] > endText:
+                    break ## records are in time order
+                if fields[timeColumn] >= startText:
+                    lines.append(line)
+        finally:
+            data.close()
+    return lines
+
+def cut(dataFilename, size):
+    """drops the index entries of records at or past size, for a data file cut back to size (see
+    LoggerStore.recover()); returns how many were dropped"""
+    filename = indexFilename(dataFilename)
+    if not os.path.exists(filename):
+        return 0
+    with open(filename, 'r+b') as indexFile:
+        data = indexFile.read()
+        if data[0:len(MAGIC)] != MAGIC:
+            return 0
+        count = (len(data) - len(MAGIC)) // indexEntry.size
+        keep = count
+        while (keep > 0) and (indexEntry.unpack_from(data, len(MAGIC) + (keep - 1)*indexEntry.size)[1] >= size):
+            keep -= 1
+        indexFile.truncate(len(MAGIC) + keep*indexEntry.size) ## a cut-off last entry goes too
+    return count - keep
+
+def rebuild(dataFilename, every=INDEX_EVERY):
+    """writes the index of a CSV data file from scratch; returns the number of entries"""
+    indexer = None
+    offset = 0
+    entries = 0
+    with open(dataFilename, 'rb') as dataFile:
+        with open(indexFilename(dataFilename)+".tmp", 'wb') as indexFile:
+            indexFile.write(MAGIC)
+            for line in dataFile:
+                fields = line.rstrip(b"\r\n").decode("ascii", "replace").split(",")
+                if indexer is None:
+                    indexer = Indexer(fields, every)
+                elif len(fields) > indexer.timeColumn:
+                    indexer.add(offset, fields)
+                    if len(indexer.pending) >= 1024:
+                        entries += len(indexer.pending)
+                        indexFile.write(indexer.take())
+                offset += len(line)
+            if indexer is not None:
+                entries += len(indexer.pending)
+                indexFile.write(indexer.take())
+    os.rename(indexFilename(dataFilename)+".tmp", indexFilename(dataFilename))
+    return entries
+
+def parseTime(text):
+    if text.isdigit():
+        return int(text)
+    return calendar.timegm(time.strptime(text, "%Y-%m-%d %H:%M:%S"))
+
+if __name__ == "__main__":
+    if (len(sys.argv) > 2) and (sys.argv[1] == "--rebuild"):
+        for dataFilename in sys.argv[2:]:
+            print("{}: {} index entries".format(dataFilename, rebuild(dataFilename)))
+    elif len(sys.argv) == 4:
+        for line in window(sys.argv[1], parseTime(sys.argv[2]), parseTime(sys.argv[3])):
+            print(line.decode("ascii", "replace"))
+    else:
+        print("usage: python LoggerIndex.py file_Data.csv start end")
+        print("       python LoggerIndex.py --rebuild file_Data.csv ...")
+        sys.exit(2)
@@ -0,0 +1,271 @@
+#! /usr/bin/python
+
+## LoggerJournal.py -- Record journal for restart recovery of Combustion Monitoring
+## using BeagleBone Black (BBB) platform
+##
+## The data writer commits records in groups (see LoggerStore), so a watchdog reset can lose the records
+## still waiting, or leave a torn commit at the end of the data file. With dataJournal = True in
+## LoggerConfig, each record is also appended, as it is taken, to a small journal
+## (<siteName>_Journal.bin in savePath). Entries are synced to the card together, at most dataJournalSync
+## sec after the oldest was written--the most a reset can lose--rather than one by one (0 syncs each entry;
+## dataFsync "never" syncs none):
+##   MAGIC, then entries of kind (char) | length (uint32) | JSON | CRC32 (uint32):
+##   'F' the data file written to: name, format, column layout, its size before the entries that follow
+##       and whether a header goes first
+##   'R' a record's fields (Decimals as {"d": text})
+##   'C' a commit that wasn't synced to the card: the data file's size after it
+##   'S' the state machine (monitor state, burner modes and start/stop times) and rec_num
+## After each commit that is synced the journal starts over with an 'F' and an 'S' entry (one write and one
+## sync), so it only holds the records since the last durable commit.
+## On startup LoggerStore.recover() cuts a torn tail off the journal, cuts the data file back to the last
+## commit it holds whole, and writes the journaled records after that again; the main loop then takes
+## rec_num, the burner modes and start/stop times and the monitor state from the journal, rather than
+## starting cold in State6Off.
+##   python LoggerJournal.py /srv/field-research/data/MN_08_Journal.bin     ## lists the entries
+
+from __future__ import print_function
+import os, sys, json, zlib, struct, time
+from decimal import Decimal
+
+MAGIC = b"CSLOGJ1\n"
+ENTRY_FILE = b'F'
+ENTRY_RECORD = b'R'
+ENTRY_COMMIT = b'C'
+ENTRY_STATE = b'S'
+RECNUM_HEADER = "rec_num"
+JOURNAL_BYTES = 256*1024 ## a journal this big forces a synced commit (dataFsync "forced")
+RESTORE_SECONDS = 600 ## the state machine is only taken from a journal written to this recently
+SYNC_SECONDS = 10 ## entries are synced together this long after the oldest was written (0: each entry)
+
+entryHead = struct.Struct("<cI")
+entryTail = struct.Struct("<I")
+
+def journalFilename(savePath, siteName):
+    return savePath+siteName+"_Journal.bin"
+
+def encodeField(field):
+    if isinstance(field, Decimal):
+        return {"d": str(field)}
+    return field
+
+def decodeField(value):
+    if isinstance(value, dict):
+        return Decimal(value["d"])
+    if isinstance(value, type(u"")) and not isinstance(value, str): ## python 2: the record had a str
+        return value.encode("latin-1")
+    return value
+
+def packEntry(kind, content):
+    payload = json.dumps(content, separators=(",", ":")).encode("latin-1")
+    head = entryHead.pack(kind, len(payload))
+    return head + payload + entryTail.pack(zlib.crc32(head + payload) & 0xffffffff)
+
+class Journal(object):
+    """includes the open journal and what it needs to start over: the data file and the state machine"""
+
+    def __init__(self, filename, sync=True, maxBytes=JOURNAL_BYTES, syncSeconds=SYNC_SECONDS):
+        self.filename = filename
+        self.sync = sync
+        self.maxBytes = maxBytes
+        self.syncSeconds = syncSeconds
+        self.unsynced = None ## when the oldest entry not yet synced was written
+        self.fileEntry = None ## 'F' content for the current data file
+        self.recnumColumn = None
+        self.recnum = None ## of the last record journaled
+        self.state = None
+        self.stateWritten = None
+        self.size = 0
+        self.syncs = 0
+        self.errors = 0
+        self.file = open(filename, 'wb') ## LoggerStore.recover() has dealt with any previous one
+        self.write(MAGIC, durable=True)
+        pass
+
+    def write(self, data, durable=False):
+        ## durable: sync now, rather than when the oldest unsynced entry is syncSeconds old
+        try:
+            self.file.write(data)
+            self.file.flush() ## to the OS, so a crash of the logger alone loses nothing
+            self.size += len(data)
+        except (IOError, OSError) as err:
+            self.error(err)
+            return
+        if self.unsynced is None:
+            self.unsynced = time.time()
+        if durable or (time.time() - self.unsynced >= self.syncSeconds):
+            self.syncNow()
+        pass
+
+    def tick(self):
+        """syncs the entries once the oldest has waited syncSeconds--call once a scan"""
+        if (self.unsynced is not None) and (time.time() - self.unsynced >= self.syncSeconds):
+            self.syncNow()
+        pass
+
+    def syncNow(self):
+        if self.sync:
+            try:
+                getattr(os, "fdatasync", os.fsync)(self.file.fileno())
+                self.syncs += 1
+            except (IOError, OSError) as err:
+                self.error(err)
+                return
+        self.unsynced = None
+        pass
+
+    def error(self, err):
+        if self.errors == 0:
+            print("Unable to write JOURNAL {}: {}".format(self.filename, err))
+        self.errors += 1
+        pass
+
+    def startFile(self, dataFilename, dataFormat, layout, size, header=True):
+        """notes the data file the records that follow go to; size is the file's size before them"""
+        self.fileEntry = {"file": dataFilename, "format": dataFormat, "layout": layout}
+        headers = layout["headers"]
+        self.recnumColumn = headers.index(RECNUM_HEADER) if RECNUM_HEADER in headers else None
+        self.write(packEntry(ENTRY_FILE, dict(self.fileEntry, size=size, header=header)))
+        pass
+
+    def record(self, fields):
+        """journals one record's fields, before the data writer buffers them"""
+        if self.recnumColumn is not None:
+            self.recnum = fields[self.recnumColumn]
+        self.write(packEntry(ENTRY_RECORD, [encodeField(field) for field in fields]))
+        pass
+
+    def committed(self, size, durable):
+        """after a commit that left the data file at size: starts over if the commit is on the card"""
+        if not durable:
+            self.write(packEntry(ENTRY_COMMIT, {"size": size}))
+            return
+        try:
+            self.file.seek(0)
+            self.file.truncate()
+            self.size = 0
+        except (IOError, OSError) as err:
+            print("Unable to start JOURNAL {} over: {}".format(self.filename, err))
+            return
+        entries = [MAGIC]
+        if self.fileEntry is not None:
+            entries.append(packEntry(ENTRY_FILE, dict(self.fileEntry, size=size, header=False)))
+        entries.append(self.stateEntry())
+        self.write(b"".join(entries), durable=True) ## the records it replaces are gone, so don't wait
+        pass
+
+    def setState(self, state):
+        """takes the state machine (a dict)--call once a scan; it's journaled when it changes"""
+        self.state = state
+        if state != self.stateWritten:
+            self.writeState()
+        pass
+
+    def writeState(self):
+        self.write(self.stateEntry())
+        pass
+
+    def stateEntry(self):
+        if self.state is None:
+            return b""
+        self.stateWritten = self.state
+        return packEntry(ENTRY_STATE, dict(self.state, rec_num=self.recnum))
+
+    def full(self):
+        return self.size >= self.maxBytes
+
+    def close(self):
+        self.file.close()
+        pass
+
+def readEntries(filename):
+    """returns [[kind, content], ...] of the whole entries of a journal, and the length they take"""
+    entries = list()
+    with open(filename, 'rb') as journalFile:
+        data = journalFile.read()
+    if data[0:len(MAGIC)] != MAGIC:
+        return entries, 0
+    offset = len(MAGIC)
+    while offset + entryHead.size <= len(data):
+        kind, length = entryHead.unpack_from(data, offset)
+        end = offset + entryHead.size + length
+        if end + entryTail.size > len(data):
+            break ## torn
+        if entryTail.unpack_from(data, end)[0] != (zlib.crc32(data[offset:end]) & 0xffffffff):
+            break
+        try:
+            content = json.loads(data[offset + entryHead.size:end].decode("latin-1"))
+        except ValueError:
+            break
+        entries.append([kind, content])
+        offset = end + entryTail.size
+    return entries, offset
+
+def repair(filename):
+    """cuts a torn tail off a journal; returns its whole entries"""
+    entries, length = readEntries(filename)
+    if length < os.path.getsize(filename):
+        print("JOURNAL {}: dropping a torn tail of {} bytes".format(filename, os.path.getsize(filename) - length))
+        with open(filename, 'r+b') as journalFile:
+            journalFile.truncate(length)
+    return entries
+
+def files(entries):
+    """[file entry, commits] per data file in a journal's entries: commits are [size, records] for the
+    file's size at each commit (from the 'F' entry's) and the records journaled after it"""
+    groups = list()
+    for kind, content in entries:
+        if kind == ENTRY_FILE:
+            groups.append([content, [[content["size"], list()]]])
+        elif groups and (kind == ENTRY_COMMIT):
+            groups[-1][1].append([content["size"], list()])
+        elif groups and (kind == ENTRY_RECORD):
+            groups[-1][1][-1][1].append([decodeField(value) for value in content])
+    return groups
+
+def lost(commits, size):
+    """which of commits a data file of size doesn't hold whole: the index of the first, or None"""
+    for index in range(len(commits)):
+        if (index + 1 < len(commits)) and (size >= commits[index + 1][0]):
+            continue ## the next commit starts at or before the end of the file: this one is whole
+        if (size > commits[index][0]) or (len(commits[index][1]) > 0):
+            return index
+        return None
+    return None
+
+def lastState(entries, filename=None):
+    """the last state machine entry (with rec_num from the last record, if later), or None. The state
+    machine is left out if the journal (filename) wasn't written to within RESTORE_SECONDS."""
+    state = None
+    recnum = None
+    recnumColumn = None
+    for kind, content in entries:
+        if kind == ENTRY_STATE:
+            state = dict(content)
+            if content.get("rec_num") is not None:
+                recnum = content["rec_num"]
+        elif kind == ENTRY_FILE:
+            headers = content["layout"]["headers"]
+            recnumColumn = headers.index(RECNUM_HEADER) if RECNUM_HEADER in headers else None
+        elif (kind == ENTRY_RECORD) and (recnumColumn is not None):
+            recnum = content[recnumColumn]
+    if (state is not None) and (filename is not None):
+        if abs(time.time() - os.path.getmtime(filename)) > RESTORE_SECONDS:
+            state = {}
+    if recnum is not None:
+        state = dict(state or {}, rec_num=recnum)
+    return state
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("usage: python LoggerJournal.py file_Journal.bin")
+        sys.exit(2)
+    entries, length = readEntries(sys.argv[1])
+    for kind, content in entries:
+        if kind == ENTRY_RECORD:
+            print("R {} fields".format(len(content)))
+        elif kind == ENTRY_FILE:
+            print("F {} ({}) at {}{}".format(content["file"], content["format"], content["size"],
+                                             " with header" if content["header"] else ""))
+        else:
+            print("{} {}".format(kind.decode("latin-1"), json.dumps(content, sort_keys=True)))
+    print("{} entries in {} bytes of {}".format(len(entries), length, os.path.getsize(sys.argv[1])))
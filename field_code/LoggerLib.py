@@ -36,14 +36,20 @@
 
 
 from __future__ import print_function
-import math, signal, time, gc
+import math, signal, time, gc, threading
 from datetime import datetime
 import numbers
+from array import array
 from decimal import * ## https://docs.python.org/2/library/decimal.html
 from smbus import SMBus
+try:
+    import numpy ## optional--only used by NumpyStatsEngine
+except ImportError:
+    numpy = None
 import Adafruit_BBIO.GPIO as GPIO
 import LoggerConfig as Conf
-from statistics import stdev
+from LoggerCodec import formatTenths, formatWhole, formatGeneric, recordFormats, formatRow
+import LoggerCodec as Codec
 
 
 ######################################################
@@ -53,6 +59,21 @@ from statistics import stdev
 def DEC(number):
     return Decimal(number) #"{:d}".format(number)
 
+def NUM(number):
+    """number as is, unless it is NaN/inf--then the Decimal that has always been reported for it (NaN, Infinity)"""
+    if math.isnan(number) or math.isinf(number):
+        return Decimal(number)
+    return number
+
+def DIFF(hi, lo):
+    """hi - lo as a float when the float difference is exact, else as the Decimal difference"""
+    if hi.__class__ is float and lo.__class__ is float:
+        diff = hi - lo
+        back = diff - hi ## error-free transformation (TwoSum): the rounding error of hi + (-lo)
+        if ((hi - (diff - back)) + (-lo - back)) == 0 and not math.isinf(diff):
+            return diff
+    return DEC(hi) - DEC(lo)
+
 class I2c(object):
     """includes all I2C(SMBus)-attached objects"""
 
@@ -61,6 +82,7 @@ class I2c(object):
     NI2C = 2
 
     smbuses = [SMBus(2), SMBus(1)]
+    locks = [threading.Lock(), threading.Lock()] ## one transaction at a time per bus (workers and samplers share them)
 
     debug = False
 
@@ -68,6 +90,7 @@ class I2c(object):
         self.name = name
         self.i2c = i2cIndex
         self.bus = I2c.smbuses[i2cIndex]
+        self.lock = I2c.locks[i2cIndex]
         self.addr = addr
         pass
 
@@ -78,7 +101,8 @@ class I2c(object):
     def write8(self, reg, datum):
         "Writes an 8-bit datum to the specified register/address"
         try:
-            self.bus.write_byte_data(self.addr, reg, datum)
+            with self.lock:
+                self.bus.write_byte_data(self.addr, reg, datum)
             if self.debug:
                 print("I2c: Wrote 0x{:02x} to address 0x{:02x} register 0x{:02x}".format(datum, self.addr, reg))
         except IOError, err:
@@ -87,7 +111,8 @@ class I2c(object):
     def write16(self, reg, datum):
         "Writes a 16-bit datum to the specified register/address pair"
         try:
-            self.bus.write_word_data(self.addr, reg, datum)
+            with self.lock:
+                self.bus.write_word_data(self.addr, reg, datum)
             if self.debug:
                 print("I2c: Wrote 0x{:02x} to address 0x{:02x} register pair 0x{:02x},0x{:02x}".format(datum, self.addr, reg, reg+1))
         except IOError, err:
@@ -101,14 +126,16 @@ class I2c(object):
                 for index in range(len(data)):
                     print(" 0x{:02x}".format(data[index]), end='')
                 print()
-            self.bus.write_i2c_block_data(self.addr, reg, data)
+            with self.lock:
+                self.bus.write_i2c_block_data(self.addr, reg, data)
         except IOError, err:
             return self.errMsg(err)
 
     def readList(self, reg, length):
         "Read a array of bytes from the I2C device"
         try:
-            data = self.bus.read_i2c_block_data(self.addr, reg, length)
+            with self.lock:
+                data = self.bus.read_i2c_block_data(self.addr, reg, length)
             if self.debug:
                 print("I2c[{}]: Reading data from address 0x{:02x} at register 0x{:02x}: ".format(self.i2c, self.addr, reg), end='')
                 for index in range(len(data)):
@@ -121,7 +148,8 @@ class I2c(object):
     def readU8(self, reg):
         "Read an unsigned byte from the I2C device"
         try:
-            result = self.bus.read_byte_data(self.addr, reg)
+            with self.lock:
+                result = self.bus.read_byte_data(self.addr, reg)
             if self.debug:
                 print("I2C: Device 0x{:02x} returned 0x{:02x} from reg 0x{:02x}".format(self.addr, result & 0xFF, reg))
             return result
@@ -131,7 +159,8 @@ class I2c(object):
     def readS8(self, reg):
         "Reads a signed byte from the I2C device"
         try:
-            result = self.bus.read_byte_data(self.addr, reg)
+            with self.lock:
+                result = self.bus.read_byte_data(self.addr, reg)
             if result > 127: result -= 256
             if self.debug:
                 print("I2C: Device 0x{:02x} returned 0x{:02x} from reg 0x{:02x}".format(self.addr, result & 0xFF, reg))
@@ -142,7 +171,8 @@ class I2c(object):
     def readU16(self, reg, little_endian=True):
         "Reads an unsigned 16-bit datum from the I2C device"
         try:
-            result = self.bus.read_word_data(self.addr, reg)
+            with self.lock:
+                result = self.bus.read_word_data(self.addr, reg)
             # Swap bytes if using big endian because read_word_data assumes little 
             # endian on ARM (little endian) systems.
             if not little_endian:
@@ -283,28 +313,69 @@ class Adc(I2c):
     debug = False
     addrs = [ 0x48, 0x49, 0x4a, 0x4b ]
 
-    def __init__(self, name, i2cIndex, adcIndex, addrIndex):
+    ## How waitReady() knows a conversion is done
+    READY_SLEEP = 0 ## continuous mode; sleep 1/sps plus padding after startAdc()
+    READY_POLL = 1  ## single-shot mode; poll the OS bit of the config register
+    READY_ALERT = 2 ## single-shot mode; watch the ALERT/RDY pin (falls back to READY_POLL if no rdyPin)
+    readyMode = READY_POLL
+    POLL_INTERVAL = 0.0005 ## sec between OS bit/pin checks
+
+    def __init__(self, name, i2cIndex, adcIndex, addrIndex, rdyPin=None):
         I2c.__init__(self, name, i2cIndex, Adc.addrs[addrIndex])
         self.ic = Adc.__IC_ADS1115 ## our chosen hardware
         self.adc = adcIndex
+        self.rdyPin = rdyPin ## GPIO wired to this chip's ALERT/RDY, if any
+        self.rdyArmed = False ## thresholds not yet set up for conversion-ready signalling
+        self.ready = True ## did the last waitReady() see the conversion finish?
+        if rdyPin is not None:
+            GPIO.setup(rdyPin, GPIO.IN)
         #self.addrIndex = addrIndex
         #self.sps ## set later
         #self.pga ## set later
         #self.startTime ## set later
         pass
 
+    def getReadyMode(self):
+        if (self.readyMode == Adc.READY_ALERT) and (self.rdyPin is None):
+            return Adc.READY_POLL
+        return self.readyMode
+
+    def errMsg(self, err): ## override
+        self.invalidateConfig() ## after a bus error we cannot trust what the chip holds
+        return I2c.errMsg(self, err)
+
+    def invalidateConfig(self):
+        """forget the chip's ALERT/RDY setup (e.g. after a bus error or chip reset) so startAdc() re-arms it"""
+        self.rdyArmed = False
+        pass
+
+    def armReadyPin(self):
+        ## Hi_thresh MSB = 1 and Lo_thresh MSB = 0 turns ALERT/RDY into a conversion-ready signal, page 15 datasheet
+        self.writeList(Adc.__ADS1015_REG_POINTER_HITHRESH, [0x80, 0x00])
+        self.writeList(Adc.__ADS1015_REG_POINTER_LOWTHRESH, [0x00, 0x00])
+        self.rdyArmed = True
+        pass
+
     def startAdc(self, channel, pga=PGA, sps=SPS): 
+        readyMode = self.getReadyMode()
         if Adc.debug: 
-            print("adc: {}: starting continuous ADC at sps: {}".format(self.name, sps))
+            print("adc: {}: starting ADC at sps: {} ready mode: {}".format(self.name, sps, readyMode))
 
-        # Disable comparator, Non-latching, Alert/Rdy active low
-        # traditional comparator, continuous mode
-        # The last flag is the only change we need, page 11 datasheet
-        config = Adc.__ADS1015_REG_CONFIG_CQUE_NONE    | \
-                 Adc.__ADS1015_REG_CONFIG_CLAT_NONLAT  | \
+        # Non-latching, Alert/Rdy active low, traditional comparator
+        # READY_SLEEP: comparator disabled, continuous mode (the original setup, page 11 datasheet)
+        # READY_POLL:  comparator disabled, single-shot mode so the OS bit reports completion
+        # READY_ALERT: ALERT/RDY asserted after each conversion, single-shot mode
+        config = Adc.__ADS1015_REG_CONFIG_CLAT_NONLAT  | \
                  Adc.__ADS1015_REG_CONFIG_CPOL_ACTVLOW | \
-                 Adc.__ADS1015_REG_CONFIG_CMODE_TRAD   | \
-                 Adc.__ADS1015_REG_CONFIG_MODE_CONTIN    
+                 Adc.__ADS1015_REG_CONFIG_CMODE_TRAD
+        if (readyMode == Adc.READY_SLEEP):
+            config |= Adc.__ADS1015_REG_CONFIG_CQUE_NONE | Adc.__ADS1015_REG_CONFIG_MODE_CONTIN
+        elif (readyMode == Adc.READY_ALERT):
+            if not self.rdyArmed:
+                self.armReadyPin()
+            config |= Adc.__ADS1015_REG_CONFIG_CQUE_1CONV | Adc.__ADS1015_REG_CONFIG_MODE_SINGLE
+        else:
+            config |= Adc.__ADS1015_REG_CONFIG_CQUE_NONE | Adc.__ADS1015_REG_CONFIG_MODE_SINGLE
 
         # Set sample per seconds, defaults to 250sps
         # If sps is in the dictionary (defined in init()) it returns the value of the constant
@@ -349,6 +420,32 @@ class Adc(I2c):
         self.startTime = time.time()
         pass
 
+    def isReady(self):
+        if (self.getReadyMode() == Adc.READY_ALERT):
+            return GPIO.input(self.rdyPin) == GPIO.LOW ## active low
+        result = self.readList(Adc.__ADS1015_REG_POINTER_CONFIG, 2)
+        return (((result[0] << 8) | result[1]) & Adc.__ADS1015_REG_CONFIG_OS_MASK) == Adc.__ADS1015_REG_CONFIG_OS_NOTBUSY
+
+    def waitReady(self):
+        """waits out the conversion begun by startAdc(); sets and returns self.ready"""
+        adctime = (1.0 / self.sps) + .001 
+        if (self.getReadyMode() == Adc.READY_SLEEP):
+            elapsed = time.time() - self.startTime 
+            if (elapsed < adctime):
+                time.sleep(adctime - elapsed + .002)
+            self.ready = True
+            return self.ready
+        ## nothing to see before ~90% of the nominal conversion time (the internal oscillator is +/-10%)
+        early = self.startTime + (0.9 / self.sps) - time.time()
+        if (early > 0):
+            time.sleep(early)
+        deadline = self.startTime + (2 * adctime)
+        self.ready = self.isReady()
+        while not self.ready and (time.time() < deadline):
+            time.sleep(Adc.POLL_INTERVAL)
+            self.ready = self.isReady()
+        return self.ready
+
     def fetchAdc(self):
         # Read the conversion results from startAdc()
         result = self.readList(Adc.__ADS1015_REG_POINTER_CONVERT, 2)
@@ -407,13 +504,255 @@ adcs = [
 
 NaN = float('NaN')
 
+SAMPLE_CAPACITY = 256 ## values kept per sensor--covers the longest (120-sec) record window at one value per scan
+
+class SampleBuffer(object):
+    """includes a sensor's most recent values, in a ring preallocated to a fixed capacity"""
+    ## Appends overwrite the oldest slot once the ring is full, and clearing just resets the count, so the
+    ## scan loop allocates nothing here. Stats don't depend on what the ring still holds--see RunningStats.
+    __slots__ = ('data', 'capacity', 'count', 'next')
+
+    def __init__(self, capacity=SAMPLE_CAPACITY, typecode='d'):
+        self.data = array(typecode, [0]) * capacity
+        self.capacity = capacity
+        self.count = 0 ## values appended since the last clear (may exceed capacity)
+        self.next = 0 ## slot the next value goes in
+        pass
+
+    def append(self, value):
+        self.data[self.next] = value
+        self.next += 1
+        if self.next == self.capacity:
+            self.next = 0
+        self.count += 1
+        pass
+
+    def clear(self):
+        self.count = 0
+        pass
+
+    def clearExceptLast(self): ## the last value stays in its slot
+        if self.count > 0:
+            self.count = 1
+        pass
+
+    def __len__(self):
+        return self.count if self.count < self.capacity else self.capacity
+
+    def getRecent(self, back=0): ## back=0 is the last value, 1 the one before...
+        if back >= len(self):
+            return NaN
+        return self.data[(self.next - 1 - back) % self.capacity]
+
+    def tolist(self): ## oldest to newest
+        return [self.getRecent(back) for back in range(len(self) - 1, -1, -1)]
+
+    def __repr__(self):
+        return repr(self.tolist())
+
+class MovingWindow(object):
+    """includes a moving average over the last few values of a sensor, kept with a running sum"""
+    ## Each append adds the new value to the sum and subtracts the one it overwrites, so the average is
+    ## constant-time whatever the length. The sum is recomputed exactly (math.fsum) every time the ring
+    ## wraps, so rounding drift stays bounded. NaN/inf values are counted apart, and give the same
+    ## average math.fsum would.
+    __slots__ = ('length', 'data', 'next', 'filled', 'total', 'nans', 'posInfs', 'negInfs')
+
+    def __init__(self, length):
+        self.length = length
+        self.data = array('d', [0]) * length
+        self.next = 0
+        self.filled = 0
+        self.total = 0.0 ## sum of the finite values in the window
+        self.nans = 0
+        self.posInfs = 0
+        self.negInfs = 0
+        pass
+
+    def count(self, x, n): ## add n (+1 or -1) to the count of x's kind, if it is NaN/inf
+        if math.isnan(x):
+            self.nans += n
+        elif x == float('inf'):
+            self.posInfs += n
+        elif x == float('-inf'):
+            self.negInfs += n
+        else:
+            return False
+        return True
+
+    def append(self, value):
+        x = float(value)
+        if self.filled == self.length:
+            old = self.data[self.next]
+            if not self.count(old, -1):
+                self.total -= old
+        else:
+            self.filled += 1
+        self.data[self.next] = x
+        if not self.count(x, 1):
+            self.total += x
+        self.next += 1
+        if self.next == self.length:
+            self.next = 0
+            self.resum()
+        pass
+
+    def resum(self):
+        self.total = math.fsum([x for x in self.data[:self.filled] if not (math.isnan(x) or math.isinf(x))])
+        pass
+
+    def getAvg(self):
+        if self.filled <= 0 or self.nans > 0 or (self.posInfs > 0 and self.negInfs > 0):
+            return NaN
+        elif self.posInfs > 0:
+            return float('inf')
+        elif self.negInfs > 0:
+            return float('-inf')
+        else:
+            return self.total/self.filled
+
+class RunningStats(object):
+    """includes the running count, sum, min, max and variance of a sensor's values, both with and without the last one"""
+    ## Values are folded in as they arrive, so the stats cost the same however many values a record holds.
+    ## The last value is held back, and only folded in when the next one arrives, so that every stat can be
+    ## had exclusive of it (as the 1-sec and multi-sec records want) or inclusive of it, without copying.
+    ## Sums are exact (as math.fsum), min/max pick the same element as the builtins, and the standard
+    ## deviation uses Welford's running M2.
+    __slots__ = ('count', 'last', 'prior', 'partials', 'nonFinite', 'hasNonFinite', 'min', 'max', 'mean', 'm2')
+
+    def __init__(self):
+        self.clear()
+        pass
+
+    def clear(self):
+        self.count = 0 ## count of values, including the last
+        self.last = None
+        self.clearExceptLast()
+        pass
+
+    def clearExceptLast(self):
+        ## stats of the values before the last
+        self.prior = 0
+        self.partials = list() ## non-overlapping partial sums of the finite values (Shewchuk)--a few at most
+        self.nonFinite = 0.0 ## sum of any NaN/inf values
+        self.hasNonFinite = False
+        self.min = None
+        self.max = None
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.count = 0 if self.last is None else 1
+        pass
+
+    def add(self, value):
+        if self.last is not None:
+            self.fold(self.last)
+        self.last = value
+        self.count += 1
+        pass
+
+    def fold(self, value): ## add a value to the stats of the values before the last
+        self.prior += 1
+        if self.prior == 1:
+            self.min = value
+            self.max = value
+        else:
+            if value < self.min: ## same comparisons as min() and max(), so NaN is treated the same
+                self.min = value
+            if value > self.max:
+                self.max = value
+        x = float(value)
+        if math.isnan(x) or math.isinf(x):
+            self.nonFinite += x
+            self.hasNonFinite = True
+        else:
+            partials = self.partials
+            i = 0
+            s = x
+            for y in partials:
+                if abs(s) < abs(y):
+                    s, y = y, s
+                hi = s + y
+                lo = y - (hi - s)
+                if lo:
+                    partials[i] = lo
+                    i += 1
+                s = hi
+            if i == len(partials):
+                partials.append(s)
+            else:
+                partials[i] = s
+                del partials[i+1:]
+        delta = x - self.mean
+        self.mean += delta/self.prior
+        self.m2 += delta*(x - self.mean)
+        pass
+
+    def getSum(self, inclusive):
+        partials = self.partials
+        nonFinite = self.nonFinite
+        hasNonFinite = self.hasNonFinite
+        if inclusive:
+            x = float(self.last)
+            if math.isnan(x) or math.isinf(x):
+                nonFinite += x
+                hasNonFinite = True
+            else:
+                partials = partials + [x]
+        return nonFinite if hasNonFinite else math.fsum(partials)
+
+    def getAvg(self, inclusive):
+        if self.count <= 0:
+            return NaN
+        elif self.count == 1:
+            return float(self.last)
+        else:
+            return self.getSum(inclusive)/(self.prior + 1 if inclusive else self.prior)
+
+    def getMin(self, inclusive):
+        if self.count <= 0:
+            return NaN
+        elif self.count == 1:
+            return self.last
+        elif inclusive and self.last < self.min:
+            return self.last
+        else:
+            return self.min
+
+    def getMax(self, inclusive):
+        if self.count <= 0:
+            return NaN
+        elif self.count == 1:
+            return self.last
+        elif inclusive and self.last > self.max:
+            return self.last
+        else:
+            return self.max
+
+    def getStdDev(self, inclusive): ## sample standard deviation, NaN for fewer than 3 values (including the last)
+        if self.count <= 2:
+            return NaN
+        elif inclusive:
+            x = float(self.last)
+            n = self.prior + 1
+            delta = x - self.mean
+            m2 = self.m2 + delta*(x - (self.mean + delta/n))
+            return math.sqrt(m2/(n - 1)) if m2 >= 0 else NaN
+        else:
+            return math.sqrt(self.m2/(self.prior - 1)) if self.m2 >= 0 else NaN
+
+ROLLUPS = list(getattr(Conf, "dataRollups", [])) ## seconds of each rollup level (see Rollup in LoggerMain)
+
 class Sensor(object):
     """includes all sensor inputs"""
+    __slots__ = ('name', 'values', 'stats', 'rollups', 'currentVal')
+    typecode = 'd' ## array typecode of the values kept
 
     def __init__(self, name):
         self.name = name
         #self.values = collections.deque()
-        self.values = list() ## https://docs.python.org/2/library/stdtypes.html#typesseq-mutable 
+        self.values = SampleBuffer(typecode=self.typecode)
+        self.stats = RunningStats() ## kept up to date by appendValue()
+        self.rollups = [RunningStats() for seconds in ROLLUPS] ## per rollup level--not cleared with the record
         self.currentVal = DEC(-77)
         pass
 
@@ -423,123 +762,68 @@ class Sensor(object):
         pass
         
     def clearValues(self):
-        self.values = list()
+        self.values.clear()
+        self.stats.clear()
         pass
 
     def clearValuesExceptLast(self):
-        if len(self.values) <=0:
-            self.values = list()
-        else:
-            lastPop = self.values.pop()
-            self.values = list() # make empty set
-            self.values.append(lastPop)
-            #print("Sensor {} now has values {}".format(self.name, self.values)) ## Debug
+        self.values.clearExceptLast()
+        #print("Sensor {} now has values {}".format(self.name, self.values)) ## Debug
+        self.stats.clearExceptLast()
         pass
 
     def appendValue(self, value):
         self.values.append(value)
+        self.stats.add(value)
+        for stats in self.rollups:
+            stats.add(value)
         pass
 
     def getLastVal(self):
-        return NaN if len(self.values) <= 0 else self.values[-1]
+        return self.values.getRecent(0)
 
     def getPrevVal(self):
-        return NaN if len(self.values) <= 1 else self.values[-2]
+        return self.values.getRecent(1)
 
     def getValCnt(self):
-        return len(self.values)
+        return self.values.count
 
     def getValCntExceptLast(self):
-        return len(self.values)-1
+        return self.values.count-1
 
+    ## Stats come from the running accumulator, in constant time
+    ## (if there is only one value, the "exclusive" versions use it rather than give NaN)
     def getAvgVal(self):  ## NOTE EXCLUDES LAST VALUE CAPTURED
-        if len(self.values) <= 0:
-            return NaN
-        elif len(self.values) == 1:
-            return math.fsum(self.values)/len(self.values)
-        else:
-            clippedValues = list()
-            for item in self.values:
-                clippedValues.append(item)
-            clippedValues.pop() #drop the last item
-            return math.fsum(clippedValues)/len(clippedValues)
+        return self.stats.getAvg(False)
             
     ## DWC 01.29 Alternative versions of stat functions that include last value captured            
     def getAvgValInclusive(self):  ## NOTE INCLUDES LAST VALUE CAPTURED
-        if len(self.values) <= 0:
-            return NaN
-        else: 
-            return math.fsum(self.values)/len(self.values)
+        return self.stats.getAvg(True)
 
     def getMinVal(self):  ## NOTE EXCLUDES LAST VALUE CAPTURED
-        if len(self.values) <= 0:
-            return NaN 
-        elif len(self.values) == 1:
-            return min(self.values)
-        else: 
-            clippedValues = list()
-            for item in self.values:
-                clippedValues.append(item)
-            clippedValues.pop() #drop the last item
-            return min(clippedValues)
+        return self.stats.getMin(False)
 
     def getMinValInclusive(self):  ## NOTE INCLUDES LAST VALUE CAPTURED
-        if len(self.values) <= 0:
-            return NaN 
-        else:
-            return min(self.values)
+        return self.stats.getMin(True)
 
     def getMaxVal(self):  ## NOTE EXCLUDES LAST VALUE CAPTURED
-        if len(self.values) <= 0:
-            return NaN 
-        elif len(self.values) == 1:
-            return max(self.values)
-        else:
-            clippedValues = list()
-            for item in self.values:
-                clippedValues.append(item)
-            clippedValues.pop() #drop the last item
-            return max(clippedValues)
+        return self.stats.getMax(False)
     
     def getMaxValInclusive(self):  ## NOTE INCLUDES LAST VALUE CAPTURED
-        if len(self.values) <= 0:
-            return NaN 
-        else:
-            return max(self.values)
+        return self.stats.getMax(True)
     
     ## DWC 01.28 implement stdev, carried through to SampledParam
-    ## DWC 01.28 Not working, temporarily replace stdev with min 
     def getStdDev(self):  ## NOTE EXCLUDES LAST VALUE CAPTURED
-        if len(self.values) <= 2:
-            return NaN
-        else:
-            clippedValues = list()
-            for item in self.values:
-                clippedValues.append(item)
-            clippedValues.pop() #drop the last item
-            #ss = 0
-            #mean = 2
-            #for x in (clippedValues):
-            #    ss = ss + x**2.0   ## cast as float?
-            #standard_dev = math.sqrt(ss/len(clippedValues))
-            return stdev(clippedValues)
-        #print("stdev exclusive error")            
+        return self.stats.getStdDev(False)
 
     def getStdDevInclusive(self):  ## NOTE INCLUDES LAST VALUE CAPTURED
-        if len(self.values) <= 2:
-            return NaN
-        else:
-            #ss = 0
-            #for x in (self.values):
-            #    ss = ss + x**2.0   ## cast as float?
-            #standard_dev = stdev(self.values)
-            return stdev(self.values)
-        #print("stdev inclusive error")
+        return self.stats.getStdDev(True)
         
 sensors = []
 
 class Ain(Sensor):
     """includes all (ADC-attached) analog inputs"""
+    __slots__ = ('adcIndex', 'adc', 'mux', '__use', 'pga', 'sps')
 
     def __init__(self, name, adcIndex, mux, use=True, pga=PGA, sps=SPS):
         Sensor.__init__(self, name)
@@ -549,8 +833,17 @@ class Ain(Sensor):
         self.use = use
         self.pga = pga
         self.sps = sps
+        Ain.generation += 1 ## a new ain invalidates any compiled ScanPlan
         pass
 
+    generation = 0 ## bumped whenever an ain is created or its use flag changes
+
+    def getuse(self): return self.__use
+    def setuse(self, value):
+        self.__use = value
+        Ain.generation += 1
+    use = property(getuse, setuse, None, "'use' property; setting it invalidates any compiled ScanPlan")
+
     def startAdc(self, channel, pga=PGA, sps=SPS): 
         self.adc.startAdc(channel, pga=PGA, sps=SPS) 
         self.pga = self.adc.pga ## in case it was changed
@@ -567,6 +860,7 @@ ains = []
 
 class Tc(Ain):
     """includes all (ADC-attached) AD8495-type thermocouple sensor inputs"""
+    __slots__ = ()
 
     def __init__(self, name, adcIndex, mux, use=True, pga=PGA, sps=SPS):
         Ain.__init__(self, name, adcIndex, mux, use, pga, sps)
@@ -586,20 +880,29 @@ class Tc(Ain):
 
 class BurnerTc(Tc):
     """includes all (ADC-attached) AD8495-type thermocouple sensor inputs acquiring burner temperatures"""
-    def __init__(self, name, adcIndex, mux, use=True, pga=PGA, sps=SPS):
+    __slots__ = ('windows',)
+    WINDOWS = (5, 10, 30) ## moving average lengths (values) kept for every burner tc
+
+    def __init__(self, name, adcIndex, mux, use=True, pga=PGA, sps=SPS, windows=WINDOWS):
         Tc.__init__(self, name, adcIndex, mux, use, pga, sps)
-        self.recent = list() ## never cleared--just truncated
+        self.windows = dict() ## never cleared--keyed by length
+        for length in windows:
+            self.addWindow(length)
+        pass
+
+    def addWindow(self, length): ## starts empty, so add windows before values arrive
+        if length not in self.windows:
+            self.windows[length] = MovingWindow(length)
         pass
 
     def appendValue(self, value):
         Tc.appendValue(self, value) ## https://docs.python.org/2/tutorial/classes.html#inheritance
-        self.recent.append(value)
-        while (len(self.recent) > 10):
-            del(self.recent[0])
+        for window in self.windows.values():
+            window.append(value)
         pass
 
-    def getMovAvg(self):
-        return NaN if len(self.recent) <= 0 else math.fsum(self.recent)/len(self.recent)
+    def getMovAvg(self, length=10):
+        return self.windows[length].getAvg()
 
 tcs = [
   BurnerTc("TC01@U11", Adc.U11, Adc.MUX0),
@@ -627,6 +930,8 @@ ains.extend(tcs)
 
 class CO(Ain):
     """includes all (ADC-attached) CO sensor inputs"""
+    __slots__ = ('co_calib_value',)
+
     def __init__(self, name, adcIndex, mux, pga=PGA, sps=SPS, co_calib_value=1700):
         Ain.__init__(self, name, adcIndex, mux, pga=PGA, sps=SPS)
         try:
@@ -663,6 +968,7 @@ class CO2(Ain):
     valve_whvent = 0 ## 5
     valve_fvent = 1 ## 6
     valve_zone = 2 ## 7
+    __slots__ = ('valve',)
 
     def __init__(self, name, adcIndex, mux, valve, pga=PGA, sps=SPS):
         Ain.__init__(self, name, adcIndex, mux, pga=PGA, sps=SPS)
@@ -704,6 +1010,185 @@ niu6 = Ain("J25-8@U10", Adc.U10, Adc.MUX3) ## spare ain
 sensors.extend(ains)
 ## DWC 12.14 need ain.extend and sensors.extend for these: [co2..., niu1, niu2, batt, niu3, niu4, niu5, niu6]
 
+## ADC acquisition
+## Lib.ains is compiled once into a ScanPlan: for each mux, the chips to start and, for each chip, the
+## ScanEntries that take its result. Each mux is done in three passes over its chips: start, wait for the
+## conversion, then fetch once per chip. Conversions come back as [entry, mV] pairs--entry.store() applies
+## them, and is left to the caller.
+
+class ScanEntry(object):
+    """one ain's slot in a ScanPlan: the conversion its mV value goes through and the limits it must be within"""
+
+    def __init__(self, sensor, convert, lo=float('-inf'), hi=float('inf')):
+        self.sensor = sensor
+        self.convert = convert ## called with the mV value (NaN if out of limits)
+        self.lo = lo
+        self.hi = hi
+        pass
+
+    def store(self, value):
+        if not (self.lo <= value <= self.hi):
+            value = NaN
+        self.convert(value)
+        pass
+
+    def describe(self):
+        limits = "" if (self.lo == float('-inf') and self.hi == float('inf')) else " [{}..{}]".format(self.lo, self.hi)
+        return "{} {}{}".format(self.sensor.name, getattr(self.convert, '__name__', self.convert), limits)
+
+class ScanPlan(object):
+    """ains compiled into per-mux batches of [adc, [ScanEntry...]]; recompiled only when the ains or their use flags change"""
+
+    def __init__(self, ains, planEntry):
+        self.ains = ains
+        self.planEntry = planEntry ## function(sensor) returning that sensor's ScanEntry
+        self.key = None
+        self.batches = list() ## [mux][group] = [adc, entries]
+        self.busBatches = list() ## [i2c][mux][group], for the AdcBusWorkers
+        self.refresh()
+        pass
+
+    def signature(self):
+        return (len(self.ains), Ain.generation)
+
+    def invalidate(self):
+        self.key = None
+        pass
+
+    def refresh(self):
+        if (self.key == self.signature()):
+            return False
+        self.compile()
+        return True
+
+    def compile(self):
+        self.key = self.signature()
+        self.batches = list()
+        for mux in range(Adc.NMUX):
+            groups = list()
+            for sensor in self.ains:
+                if sensor.use and sensor.mux == mux:
+                    for group in groups:
+                        if group[0] is sensor.adc:
+                            break
+                    else:
+                        group = [sensor.adc, list()]
+                        groups.append(group)
+                    group[1].append(self.planEntry(sensor))
+            self.batches.append(groups)
+        self.busBatches = [[[group for group in groups if group[0].i2c == i2cIndex] for groups in self.batches]
+                for i2cIndex in range(I2c.NI2C)]
+        pass
+
+    def dump(self):
+        lines = ["ScanPlan: {} ains, {} chip starts per scan".format(
+                sum([len(group[1]) for groups in self.batches for group in groups]),
+                sum([len(groups) for groups in self.batches]))]
+        for mux in range(len(self.batches)):
+            for adc, entries in self.batches[mux]:
+                lines.append("  mux {} {} (I2C{} 0x{:02x}): {}".format(mux, adc.name, adc.i2c+1, adc.addr,
+                        ", ".join([entry.describe() for entry in entries])))
+        return "\n".join(lines)
+
+def scanBatches(batches):
+    results = list()
+    for groups in batches: ## one per mux
+        for adc, entries in groups: ## start
+            mux = entries[0].sensor.mux
+            try:
+                adc.startAdc(mux, pga=PGA, sps=SPS)
+            except Exception as err:
+                print("error starting ADC for sensor {} on Adc at 0x{:02x} mux {}: {}"\
+                        .format(entries[0].sensor.name, adc.addr, mux, err))
+                adc.startTime = time.time() ## really needed?
+        for adc, entries in groups: ## wait for the conversion (Adc.readyMode decides how)
+            ## a conversion that didn't come back leaves the chip in doubt: the next startAdc() re-arms ALERT/RDY
+            try:
+                if not adc.waitReady():
+                    print("conversion not ready for sensor {} on Adc at 0x{:02x} mux {}"\
+                            .format(entries[0].sensor.name, adc.addr, entries[0].sensor.mux))
+                    adc.invalidateConfig()
+            except Exception as err:
+                print("error waiting on ADC for sensor {} on Adc at 0x{:02x} mux {}: {}"\
+                        .format(entries[0].sensor.name, adc.addr, entries[0].sensor.mux, err))
+                adc.ready = False
+                adc.invalidateConfig()
+        for adc, entries in groups: ## fetch
+            if not adc.ready: ## conversion register still holds the previous mux
+                continue
+            try:
+                value = adc.fetchAdc()
+            except Exception as err:
+                print("error fetching ADC for sensor {} on Adc at 0x{:02x} mux {}: {}"\
+                        .format(entries[0].sensor.name, adc.addr, entries[0].sensor.mux, err))
+                continue
+            for entry in entries:
+                results.append([entry, value])
+    return results
+
+class AdcBusWorker(threading.Thread):
+    """scans the ains attached to one I2C bus, so that both buses can convert at the same time"""
+
+    TIMEOUT = 1.0 ## sec; give up on a bus that has not finished by then
+
+    def __init__(self, i2cIndex):
+        threading.Thread.__init__(self, name="AdcBusWorker-I2C{}".format(i2cIndex+1))
+        self.daemon = True
+        self.i2c = i2cIndex
+        self.batches = list()
+        self.results = list()
+        self.go = threading.Event()
+        self.done = threading.Event()
+        self.done.set() ## idle
+        pass
+
+    def run(self):
+        while True:
+            self.go.wait()
+            self.go.clear()
+            try:
+                self.results = scanBatches(self.batches)
+            except Exception as err:
+                print("AdcBusWorker[{}]: scan failed: {}".format(self.i2c, err))
+                self.results = list()
+            self.done.set()
+
+    def startScan(self, plan):
+        if not self.done.is_set(): ## previous scan never came back--leave it be
+            print("AdcBusWorker[{}]: still busy, skipping this scan".format(self.i2c))
+            return False
+        self.batches = plan.busBatches[self.i2c]
+        self.results = list()
+        self.done.clear()
+        self.go.set()
+        return True
+
+    def waitScan(self):
+        if not self.done.wait(AdcBusWorker.TIMEOUT):
+            print("AdcBusWorker[{}]: timed out".format(self.i2c))
+            return list()
+        return self.results
+
+adcBusWorkers = [] ## empty unless startAdcBusWorkers() is called
+
+def startAdcBusWorkers():
+    for i2cIndex in range(I2c.NI2C):
+        worker = AdcBusWorker(i2cIndex)
+        worker.start()
+        adcBusWorkers.append(worker)
+    pass
+
+def fetchAdcs(plan):
+    """scans the plan serially, or one bus per worker if the workers are running; returns [entry, mV] pairs"""
+    plan.refresh()
+    if len(adcBusWorkers) <= 0:
+        return scanBatches(plan.batches)
+    started = [worker for worker in adcBusWorkers if worker.startScan(plan)]
+    results = list()
+    for worker in started:
+        results.extend(worker.waitScan())
+    return results
+
 class Dlvr(I2c, Sensor):
     """includes the (I2C-attached) DLVR pressure sensor input"""
 
@@ -712,6 +1197,12 @@ class Dlvr(I2c, Sensor):
     valve_fvent = 2 ## 3
     valve_zone = 3 ## 4
     valve_current = 9 ## Not used to set valves, p_current just used to capture new pressure before assignment to loc-specific parameter
+
+    ## Status bits (top two bits of the first byte)
+    STATUS_GOOD = 0
+    STATUS_COMMAND = 1 ## command mode--not ready
+    STATUS_STALE = 2 ## already read since the last update
+    STATUS_DIAG = 3 ## diagnostic fault
     
     def __init__(self, name, i2cIndex, valve):
         I2c.__init__(self, name, i2cIndex, addr=0x28)
@@ -729,12 +1220,16 @@ class Dlvr(I2c, Sensor):
     #    p_valve_time.setValue(now()) ## set the ad hoc param value for reporting valve open time--TODO should be elapsed time
 
     def readPressure(self):
+        return self.readStatusPressure()[1]
+
+    def readStatusPressure(self):
+        """returns [status, pressure in Pa]; pressure is NaN unless status is STATUS_GOOD"""
         Response = self.readList(reg=0,length=4)
         Status = (Response[0]>>6) & 0xFF
         #print "Status bits are (in binary): ", format(Status,'02b')
         if Status != 0:
             # print("Pressure Data not Ready!")  
-            return float('NaN')
+            return [Status, float('NaN')]
         else:
             #Extract Pressure Value:
             Pressure = (((Response[0]<<2)>>2)<<8) + Response[1]
@@ -752,7 +1247,7 @@ class Dlvr(I2c, Sensor):
             #print "Temperature output is (in dec): ",Tem
             #Temp_C = (float(Temp)*(float(200)/(2047)))-50
             #print "Temp, converted is: ",Temp_C,"deg. C"
-            return Pressure_Pa
+            return [Status, Pressure_Pa]
         pass
     
     ## No need for new append, can use std Sensor class append        
@@ -782,6 +1277,82 @@ p_sensors = [p_zero, p_whvent, p_fvent, p_zone]  ## Don't include p_current in l
 ##  Note does NOT use ains.extend like: ains.extend([door1, fan1, fan2, co]) 
 sensors.extend(p_sensors) 
 
+class PressureSampler(threading.Thread):
+    """reads a Dlvr continuously, at its update rate, into a timestamped ring buffer"""
+
+    ## The DLVR updates every 6 msec for 31 cycles, then takes 9.5 msec for an internal check;
+    ## reading just over 6 msec apart gets nearly every update and the odd stale status
+    PERIOD = 0.0066 ## sec
+    CAPACITY = 1024 ## readings kept, ~6.7 sec at PERIOD
+
+    def __init__(self, dlvr, period=PERIOD, capacity=CAPACITY):
+        threading.Thread.__init__(self, name="PressureSampler")
+        self.daemon = True
+        self.dlvr = dlvr
+        self.period = period
+        self.capacity = capacity
+        self.times = [0.0] * capacity
+        self.pressures = [NaN] * capacity
+        self.stored = 0 ## good readings ever stored; the next one goes in slot stored % capacity
+        self.lock = threading.Lock()
+        self.goodReads = 0
+        self.staleReads = 0 ## status STALE: no update since the previous read
+        self.notReadyReads = 0 ## status COMMAND or DIAG
+        self.errors = 0 ## I2C exceptions
+        pass
+
+    def run(self):
+        nextRead = time.time()
+        while True:
+            try:
+                status, pressure = self.dlvr.readStatusPressure()
+            except Exception:
+                status, pressure = None, NaN
+            stamp = time.time()
+            with self.lock:
+                if (status == Dlvr.STATUS_GOOD):
+                    slot = self.stored % self.capacity
+                    self.times[slot] = stamp
+                    self.pressures[slot] = pressure
+                    self.stored += 1
+                    self.goodReads += 1
+                elif (status == Dlvr.STATUS_STALE):
+                    self.staleReads += 1
+                elif (status is None):
+                    self.errors += 1
+                else:
+                    self.notReadyReads += 1
+            nextRead += self.period
+            delay = nextRead - time.time()
+            if (delay > 0):
+                time.sleep(delay)
+            else:
+                nextRead = time.time() ## fell behind--don't try to catch up
+
+    def window(self, since):
+        """returns [mean, count, spread (max - min)] of the good readings taken at or after since"""
+        total = 0.0
+        count = 0
+        low = high = NaN
+        with self.lock:
+            index = self.stored - 1
+            oldest = max(0, self.stored - self.capacity)
+            while (index >= oldest):
+                slot = index % self.capacity
+                if (self.times[slot] < since):
+                    break
+                pressure = self.pressures[slot]
+                total += pressure
+                if (count == 0) or (pressure < low):
+                    low = pressure
+                if (count == 0) or (pressure > high):
+                    high = pressure
+                count += 1
+                index -= 1
+        if (count == 0):
+            return [NaN, 0, NaN]
+        return [total/count, count, high - low]
+
 
 class Rtc(I2c):
     """includes the (I2C-attached) RTC clock input/ouput"""
@@ -794,6 +1365,9 @@ rtc = Rtc("RTC@U4", I2c.I2C1)
 
 class Xbee(Sensor):
     """includes all XBEE wireless linked sensor nodes"""
+    __slots__ = ('adcIndex', 'adc', 'address', 'use')
+    typecode = 'l' ## raw xbee adc counts
+
     def __init__(self, name, adcIndex,address,use=True):
         Sensor.__init__(self, name)
         self.name = name
@@ -831,6 +1405,8 @@ P8_17 = 17
 
 class Gpi(Sensor):
     """includes all GPIO-attached sensor inputs"""
+    __slots__ = ('pin',)
+
     def __init__(self, name, pin):
         Sensor.__init__(self, name)
         self.pin = pin
@@ -889,6 +1465,91 @@ co2_fvent_valve = controls[5]
 co2_zone_valve = controls[6]
 co2_valves = [co2_whvent_valve, co2_fvent_valve, co2_zone_valve]
 
+class ValveSequencer(object):
+    """includes a manifold's valve table--the outputs each position turns on--and its sequence: the positions
+    in cycle take turns, each held for dwell sec, and readings count once a position has settled"""
+    ## Outputs are only written when they change (each Gpo write goes through sysfs); the position and the
+    ## sec it has been held are reported to posParam and timeParam by report(), at the top of the scan.
+    OFF = -1 ## position reported while the sequence is stopped
+
+    def __init__(self, name, table, cycle, dwell, settle, posParam, timeParam):
+        ## table: [position, [outputs on]] per position--outputs of other positions are off
+        self.name = name
+        self.table = dict([[position, outputs] for position, outputs in table])
+        self.outputs = list()
+        for position, outputs in table:
+            self.outputs.extend([output for output in outputs if output not in self.outputs])
+        self.cycle = list(cycle)
+        self.dwell = dwell
+        self.settle = settle
+        self.posParam = posParam
+        self.timeParam = timeParam
+        self.position = ValveSequencer.OFF
+        self.startTime = None ## scan second the position was taken
+        self.switchTime = time.time() ## when the sequence last moved on (fractional sec)
+        self.written = dict() ## output: the value last written to it
+        self.writesIssued = 0 ## output writes sent...
+        self.writesSkipped = 0 ## ...and avoided because the output already held that value
+        pass
+
+    def active(self):
+        return self.position != ValveSequencer.OFF
+
+    def elapsed(self, t):
+        """sec the position has been held at scan second t (0 while stopped)"""
+        if not self.active():
+            return 0
+        return t - self.startTime
+
+    def settled(self, t):
+        return self.elapsed(t) >= self.settle
+
+    def report(self, t):
+        """reports the position and its elapsed sec to the params; returns [position, elapsed]"""
+        elapsed = self.elapsed(t)
+        self.posParam.setValue(int(self.position))
+        self.timeParam.setValue(elapsed)
+        return [self.position, elapsed]
+
+    def start(self, position, t):
+        self.position = position
+        self.startTime = t
+        pass
+
+    def stop(self):
+        self.position = ValveSequencer.OFF
+        self.startTime = None
+        pass
+
+    def step(self, t):
+        """moves on to the next position in cycle once the dwell is up (or the clock has gone back)"""
+        if not self.active():
+            return
+        elapsed = t - self.startTime
+        if (elapsed >= self.dwell) or (elapsed < 0):
+            try:
+                index = self.cycle.index(self.position) + 1
+            except ValueError:
+                print("could not execute {} valve indexing routine".format(self.name))
+                return
+            self.position = self.cycle[index % len(self.cycle)]
+            self.startTime = t
+            self.switchTime = time.time()
+        pass
+
+    def apply(self, force=False):
+        """turns the outputs of the position on and the rest off, writing only those that change (all if force)"""
+        on = self.table.get(self.position, [])
+        for output in self.outputs:
+            value = 1 if output in on else 0
+            if force or (self.written.get(output) != value):
+                output.setValue(value)
+                self.written[output] = value
+                self.writesIssued += 1
+            else:
+                self.writesSkipped += 1
+        pass
+
 ############################################
 ## burners
 
@@ -905,12 +1566,16 @@ class Burner(object):
     STATUS_ON = True
     STATUS_OFF = False
 
-    def __init__(self, name, dtOn, dtOff, tcIndex, isPresent):
+    AVG_WINDOW = 10 ## length (values) of the tc moving average that status changes are measured against
+
+    def __init__(self, name, dtOn, dtOff, tcIndex, isPresent, avgWindow=AVG_WINDOW):
         self.name = name
         self.dtOn = dtOn ## deg. F delta
         self.dtOff = dtOff ## deg. F delta
         #self.tcIndex = tcIndex ## not needed--and may be overridden
         self.tc = tcs[tcIndex]
+        self.avgWindow = avgWindow
+        self.tc.addWindow(avgWindow)
         self.isPresent = isPresent
         self.startTime = None
         self.stopTime = None
@@ -932,7 +1597,7 @@ class Burner(object):
         self.prevStatus  = self.status
         last = self.tc.getLastVal()
         if (last != NaN):
-            avg = self.tc.getMovAvg()
+            avg = self.tc.getMovAvg(self.avgWindow)
             if (self.prevStatus == self.STATUS_OFF):       ## Previous status is OFF   
                 if ((last - avg) <  DT_STAY_OFF):     ## Steep temp decline, prevents considering absolute temp
                     self.status = Burner.STATUS_OFF    
@@ -1023,6 +1688,17 @@ class Burner(object):
     def getMode(self):
         return self.mode
 
+    def snapshot(self):
+        """what calcMode() carries from tick to tick, for the journal"""
+        return [self.mode, self.status, self.startTime, self.stopTime]
+
+    def restore(self, snapshot):
+        """takes up a snapshot() from before a restart, so a burner already on isn't taken as just started"""
+        if self.isPresent and (snapshot[0] != Burner.Mode0NotPresent): ## not if it was absent then
+            self.mode, self.status, self.startTime, self.stopTime = snapshot
+            self.prevStatus = self.status
+        pass
+
 waterHeaterIsPresent = (Conf.waterHeaterIsPresent is not None and Conf.waterHeaterIsPresent == True)
 furnaceIsPresent = (Conf.furnaceIsPresent is not None and Conf.furnaceIsPresent == True)
 
@@ -1038,30 +1714,133 @@ def now():
     return time.time()
     
 
+try:
+    monotonic = time.monotonic
+except AttributeError: ## python 2: CLOCK_MONOTONIC from the C library
+    import ctypes
+
+    class timespec(ctypes.Structure):
+        _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+    CLOCK_MONOTONIC = 1 ## <linux/time.h>
+    clockGettime = None
+    for library in ["librt.so.1", "libc.so.6"]:
+        try:
+            clockGettime = ctypes.CDLL(library, use_errno=True).clock_gettime
+            break
+        except (OSError, AttributeError):
+            pass
+
+    def monotonic():
+        """seconds on a clock that never steps (unlike time.time() when NTP sets the clock)"""
+        spec = timespec()
+        if (clockGettime is None) or (clockGettime(CLOCK_MONOTONIC, ctypes.byref(spec)) != 0):
+            return time.time() ## no monotonic clock to be had
+        return spec.tv_sec + spec.tv_nsec * 1e-9
+
 class Timer(object):
-    """time manager"""
+    """time manager: a tick each PERIOD, on absolute deadlines of the monotonic clock"""
+    ## Deadlines are anchored to the top of a UTC second at start() and then just added to, so they don't
+    ## drift with the time each scan takes. Each tick also has its UTC second (Timer.second), one more
+    ## than the last tick's, which the main loop takes as its scantime--so no second is seen twice.
+    ## A scan that runs past the next deadline is an overrun; then, per the policy:
+    ##   POLICY_CATCHUP - the ticks missed are run at once, one after the other, so every second still gets
+    ##                    its scan (up to MAX_CATCHUP of them; past that they're skipped)
+    ##   POLICY_SKIP    - the ticks missed are skipped; the next tick is the next deadline still ahead
+    ## Per-tick lateness (wake-up time past the deadline) and the overrun/skip counters are kept for
+    ## the diagnostics record. If the UTC clock is stepped (NTP) by STEP or more, the schedule is re-anchored.
+    ## MODE_SLEEP waits with time.sleep(); MODE_ALARM with signal.pause(), woken by SIGALRM from an
+    ## ITIMER_REAL set for the deadline (armed only while waiting, so it never interrupts a scan).
+    PERIOD = 1.0
+    MODE_SLEEP = "sleep"
+    MODE_ALARM = "alarm"
+    POLICY_CATCHUP = "catchup"
+    POLICY_SKIP = "skip"
+    MAX_CATCHUP = 5 ## ticks
+    STEP = 2.0 ## sec
+    ALARM_RETRY = 0.01 ## sec between alarms once the first is due, in case it lands just before pause()
+
+    mode = MODE_SLEEP
+    policy = POLICY_CATCHUP
     lastTick = now()
     awake = True
+    deadline = None ## monotonic time of the current tick
+    second = None ## UTC epoch second of the current tick
+    ticks = 0
+    lateness = 0.0 ## of the current tick (sec)
+    maxLateness = 0.0
+    overruns = 0 ## ticks already due when the scan before them ended
+    caughtUp = 0 ## of those, ticks run at once, to catch up
+    skipped = 0 ## ticks skipped
+    steps = 0 ## re-anchorings on UTC clock steps
+    strayAlarms = 0
 
     @staticmethod
     def __signalHandler__(sig, frm):
         if Timer.awake: 
+            Timer.strayAlarms += 1
             print("alarmed while awake")
         pass
 
+    @staticmethod
+    def anchor():
+        """deadline at the top of the next UTC second"""
+        t = now()
+        Timer.second = int(t) + 1
+        Timer.deadline = monotonic() + (Timer.second - t)
+        pass
+
     @staticmethod
     def nap():
-        """sleep till top of second"""
-        time.sleep((10.0**6 - datetime.utcfromtimestamp(now()).microsecond) / 10.0**6)
+        """wait for the current deadline"""
+        delay = Timer.deadline - monotonic()
+        if (Timer.mode == Timer.MODE_ALARM) and (delay > 0):
+            signal.setitimer(signal.ITIMER_REAL, delay, Timer.ALARM_RETRY)
+            while monotonic() < Timer.deadline:
+                signal.pause()
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            delay = Timer.deadline - monotonic()
+        while delay > 0:
+            time.sleep(delay)
+            delay = Timer.deadline - monotonic()
+        Timer.lateness = monotonic() - Timer.deadline
+        if Timer.lateness > Timer.maxLateness:
+            Timer.maxLateness = Timer.lateness
+        Timer.ticks += 1
+        Timer.lastTick = now()
+        pass
+
+    @staticmethod
+    def advance():
+        """moves on to the next tick's deadline, applying the policy if it has passed already"""
+        Timer.deadline += Timer.PERIOD
+        Timer.second += 1
+        behind = monotonic() - Timer.deadline
+        if behind >= 0:
+            Timer.overruns += 1
+            missed = int(behind / Timer.PERIOD) ## ticks after this one whose deadlines are gone too
+            if (Timer.policy == Timer.POLICY_SKIP) or (missed >= Timer.MAX_CATCHUP):
+                Timer.deadline += (missed + 1) * Timer.PERIOD
+                Timer.second += missed + 1
+                Timer.skipped += missed + 1
+            else:
+                Timer.caughtUp += 1
+        if abs(now() + (Timer.deadline - monotonic()) - Timer.second) >= Timer.STEP:
+            Timer.steps += 1
+            Timer.anchor()
+        pass
 
     @staticmethod
-    def start():
-        signal.signal(signal.SIGALRM, Timer.__signalHandler__)
-        #signal.setitimer(signal.ITIMER_REAL, 1, 1)
+    def start(mode=MODE_SLEEP, policy=POLICY_CATCHUP):
+        Timer.mode = mode
+        Timer.policy = policy
+        if mode == Timer.MODE_ALARM:
+            signal.signal(signal.SIGALRM, Timer.__signalHandler__)
+            signal.siginterrupt(signal.SIGALRM, False) ## restart system calls it lands in
         Timer.awake = False
+        Timer.anchor()
         Timer.nap()
         Timer.awake = True
-        Timer.lastTick = now()
         pass
 
     @staticmethod
@@ -1069,9 +1848,8 @@ class Timer(object):
         gc.enable()
         Timer.awake = False
 
-        #time.sleep(1)
+        Timer.advance()
         Timer.nap()
-        Timer.lastTick = now()
 
         Timer.awake = True
         gc.disable()
@@ -1082,6 +1860,13 @@ class Timer(object):
         return Timer.lastTick
         pass
 
+    @staticmethod
+    def remaining():
+        """sec left before the next tick's deadline (0 if it has passed)"""
+        if Timer.deadline is None:
+            return Timer.PERIOD
+        return max(0.0, Timer.deadline + Timer.PERIOD - monotonic())
+
 ############################################
 ## record parameters
 
@@ -1102,6 +1887,7 @@ def TIME(tm):
 
 class Param(object):
     """includes all parameters to be reported"""
+    __slots__ = ('headers', 'units', 'values')
 
     def __init__(self, headers, units=[""], values=[""]):
         self.headers = headers
@@ -1121,6 +1907,9 @@ class Param(object):
     def reportStatData(self): ## len must match headers and units
         return self.values
 
+    def reportRecordStatData(self): ## what the multi-scan record reports
+        return self.reportStatData()
+
     ## DWC 02.02 drop attempts to save status values from top of scan
 #    def reportSavedStatData(self): ## len must match headers and units
 #        return self.savedValue
@@ -1151,6 +1940,7 @@ diagParams = [timestamp,siteid] ## set for diagnostic file's parameters
 
 class SampledParam(Param):
     """includes all sensed/sampled parameters to be reported"""
+    __slots__ = ('loc', 'sensor')
 
     def __init__(self, headers, units, loc, sensor):
         Param.__init__(self, headers, units)
@@ -1161,36 +1951,37 @@ class SampledParam(Param):
         return TIME(self.sampleDuration())
 
     def val(self):
-        return DEC(self.sensor.getLastVal())
+        return NUM(self.sensor.getLastVal())
 
     ## DWC 01.27 TODO ***
     ## DWC 01.27 add alternate alt_setval for use with pressure and CO2, where param values are set conditionally on passing of clearance time
     #def alt_setval(passedvalue)
     #    self.alt
 
+    ## stats come through the selected StatsEngine (see selectStatsEngine()), as floats--NaN/inf as Decimals (see NUM())
     def avgVal(self):
-        return DEC(self.sensor.getAvgVal())
+        return NUM(statsEngine.getAvg(self.sensor, False))
 
     def avgValInclusive(self):
-        return DEC(self.sensor.getAvgValInclusive())
+        return NUM(statsEngine.getAvg(self.sensor, True))
 
     def minVal(self):
-        return DEC(self.sensor.getMinVal())
+        return NUM(statsEngine.getMin(self.sensor, False))
 
     def minValInclusive(self):
-        return DEC(self.sensor.getMinValInclusive())
+        return NUM(statsEngine.getMin(self.sensor, True))
 
     def maxVal(self):
-        return DEC(self.sensor.getMaxVal())
+        return NUM(statsEngine.getMax(self.sensor, False))
 
     def maxValInclusive(self):
-        return DEC(self.sensor.getMaxValInclusive())
+        return NUM(statsEngine.getMax(self.sensor, True))
 
     def stdDev(self):
-        return DEC(self.sensor.getStdDev())
+        return NUM(statsEngine.getStdDev(self.sensor, False))
 
     def stdDevInclusive(self):
-        return DEC(self.sensor.getStdDevInclusive())
+        return NUM(statsEngine.getStdDev(self.sensor, True))
 
     def valCnt(self):
         return self.sensor.getValCnt()
@@ -1206,6 +1997,7 @@ class SampledParam(Param):
 
 class TempParam(SampledParam):
     """includes all TC (sampled) parameters"""
+    __slots__ = ()
     def __init__(self, loc, sensor):
         SampledParam.__init__(self, [loc+"", loc+"_min", loc+"_max"], ["deg. F", "deg. F", "deg. F"], loc, sensor) 
         
@@ -1234,6 +2026,7 @@ params.extend([t_zonehi, t_zonelow, t_outdoor, t_extra])
 
 class AinParam(SampledParam):
     """includes all AIN (sampled) parameters"""
+    __slots__ = ()
     def __init__(self, loc, sensor):
         SampledParam.__init__(self, [loc+"", loc+"_min", loc+"_max"], ["V", "V", "V"], loc, sensor) 
 
@@ -1247,6 +2040,7 @@ params.extend([ppm_co])
 
 class CO2Param(SampledParam):
     """includes all CO2 (sampled) parameters"""
+    __slots__ = ()
     def __init__(self, loc, sensor):
         fix = "ppm_co2_"+loc
         SampledParam.__init__(self, [fix+"", fix+"_min", fix+"_max"], ["ppm", "ppm", "ppm"], loc, sensor) 
@@ -1266,6 +2060,7 @@ params.extend([co2_valve_pos, co2_valve_time, whventco2, fventco2, zoneco2])
 
 class PressureParam(SampledParam):
     """includes all pressure (sampled) parameters"""
+    __slots__ = ()
     global currentPressureValveGlobal
     ## DWC 01.27 reduce to avg, range, and std dev for accumulated values
     def __init__(self, loc, sensor):
@@ -1281,12 +2076,18 @@ class PressureParam(SampledParam):
         if True:       # currentPressureValveGlobal == 1:
             ## Use min max for testing, then go to stddev
             #return [self.avgVal(), self.minVal(), self.maxVal()]
-            return [self.avgVal(), (self.maxVal()-self.minVal()), self.stdDev()]
+            return [self.avgVal(), DIFF(self.maxVal(), self.minVal()), self.stdDev()]
 
     ## DWC 01.29 add new fcn that does not drop last value
     def reportStatDataInclusive(self): ## override using currentPressureValveGlobal to determine when last value is used
             ##  Use min max for testing, then go to stddev
-            return [self.avgValInclusive(), (self.maxValInclusive()-self.minValInclusive()), self.stdDevInclusive()]
+            return [self.avgValInclusive(), DIFF(self.maxValInclusive(), self.minValInclusive()), self.stdDevInclusive()]
+
+    def reportRecordStatData(self): ## override: the last value is only left out while its valve is still the current one
+        if (self.sensor.valve == getCurrentPressureValve()):
+            return self.reportStatData()
+        else:
+            return self.reportStatDataInclusive()
 
 
 p_valve_pos = Param(["loc_p"],["integer"],[DEC(NaN)]) ## ad hoc param for reporting pressure valve position
@@ -1316,6 +2117,7 @@ params.extend([scans_accum, sec_whrun, sec_frun, sec_whcooldown, sec_fcooldown,
 
 
 class XbeeParam(SampledParam):
+    __slots__ = ()
     def __init__(self, loc, sensor):
         fix = loc
         SampledParam.__init__(self, [fix+""], ["V"], loc, sensor) 
@@ -1326,6 +2128,140 @@ class XbeeParam(SampledParam):
     def reportStatData(self): ## override
         return [self.avgVal()]
 
+#####################################################
+## statistics engines
+
+class StatsEngine(object):
+    """includes the statistics behind the multi-scan record--by default, each sensor's own running stats"""
+
+    def prepare(self, sensors): ## called once before a multi-scan record is built
+        pass
+
+    def release(self): ## called once the record is built
+        pass
+
+    def getAvg(self, sensor, inclusive):
+        return sensor.stats.getAvg(inclusive)
+
+    def getMin(self, sensor, inclusive):
+        return sensor.stats.getMin(inclusive)
+
+    def getMax(self, sensor, inclusive):
+        return sensor.stats.getMax(inclusive)
+
+    def getStdDev(self, sensor, inclusive):
+        return sensor.stats.getStdDev(inclusive)
+
+class NumpyStatsEngine(StatsEngine):
+    """includes NumPy statistics, worked out for all sensors at once when a multi-scan record is prepared"""
+    ## prepare() stacks every sensor's buffered values into one NaN-padded 2-D array and works out count,
+    ## min, max and standard deviation for both the inclusive and exclusive rules in one vectorized pass.
+    ## Results follow the same rules as RunningStats, so the record is the same either way: averages are
+    ## still exact sums (math.fsum per row), min/max take NaN only when it is the first value (as min()
+    ## and max() do), and the standard deviation (two-pass, here) agrees to the last few bits.
+    ## Sensors whose ring has wrapped during the record fall back to their running stats.
+
+    def __init__(self):
+        self.results = dict() ## keyed by id(sensor): [[avg, min, max, stdev] exclusive, [...] inclusive]
+        pass
+
+    def prepare(self, sensors):
+        self.results = dict()
+        rows = [sensor for sensor in sensors if 0 < sensor.values.count <= sensor.values.capacity]
+        if len(rows) <= 0:
+            return
+        counts = numpy.array([sensor.values.count for sensor in rows])
+        width = counts.max()
+        data = numpy.empty((len(rows), width))
+        data.fill(NaN)
+        for row, sensor in enumerate(rows):
+            buf = sensor.values
+            slots = numpy.arange(buf.next - buf.count, buf.next) % buf.capacity
+            data[row, :buf.count] = numpy.frombuffer(buf.data, dtype=buf.data.typecode).take(slots)
+        columns = numpy.arange(width)
+        results = list()
+        for inclusive in (False, True):
+            used = counts if inclusive else numpy.where(counts > 1, counts - 1, counts)
+            valid = columns < used[:, None]
+            values = numpy.where(valid, data, NaN)
+            firstIsNan = numpy.isnan(values[:, 0])
+            mins = numpy.where(firstIsNan, NaN, numpy.fmin.reduce(values, axis=1))
+            maxs = numpy.where(firstIsNan, NaN, numpy.fmax.reduce(values, axis=1))
+            with numpy.errstate(invalid='ignore', divide='ignore'):
+                zeroed = numpy.where(valid, data, 0.0)
+                sums = zeroed.sum(axis=1) ## only kept for rows with NaN/inf, where it matches math.fsum
+                for row in numpy.nonzero(numpy.isfinite(zeroed).all(axis=1))[0]:
+                    sums[row] = math.fsum(data[row, :used[row]].tolist())
+                avgs = sums/used
+                deviations = numpy.where(valid, data - avgs[:, None], 0.0)
+                stdevs = numpy.sqrt((deviations*deviations).sum(axis=1)/(used - 1))
+            stdevs = numpy.where(counts <= 2, NaN, stdevs)
+            results.append(list(zip(avgs.tolist(), mins.tolist(), maxs.tolist(), stdevs.tolist())))
+        for row, sensor in enumerate(rows):
+            self.results[id(sensor)] = [results[0][row], results[1][row]]
+            if sensor.values.data.typecode == 'l': ## min/max keep the values' type
+                self.results[id(sensor)] = [[avg, self.asInt(low), self.asInt(high), dev]
+                                            for avg, low, high, dev in self.results[id(sensor)]]
+        pass
+
+    @staticmethod
+    def asInt(value):
+        return value if math.isnan(value) else int(value)
+
+    def release(self):
+        self.results = dict()
+        pass
+
+    def lookup(self, sensor, inclusive, stat):
+        result = self.results.get(id(sensor))
+        return None if result is None else result[1 if inclusive else 0][stat]
+
+    def getAvg(self, sensor, inclusive):
+        value = self.lookup(sensor, inclusive, 0)
+        return StatsEngine.getAvg(self, sensor, inclusive) if value is None else value
+
+    def getMin(self, sensor, inclusive):
+        value = self.lookup(sensor, inclusive, 1)
+        return StatsEngine.getMin(self, sensor, inclusive) if value is None else value
+
+    def getMax(self, sensor, inclusive):
+        value = self.lookup(sensor, inclusive, 2)
+        return StatsEngine.getMax(self, sensor, inclusive) if value is None else value
+
+    def getStdDev(self, sensor, inclusive):
+        value = self.lookup(sensor, inclusive, 3)
+        return StatsEngine.getStdDev(self, sensor, inclusive) if value is None else value
+
+class RollupStatsEngine(StatsEngine):
+    """includes the statistics of one rollup level: all of a sensor's values since the level's period began"""
+
+    def __init__(self, level):
+        self.level = level ## index into ROLLUPS and Sensor.rollups
+        pass
+
+    def getAvg(self, sensor, inclusive):
+        return sensor.rollups[self.level].getAvg(True)
+
+    def getMin(self, sensor, inclusive):
+        return sensor.rollups[self.level].getMin(True)
+
+    def getMax(self, sensor, inclusive):
+        return sensor.rollups[self.level].getMax(True)
+
+    def getStdDev(self, sensor, inclusive):
+        return sensor.rollups[self.level].getStdDev(True)
+
+statsEngine = StatsEngine()
+
+def selectStatsEngine(useNumpy):
+    """sets (and returns) the stats engine used for multi-scan records; NumPy only if it is installed"""
+    global statsEngine
+    if useNumpy and numpy is None:
+        print("numpy not available--using running stats")
+        useNumpy = False
+    statsEngine = NumpyStatsEngine() if useNumpy else StatsEngine()
+    return statsEngine
+
 #####################################################
 
 HeaderRec = 0
@@ -1333,173 +2269,122 @@ UnitsRec = 1
 SingleScanRec = 2
 MultiScanRec = 3
 
-def record(recType):
-    returnString = ""
-    for param in params:
-        fields = None
-        trimmedFields = list() #empty list
-        #print("Param(s): {}".format(param.reportHeaders()))
+## record formatting--the formatters live in LoggerCodec, shared with the binary-to-CSV converter
+## Each column of the data file gets a formatter, picked once from its param's first header.
+
+class Schema(object):
+    """includes the compiled column layout of the data file: headers, units and a formatter per column"""
+
+    def __init__(self, params):
+        self.params = list(params)
+        self.headers = list()
+        self.units = list()
+        self.formats = list() ## formatter per column
+        self.kinds = list() ## Codec.KIND_STRING or KIND_NUMBER per column, from the values at compile time
+        self.widths = list() ## room for the strings of string columns in binary rows
+        self.scanSources = list() ## [param.reportScanData, column count] per param
+        self.statSources = list() ## [param.reportRecordStatData, column count] per param
+        self.counters = list() ## params bumped once per data record
+        self.sensors = list() ## sensors behind the stats, for the stats engine
+        for param in self.params:
+            headers = param.reportHeaders()
+            units = param.reportUnits()
+            if len(units) != len(headers):
+                raise ValueError("param {} has {} units for {} headers".format(headers, len(units), len(headers)))
+            formatter = formatGeneric
+            for prefix, prefixFormatter in recordFormats:
+                if headers[0][0:len(prefix)] == prefix:
+                    formatter = prefixFormatter
+                    break
+            self.headers.extend(headers)
+            self.units.extend(units)
+            self.formats.extend([formatter] * len(headers))
+            for field in param.reportScanData()[0:len(headers)]:
+                if isinstance(field, str):
+                    self.kinds.append(Codec.KIND_STRING)
+                    self.widths.append(max(8, ((len(field) + 7) // 8) * 8)) ## with some room to spare
+                else:
+                    self.kinds.append(Codec.KIND_NUMBER)
+                    self.widths.append(0)
+            self.scanSources.append([param.reportScanData, len(headers)])
+            self.statSources.append([param.reportRecordStatData, len(headers)])
+            if headers == ['rec_num']:
+                self.counters.append(param)
+            if isinstance(param, SampledParam):
+                self.sensors.append(param.sensor)
+        pass
+
+    def describe(self): ## for the schema block of binary data files
+        return {"headers": self.headers, "units": self.units, "kinds": self.kinds, "widths": self.widths,
+                "formats": [formatter.__name__ for formatter in self.formats]}
+
+    def header(self):
+        return ','.join([str(field) for field in self.headers])
+
+    def unitsRow(self):
+        return ','.join([str(field) for field in self.units])
+
+    def values(self, recType):
+        """the fields of a data record, unformatted"""
+        ## Increment record number integer
+        for counter in self.counters:
+            counter.setValue(counter.reportScanData()[0]+1)
+        if (recType == MultiScanRec):
+            sources = self.statSources
+            statsEngine.prepare(self.sensors)
+        else:
+            sources = self.scanSources
+        fields = list()
+        for report, count in sources:
+            fields.extend(report()[0:count])
+        if (recType == MultiScanRec):
+            statsEngine.release()
+        return fields
+
+    def scanValues(self):
+        """the fields of a single-scan record as they stand now--rec_num isn't bumped (see LoggerBus)"""
+        fields = list()
+        for report, count in self.scanSources:
+            fields.extend(report()[0:count])
+        return fields
+
+    def rollupValues(self, engine, t):
+        """the fields of a rollup record for the period starting at t: each param's stats, from engine (a
+        RollupStatsEngine), and its latest value otherwise--rec_num isn't bumped"""
+        global statsEngine
+        recordEngine = statsEngine
+        statsEngine = engine
+        try:
+            fields = list()
+            for report, count in self.statSources:
+                fields.extend(report()[0:count])
+        finally:
+            statsEngine = recordEngine
+        fields[self.headers.index("time")] = TIME(t)
+        return fields
+
+    def data(self, recType):
+        return formatRow(self.formats, self.values(recType)) #rely on filewrite to add own \n
+
+    def record(self, recType):
         if (recType == HeaderRec):
-            fields = param.reportHeaders()
-            #print("HEADERS: {}".format(fields))
+            return self.header()
         elif (recType == UnitsRec):
-            fields = param.reportUnits()
-        elif (recType == SingleScanRec):
-            fields = param.reportScanData()
-            #print("Fields before:{}".format(fields))
-            ## Increment record number integer
-            if param.reportHeaders() == ['rec_num']:
-                #print("prev_recnum is:{}".format(fields[0]))
-                param.setValue(fields[0]+1)
-                #print("new recnum value:{}".format(param.reportScanData()))
-            for field in fields: ## convert precisions
-                #print("Param.reportHeaders()[0]: {}".format(param.reportHeaders()[0][0:2])) #DEBUG
-                if param.reportHeaders()[0][0:2] == 't_':  #if temps
-                    trimmedFields.append(str.format("{:.1f}",field))
-                    #print("type Temp. Value: {}".format(trimmedFields[-1]))
-                elif  param.reportHeaders()[0][0:3] == 'pos': 
-                    trimmedFields.append(str.format("{:.0f}",field))
-                elif  param.reportHeaders()[0][0:3] == 'ppm': 
-                    trimmedFields.append(str.format("{:.0f}",field))
-                #elif  param.reportHeaders()[0][0:7] == 'p_': 
-                #    trimmedFields.append(str.format("{:.1f}",field))
-                ## v applies to all XBee analog readings    
-                elif  param.reportHeaders()[0][0:1] == 'v': 
-                    trimmedFields.append(str.format("{:.0f}",field))
-                elif  param.reportHeaders()[0][0:3] == 'sec':           ## seconds run time should be integers
-                    trimmedFields.append(str.format("{:.0f}",field))
-                
-                elif isinstance(field,int): 
-                    trimmedFields.append(field)
-                elif isinstance(field, numbers.Number): #it's still a number
-                    trimmedFields.append(str.format("{:.2f}",field))
-                else:
-                    trimmedFields.append(field)
-            fields = list(trimmedFields) # replace with trimmed values
-            #print("SINGLE-SCAN FIELDS: {} " .format(fields))
-        elif (recType == MultiScanRec):
-            ## 0131A DWC need temp variable to get headers for further evaluation?  Should be able to use param
-            fields = param.reportStatData()
-            ## Capture time stamp from start of record
-            #  0131A Can't ref fields here - added fields back above
-            if param.reportHeaders() == ['rec_num']:
-                #print("prev_recnum is:{}".format(fields[0]))
-                param.setValue(fields[0]+1)
-                #recnum.setValue(tempfield[0]+1)
-                #print("new recnum value:{}".format(param.reportScanData()))
-            
-            ## does getCurrentPressureValve() work?
-            if param.reportHeaders()[0][0:2] == "p_": 
-                if  (param.sensor.valve == getCurrentPressureValve()):
-                    fields = param.reportStatData()
-                else: 
-                    fields = param.reportStatDataInclusive()
-            ## DWC 02.02 it appears this elif is called in all cases - not sure why
-            elif (param.reportHeaders()[0][0:8] == "J25-1@U9"):
-                fields = param.reportStatDataInclusive()
-
-            ## DW 02.02 drop attempt to capture saved values from before state setting, etc            
-            #elif (param.reportHeaders()[0][0:4] == "time"):    ## reportSavedStatData()
-            #    fields = param.reportSavedStatData()
-            #elif (param.reportHeaders()[0][0:9] == "wh_status"):
-            #    fields = param.reportSavedStatData()
-            #elif (param.reportHeaders()[0][0:7] == "wh_mode"):
-            #    fields = param.reportSavedStatData()
-            #elif (param.reportHeaders()[0][0:8] == "f_status"):
-            #    fields = param.reportSavedStatData()
-            #elif (param.reportHeaders()[0][0:6] == "f_mode"):
-            #    fields = param.reportSavedStatData()
-            #elif (param.reportHeaders()[0][0:9] == "sys_state"):
-            #    fields = param.reportSavedStatData()
-            #elif (param.reportHeaders()[0][0:2] == "WXYZ"):
-            #    fields = param.reportSavedStatData()
-            #    print("WXYZ  {} " .format(monitor), end='')
-            
+            return self.unitsRow()
+        else:
+            return self.data(recType)
 
-                # def setSavedVal(self, passed_value):
-                # SET timestamp = Param(["time"], ["UTC"], [TIME(Timer.stime())])
-                # OK recnum = Param(["rec_num"],["integer"],[0])
-                
-                # SET whburner_stat = Param(["wh_status"],["integer"],[DEC(NaN)])
-                # SET whburner_mode = Param(["wh_mode"],["integer"],[DEC(NaN)]) 
-                # SET fburner_stat = Param(["f_status"],["integer"],[DEC(NaN)]) 
-                # SET fburner_mode = Param(["f_mode"],["integer"],[DEC(NaN)])
-                # SET monitor = Param(["sys_state"],["integer"],[DEC(NaN)])
-                #params.extend([whburner_stat,whburner_mode,fburner_stat, fburner_mode, monitor])
-
-                #scans_accum = Param(["scans_accum"],["integer"],[0]) # cleared every time a record is written
-                #sec_whrun = Param(["sec_whrun"],["integer"],[0]) # total accumulated run time, but output zero at end of 60-sec records
-                #sec_frun = Param(["sec_frun"],["integer"],[0]) # total accumulated run time, but always value of zero at end of 60sec recs
-                #sec_whcooldown = Param(["sec_whcool"],["integer"],[0]) # accumulated cool time, set to 0 when in state 5 or 6
-                #sec_fcooldown = Param(["sec_fcool"],["integer"],[0]) # accumulated cool time, set to 0 when in state 5 or 6
-                #sec_count = Param(["sec_count"],["integer"],[1]) # divisor to calculate averages over the record period. # of secs since last rec
-                #params.extend([scans_accum, sec_whrun, sec_frun, sec_whcooldown, sec_fcooldown, sec_count])                                                        
-            else:
-                ## DWC 01.31 this not needed; override above as needed
-                fields = param.reportStatData() 
-                pass   
-            #print("Fields before:{}".format(fields))
-            
-            ## As it was, triggers error Type int is not iterable.
-            #for field in fields: ## convert precisions  ## TODO is this for loop needed, since we're already cycling through params?
-            #    #print("Param.reportHeaders()[0]: {}".format(param.reportHeaders()[0][0:2])) #DEBUG
-            #    if param.reportHeaders()[0][0:2] == 't_':  #if temps
-            #        trimmedFields.append(str.format("{:.1f}",field))
-            #        #print("type Temp. Value: {}".format(trimmedFields[-1]))
-            #    elif isinstance(field,int): 
-            #        trimmedFields.append(field)
-            #    elif isinstance(field, numbers.Number): #it's still a number
-            #        trimmedFields.append(str.format("{:.2f}",field))
-            #    else:
-            #        trimmedFields.append(field)
-            #fields = list(trimmedFields) # replace with trimmed values
-            
-            #print("MULTI-SCAN FIELDS: {} " .format(fields))
-            for field in fields: ## convert precisions  ## TODO is this for loop needed, since we're already cycling through params?
-                #print("Param.reportHeaders()[0]: {}".format(param.reportHeaders()[0][0:2])) #DEBUG
-                #try:
-                    if param.reportHeaders()[0][0:2] == 't_':  #if temps
-                        trimmedFields.append(str.format("{:.1f}",field))
-                        #print("type Temp. Value: {}".format(trimmedFields[-1]))
-                #except:
-                #    print("Failed at  if param.reportHeaders()")
-                #try:
-                    ## ppm applies to both CO and CO2
-                    elif  param.reportHeaders()[0][0:3] == 'pos': 
-                        trimmedFields.append(str.format("{:.0f}",field))
-                    elif  param.reportHeaders()[0][0:3] == 'ppm': 
-                        trimmedFields.append(str.format("{:.0f}",field))
-                    #elif  param.reportHeaders()[0][0:7] == 'p_': 
-                    #    trimmedFields.append(str.format("{:.1f}",field))
-                    ## v applies to all XBee analog readings    
-                    elif  param.reportHeaders()[0][0:1] == 'v': 
-                        trimmedFields.append(str.format("{:.0f}",field))
-                    elif  param.reportHeaders()[0][0:3] == 'sec':           ## seconds run time should be integers
-                        trimmedFields.append(str.format("{:.0f}",field))                    
-                    
-                    elif isinstance(field,int): 
-                        trimmedFields.append(field)
-                    elif isinstance(field, numbers.Number): #it's still a number
-                        trimmedFields.append(str.format("{:.2f}",field))
-                    else:
-                        trimmedFields.append(field)
-                    #print("TRIMMED FIELDS: {} " .format(trimmedFields))    
-                #except:
-                #    print("Failed at isinstance lines")
-                    
-            fields = list(trimmedFields) # replace with trimmed values
-        #print("Fields:{}".format(fields))
-        commaIndex = 0
-        for field in fields:
-            if (param == params[-1]) and (commaIndex == (len(fields)-1)):
-                #print("field:{} of fields:{}".format(field,fields), end='\n') #last item
-                returnString = returnString+str(field)+'' #rely on filewrite to add own \n
-            else:
-                #print("{}, ".format(field), end='') #end='\n'
-                returnString = returnString+str(field)+','
-            commaIndex = commaIndex + 1
-    #print("\n-End of record print-")
-    return returnString
+schema = None ## compiled by compileSchema() once params are final
+
+def compileSchema():
+    global schema
+    schema = Schema(params)
+    return schema
+
+def record(recType):
+    if schema is None:
+        compileSchema()
+    return schema.record(recType)
 
 def diag_record(recType):
     returnString = ""
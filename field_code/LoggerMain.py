@@ -42,6 +42,12 @@ import time, math, sys, os
 from datetime import datetime
 from decimal import *
 import LoggerLib as Lib
+import LoggerStore as Store
+import LoggerChunks as Chunks
+import LoggerJournal as Journal
+import LoggerProfile as Profile
+import LoggerStages as Stages
+import LoggerBus as Bus
 import Adafruit_BBIO.UART as UART
 from xbee import zigbee
 import serial
@@ -54,7 +60,23 @@ CO2VALVECYCLE = 20   ## CO2 valve operating cycle (sec)
 CO2CLEARTIME  = 12   ## Time allowed for clearing CO2 system, good data comes after this
 CO2_BACKGROUND_SAMPLING_PER  =  14400    ## Seconds for background sampling.  15min = 900sec, 4hr = 14400sec
 PRESSVALVECYCLE = 3
+PRESSCLEARTIME = 2   ## Time allowed for pressure to settle after a valve switch
+## Valve tables (see Lib.ValveSequencer): [position, outputs it turns on, appliance it samples]; the positions
+## take turns in this order, leaving out those whose appliance ("wh" or "f") isn't present
+PRESSURE_VALVES = [[0, [Lib.p_zero_valve], None],
+                   [1, [Lib.p_whvent_valve], "wh"],
+                   [2, [Lib.p_fvent_valve], "f"],
+                   [3, [Lib.p_zone_valve], None]]
+CO2_VALVES = [[4, [Lib.co2_whvent_valve, Lib.controls[7]], "wh"],  ## controls[7] is the pump
+              [5, [Lib.co2_fvent_valve, Lib.controls[7]], "f"],
+              [6, [Lib.co2_zone_valve, Lib.controls[7]], None]]
 NaN = float('NaN')
+ADC_BUS_WORKERS = True  ## scan the two I2C buses (TCs + DLVR on I2C1, U8-U10 on I2C2) concurrently, one thread each
+ADC_READY_MODE = Lib.Adc.READY_POLL  ## READY_SLEEP waits a padded 1/sps; READY_POLL/READY_ALERT move on once the conversion lands
+TIMER_MODE = Lib.Timer.MODE_SLEEP  ## MODE_SLEEP waits for each tick with time.sleep(); MODE_ALARM with signal.pause() and SIGALRM
+TIMER_POLICY = Lib.Timer.POLICY_CATCHUP  ## after a scan overruns: POLICY_CATCHUP runs the missed ticks at once; POLICY_SKIP skips them
+NUMPY_STATS = False  ## True: multi-scan record stats in one NumPy pass (if numpy is installed); False: each sensor's running stats
+STAGE_THREADS = True  ## True: data/diagnostics writes and the console line run on their own threads (see LoggerStages); False: in the loop
 
 #Record keeping
 HEADER_REC = 0
@@ -103,6 +125,18 @@ for control in Lib.controls:
     if control.name == "24V@P8-15":
         control.setValue(1) #write GPIO.HIGH
 
+## Select how multi-scan record stats are computed
+Lib.selectStatsEngine(NUMPY_STATS)
+
+## Start one ADC acquisition worker per I2C bus
+Lib.Adc.readyMode = ADC_READY_MODE
+if ADC_BUS_WORKERS:
+    Lib.startAdcBusWorkers()
+
+## Sample the DLVR continuously in the background; fetchPressure() just summarizes the readings
+pressureSampler = Lib.PressureSampler(Lib.p_current)
+pressureSampler.start()
+
 ## Setup zigbee UART for asynchronous operation
 UART.setup("UART4")
 ser = serial.Serial(port="/dev/ttyO4",baudrate=9600, timeout=1) #this is a letter "Oh"-4
@@ -180,67 +214,38 @@ def fetchXbee(data):
     pass
 
 
-def fetchAdcInputs():    #NOTE will execute, but test sufficiently to verify reliable Data
+def handOffCO2(Value):
     global currentCO2value #used for handing off CO2 Value
-    global adcCaptureList # contains list elements with [sensor.name, sensor.getLastVal()]
-    for mux in range(Lib.Adc.NMUX):
-        for job in range(3): ## [ start, sleep, fetch ]
-            for sensor in Lib.ains:
-                if sensor.use and sensor.mux == mux: # and sensor.name == "TC05@U13":
-                    adc = sensor.adc
-                    if (job == 0): ## start
-                        try:
-                            adc.startAdc(mux, pga=4096, sps=250)  ## DWC 12.14 revert back to default sps=250, pga=4096
-                            #print("job={} mux={} sensor={}"\     ## DWC 12.16 drop for now
-                            #    .format(job,mux,sensor.name))
-                        except Exception as err:
-                            print("error starting ADC for sensor {} on Adc at 0x{:02x} mux {}: {}"\
-                                    .format(sensor.name, adc.addr, mux, err))
-                            adc.startTime = time.time() ## really needed?
-                    elif (job == 1): ## sleep
-                        elapsed = time.time() - adc.startTime 
-                        adctime = (1.0 / adc.sps) + .001 
-                        if (elapsed < adctime):
-                            #print("fetching 0x{:02x} too early: at {} sps delay should be {} but is {}"\
-                            #        .format(adc.addr, sensor.sps, adctime, elapsed))
-                            time.sleep(adctime - elapsed + .002)
-                        ## DWC 12.14 add print statement, take out of if statement
-                        #print("job={} mux={} sensor={} adctime={} elapsed={}"\    ## DWC 12.16 drop for now
-                        #    .format(job,mux,sensor.name,adctime,elapsed))
-                    else: #if (job == 2): ## fetch
-                        try:
-                            Value = adc.fetchAdc()
-                            if sensor.name[0:2] == "TC":  #perhaps break the conversion out from the read cycle?
-                                ## temperature conversion is done in Lib.Tc
-                                ## DWC 02.17 change limits to correspond to 1000 and lower ADC limit of 0 mV
-                                if(Value > 2689.0 or Value < 0.0):
-                                    Value = NaN
-                                sensor.appendAdcValue(Value) # conversions for Tcs are performed in AdcValue.
-                                #result = sensor.getLastVal()
-                            elif sensor.name[0:8] == "J25-1@U9": #CO2 input(s); checks for any of the 3 reads
-                                # conversion to CO2 ppm, handoff to main loop, don't append
-                                # Note this "sensor" includes 3 CO2 objects, but all 3 reads should give us ~ same values
-                                volts = Value/1000
-                                currentCO2value = 2000 * volts   ## get this converted to engineering units (PPM)
-                                #print("CurrentCO2value set to {}".format(currentCO2value)) # Allows viewing of all 3 successive values                            
-                            ## Process output of CTV-A or equivalent current sensor, 20A / 2.5V = 8.0
-                            elif (sensor.name[0:8] == "AIN-B@U8" or sensor.name[0:8] == "AIN-C@U8"):
-                                Amps = (Value/1000.0) * 8.0
-                                sensor.appendAdcValue(Amps)
-                            else:
-                                #print("this is not a TC."),  #DBG
-                                #print("{} \tResult: {}mV"\
-                                #    .format(sensor.name,result))
-                                sensor.appendAdcValue(Value)
-                                #result = sensor.getLastVal()
-                            ## DWC 01.28 don't attempt to append CO2 value yet, watch clearance time and append in main loop    
-                            ## we're looping through sensors, so this should catch all non-co2 sensors
-                            #if sensor.name[0:3] != "co2": 
-                             #   adcCaptureList.append([sensor.name,result])
-                            #print("{:4.0f} " .format(result), end='')    ## DWC 12.16 put output on one line for readability
-                        except Exception as err:
-                            print("error fetching ADC for sensor {} on Adc at 0x{:02x} mux {}: {}"\
-                                    .format(sensor.name, adc.addr, mux, err))
+    # conversion to CO2 ppm, handoff to main loop, don't append
+    # Note this "sensor" includes 3 CO2 objects, but all 3 reads should give us ~ same values
+    volts = Value/1000
+    currentCO2value = 2000 * volts   ## get this converted to engineering units (PPM)
+    ## DWC 01.28 don't attempt to append CO2 value yet, watch clearance time and append in main loop    
+
+def planAdcEntry(sensor):
+    ## Called by Lib.ScanPlan when it compiles Lib.ains--not every scan
+    if isinstance(sensor, Lib.Tc):
+        ## temperature conversion is done in Lib.Tc
+        ## DWC 02.17 change limits to correspond to 1000 and lower ADC limit of 0 mV
+        return Lib.ScanEntry(sensor, sensor.appendAdcValue, lo=0.0, hi=2689.0)
+    elif isinstance(sensor, Lib.CO2): #CO2 input(s); any of the 3 reads
+        return Lib.ScanEntry(sensor, handOffCO2)
+    ## Process output of CTV-A or equivalent current sensor, 20A / 2.5V = 8.0
+    elif (sensor is Lib.fan1 or sensor is Lib.fan2):
+        def appendAmps(Value):
+            sensor.appendAdcValue((Value/1000.0) * 8.0)
+        return Lib.ScanEntry(sensor, appendAmps)
+    else:
+        return Lib.ScanEntry(sensor, sensor.appendAdcValue)
+
+def fetchAdcInputs():    #NOTE will execute, but test sufficiently to verify reliable Data
+    ## ADCs are read in Lib (one worker per I2C bus if ADC_BUS_WORKERS); conversions are applied here
+    for entry, Value in Lib.fetchAdcs(adcScanPlan):
+        try:
+            entry.store(Value)
+        except Exception as err:
+            print("error converting ADC value for sensor {} on Adc at 0x{:02x} mux {}: {}"\
+                    .format(entry.sensor.name, entry.sensor.adc.addr, entry.sensor.mux, err))
     #print('\n')    ## DWC 121.26 comment out to create a single output line for inspection of data
 
 
@@ -287,57 +292,117 @@ def buildAdcCaptureList():
 # Pressure sensor reads might be interleaved with i2c adc reads above, or
 #  might be a separate function.
 
+def valveSequencer(name, valves, dwell, settle, posParam, timeParam):
+    ## A sequencer for a valve table, cycling through the valves whose appliance is present
+    absent = [appliance for appliance, present in [["wh", Conf.waterHeaterIsPresent], ["f", Conf.furnaceIsPresent]]
+              if present == False]
+    cycle = [position for position, outputs, appliance in valves if appliance not in absent]
+    return Lib.ValveSequencer(name, [[position, outputs] for position, outputs, appliance in valves], cycle,
+                              dwell, settle, posParam, timeParam)
+
 def fetchPressure():
-    ## Read Pressure sensor check
-    pressureAvg = 0.0
-    count = 0
-    for i in range(25):
-        try: 
-            pressure_Pa = Lib.p_current.readPressure()
-        except: 
-            pressure_Pa = NaN
-            print("Pressure Reading Exception caught")
-        if math.isnan(pressure_Pa):
-            #print("Pressure is: {}".format(pressure_Pa))
-            count -=1
-        else:
-          #print("Pressure is: {}".format(pressure_Pa))
-          pressureAvg = pressureAvg + pressure_Pa
-        count += 1
-        time.sleep(0.0066) 
-                                  ## pressure is updated every 9.5mSec for low power
-                                  ## The delay between adc updates is 6 m sec 
-                                  ## for 31 cycles then it does an internal 
-                                  ## check that takes 9.5. We should go just over 6 for our delay 
-                                  ## and may get a duplicate reading occasionally. 
-                                  ##
-
-    if count != 0.0:
-        pressureAvg = pressureAvg/count
+    ## Oversampled pressure from the background sampler: the mean of the good DLVR readings taken since the
+    ## last call, but not before the pressure valves last switched (the current valve-dwell window)
+    global pressureWindowStart, pressureCountMin, pressureSpreadMax
+    windowEnd = time.time()
+    pressureAvg, pressureCount, pressureSpread = pressureSampler.window(max(pressureWindowStart, pressureValves.switchTime))
+    pressureWindowStart = windowEnd
+    ## Fewest readings behind a scan's mean, and their widest spread, since the last diagnostics row
+    pressureCountMin = min(pressureCountMin, pressureCount)
+    if not math.isnan(pressureSpread):
+        pressureSpreadMax = pressureSpread if math.isnan(pressureSpreadMax) else max(pressureSpreadMax, pressureSpread)
     if False:      ## TEST PRINT
-        print("count is: {}".format(count), end='')
+        print("count is: {}".format(pressureCount), end='')
         print("pressureAvg is: {}".format(pressureAvg))
-    return pressureAvg # returns oversampled pressure reading in inH20
+    return pressureAvg # returns oversampled pressure reading in Pa (NaN if no good readings)
+    pass
+
+def storeRecord(recType):
+    ## The record's fields are taken once (it bumps rec_num) and stored to the data file (and database)
+    ## by the writer stage
+    writerStage.put(writeRecord, recordSchema.values(recType))
+    pass
+
+## The writer stage runs these, in the order the loop queued them
+
+def writeRecord(fields):
+    for writer in dataWriters:
+        writer.writeRecord(recordSchema, fields)
+    pass
+
+def commitRecords(stateChanged):
+    ## Commit buffered records: right away on a state change (so a burner start is never lost), else once due
+    for writer in dataWriters:
+        if stateChanged:
+            writer.flush()
+        else:
+            writer.tick()
+    pass
+
+def rotateDataFile(filename):
+    global dataFilename
+    dataFilename = filename
+    print("New file is: {}".format(dataFilename))
+    #Record headers to Data File (for Records)
+    try: 
+        dataWriter.open(dataFilename) ## commits and closes the old file
+    except:
+        print("Unable to open new DATA file")
+    dataWriter.writeHeader(recordSchema)
+    if database is not None:
+        database.writeHeader(recordSchema, dataFilename) ## a new segment, for the new file
+    for writer in dataWriters:
+        writer.flush()
+    pass
+
+def checkDataFileSize():
+    ## Size is tracked by the writer--no need to stat the file
+    if dataWriter.bytesWritten > Conf.maxFileSize:
+        print("Reached max Data filesize of {} Creating a new file.".format(Conf.maxFileSize))
+        rotateDataFile(Store.dataFilename(Conf.savePath, BBBsiteName, time.time(), Store.ROTATE_SIZE))
+    pass
+
+def appendDiagnostics(row):
+    try:
+        diagnosticsFile = open(diagnosticsFilename,'ab')
+        diagnosticsFile.write(row+"\n")
+        diagnosticsFile.close()
+    except (IOError, OSError), err:
+        print("Unable to write to {}: {}".format(diagnosticsFilename, err))
+    pass
+
+def journalState():
+    """the state machine, for the journal (see LoggerJournal)"""
+    return {"mon": mon.getstate(), "burners": [burner.snapshot() for burner in Lib.burners]}
+
+def restoreState(state):
+    """carries on rec_num and the state machine from the journal after a restart"""
+    if state.get("rec_num") is not None:
+        Lib.recnum.setValue(state["rec_num"])
+    if "mon" in state:
+        mon.restore(state["mon"])
+        for burner, snapshot in zip(Lib.burners, state["burners"]):
+            burner.restore(snapshot)
+    print("Carrying on from JOURNAL: rec_num {} mon state {} burner modes {}".format(
+          Lib.recnum.reportScanData()[0], mon.getstate(), [burner.getMode() for burner in Lib.burners]))
     pass
 
 
-def closeOutRecord():      # DC 11.28 
+def closeOutRecord():      # DC 11.28
     # Number of samples = sensorX.count where sensorX is e.g. TC01
     number_of_samples = Lib.tcs[14].getValCntExceptLast() # this should be outdoor temp
     # Increment record number integer (This happens with Lib.record call.
     #print("TC14's Values are:{}".format(Lib.tcs[14].values)) ## DEBUG
     Lib.scans_accum.setValue(number_of_samples) #Set accumulator count
     #print("scans_accum is now: {}".format(Lib.scans_accum.values))  ## DEBUG
-    Lib.sec_count.setValue(int(round(Decimal(scantime-lastRecordTime),0))) 
+    Lib.sec_count.setValue(int(round(scantime-lastRecordTime,0))) 
     #print("sec_count is now: {}".format(Lib.sec_count.values)) ## Debug
     # Write base of record string (timestamp, systemID, record #, mon.state, wh.mode, f.mode)
     # Place data values in record string (see xlsx file for list of parameters)
     # Build string for output to file, using sensor.avg, sensor.min, sensor.max values 
     # Write string to file - probably want a file write function in library?
     # Must clear all accumulated values when a record is closed out: 
-    dataFile = open(dataFilename,'ab')
-    dataFile.write(Lib.record(MULTI_SCAN_REC)+'\n')
-    dataFile.close()
+    storeRecord(MULTI_SCAN_REC)
     ## Clear accumulator objects (may not be necessary)
     #print("Lib.sensors:{}".format(Lib.sensors))
     for sensor in Lib.sensors:
@@ -389,9 +454,7 @@ def write1secRecord():      # DC 11.28
     # Place data values in record string (see xlsx file for list of parameters)
     # Min and max values will simply be set to the single parameter value
     # Append record string to file
-    dataFile = open(dataFilename,'ab')
-    dataFile.write(Lib.record(SINGLE_SCAN_REC)+'\n')
-    dataFile.close()
+    storeRecord(SINGLE_SCAN_REC)
     ## Clear accumulator objects (may not be necessary)
     #print("Lib.sensors:{}".format(Lib.sensors))
     for sensor in Lib.sensors:
@@ -442,6 +505,48 @@ class Mon(object):
     def delstate(self): del self.__state
     state = property(getstate, setstate, delstate, "'state' property")
 
+    def restore(self, state): ## from the journal, after a restart
+        self.__state = state
+        self.__prevState = state
+
+
+class Rollup(object):
+    """a rollup level (dataRollups): the period its sensor stats (Sensor.rollups) cover, and its daily file"""
+
+    def __init__(self, level, seconds):
+        self.level = level
+        self.seconds = seconds
+        self.engine = Lib.RollupStatsEngine(level)
+        self.periodStart = None
+        self.day = Store.periodStart(time.time(), Store.ROTATE_DAILY)
+        self.writer = Store.dataWriter(Store.rollupFilename(Conf.savePath, BBBsiteName, time.time(), seconds))
+        self.writer.writeHeader(recordSchema)
+
+    def tick(self, t):
+        """call at the top of each scan, before its values come in: stores the record of a period just over"""
+        ## the record is taken here; the writer stage writes it
+        start = int(t) - (int(t) % self.seconds)
+        if (self.periodStart is not None) and (start != self.periodStart):
+            day = Store.periodStart(self.periodStart, Store.ROTATE_DAILY)
+            if day != self.day:
+                writerStage.put(self.rotate, Store.rollupFilename(Conf.savePath, BBBsiteName, self.periodStart, self.seconds))
+                self.day = day
+            writerStage.put(self.writer.writeRecord, recordSchema, recordSchema.rollupValues(self.engine, self.periodStart))
+            for sensor in recordSchema.sensors:
+                sensor.rollups[self.level].clear()
+        self.periodStart = start
+        writerStage.offer("rollupTick{}".format(self.seconds), self.writer.tick)
+
+    def rotate(self, filename):
+        try:
+            self.writer.open(filename)
+        except:
+            print("Unable to open new ROLLUP file")
+        self.writer.writeHeader(recordSchema)
+
+    def close(self):
+        self.writer.close() ## a period cut short isn't recorded
+
 
 #############
 ## start main
@@ -536,6 +641,13 @@ for x in range(len(xBeeNodes)):  # for each xbee end node in the network
         Lib.params.extend([n_xbee3, vi_xbee3, vp_xbee3, vpos_xbee3])
         print("Xbee {} Address is {}".format(x,nodeAddress))
 
+## Compile the data file's columns (Lib.params is final from here on)
+recordSchema = Lib.compileSchema()
+
+## Compile the ADC scan (rebuilt by Lib.fetchAdcs() only if Lib.ains or a use flag changes)
+adcScanPlan = Lib.ScanPlan(Lib.ains, planAdcEntry)
+print(adcScanPlan.dump())
+
 wh = Lib.waterHtr
 f = Lib.furnace
 
@@ -568,7 +680,8 @@ siteRSSHPortFile.write(str(BBBreverseSSH))  ## handoff port for scripts
 siteRSSHPortFile.close()
 
 ## Generate a Filename and Path (for Records)
-dataFilename = Conf.savePath+time.strftime("%Y-%m-%d_%H_%M_%S_",time.gmtime())+BBBsiteName+"_Data.csv"
+dataFilename = Store.dataFilename(Conf.savePath, BBBsiteName, time.time())
+dataPeriod = Store.periodStart(time.time())  ## UTC hour/day the current data file covers (None: size rotation only)
 ## Generate a Filename and Path (for Info/Diagnostics)
 diagnosticsFilename = Conf.savePath+time.strftime("%Y-%m-%d_%H_%M_%S_",time.gmtime())+BBBsiteName+"_Info.csv"
 
@@ -592,15 +705,80 @@ if freeDiskSpace < FREE_BYTES_LIMIT:
 BBB_free_space = Lib.Param(["BBB_BytesFree"],["string"])
 BBB_free_space.values = [freeDiskSpace]
 Lib.diagParams.extend([BBB_rsync_save_path,BBB_free_space])
+BBB_valve_writes = Lib.Param(["valve_writes"],["integer"],[0]) # valve/pump GPIO writes since startup
+BBB_valve_skips = Lib.Param(["valve_skips"],["integer"],[0]) # valve/pump GPIO writes skipped (output already held the value)
+Lib.diagParams.extend([BBB_valve_writes,BBB_valve_skips])
+BBB_dlvr_good = Lib.Param(["dlvr_good"],["integer"],[0]) # good DLVR readings since startup
+BBB_dlvr_stale = Lib.Param(["dlvr_stale"],["integer"],[0]) # DLVR readings with stale status
+BBB_dlvr_notready = Lib.Param(["dlvr_notready"],["integer"],[0]) # DLVR readings in command mode or diagnostic fault
+BBB_dlvr_errors = Lib.Param(["dlvr_errors"],["integer"],[0]) # DLVR reads that failed on the bus
+BBB_dlvr_scan_min = Lib.Param(["dlvr_scan_min"],["integer"],[0]) # fewest good readings averaged for a scan since the last row
+BBB_dlvr_spread_max = Lib.Param(["dlvr_spread_max"],["Pa"],[NaN]) # widest spread (max - min) of a scan's readings since the last row
+Lib.diagParams.extend([BBB_dlvr_good,BBB_dlvr_stale,BBB_dlvr_notready,BBB_dlvr_errors,BBB_dlvr_scan_min,BBB_dlvr_spread_max])
+BBB_tick_overruns = Lib.Param(["tick_overruns"],["integer"],[0]) # ticks already due when the scan before them ended
+BBB_tick_caughtup = Lib.Param(["tick_caughtup"],["integer"],[0]) # overrun ticks run at once to catch up
+BBB_tick_skipped = Lib.Param(["tick_skipped"],["integer"],[0]) # ticks skipped after overruns
+BBB_tick_late_max = Lib.Param(["tick_late_max"],["sec"],[0]) # latest wake-up past a tick's deadline since startup
+Lib.diagParams.extend([BBB_tick_overruns,BBB_tick_caughtup,BBB_tick_skipped,BBB_tick_late_max])
+## Scan phase timing (see LoggerProfile): a row to this file every profileInterval sec, if set
+profiler = Profile.Profiler(["rollups", "fetchAdcInputs", "buildAdcCaptureList", "fetchPressure", "calcMode", "state",
+                             "valves", "bus", "rotation", "record", "commit", "console"], Lib.monotonic)
+PROFILE_INTERVAL = getattr(Conf, "profileInterval", 0)
+if PROFILE_INTERVAL > 0:
+    Lib.diagParams.append(profiler)
+## Pipeline stages (see LoggerStages): their queue depths, waits for room, overflows and drops
+writerStage = Stages.Stage("writer", Stages.WRITER_JOBS, clock=Lib.monotonic,
+                           budget=Lib.Timer.remaining)  ## data, rollup, journal and _Info.csv writes
+consoleStage = Stages.Stage("console", Stages.CONSOLE_JOBS, drop=True, clock=Lib.monotonic)  ## the status line
+stages = [writerStage, consoleStage]
+Lib.diagParams.extend(stages)
 diagnosticsFile.write(Lib.diag_record(HEADER_REC)+"\n")
 diagnosticsFile.write(Lib.diag_record(SINGLE_SCAN_REC)+"\n")
 diagnosticsFile.close()
 lastDiagTime = time.time() - ((time.time() % 86400.0)+1)  ## First instantiation of Diagnostic output and funny math to get next end of day recorded.
 
+## After a reset: repair the last data file from the journal, and carry on rec_num and the states
+journal = None
+if Store.JOURNAL:
+    journalFilename = Journal.journalFilename(Conf.savePath, BBBsiteName)
+    try:
+        recovered = Store.recover(journalFilename)
+        if recovered:
+            restoreState(recovered)
+    except Exception, err:
+        print("Unable to recover from JOURNAL {}: {}".format(journalFilename, err))
+    try:
+        journal = Journal.Journal(journalFilename, sync=(Store.FSYNC != Store.FSYNC_NEVER), syncSeconds=Store.JOURNAL_SYNC)
+    except (IOError, OSError), err:
+        print("Unable to open JOURNAL {}: {}".format(journalFilename, err))
+
 #Record headers to Data File (for Records)
-dataFile = open(dataFilename,'ab')
-dataFile.write(Lib.record(HEADER_REC)+"\n")
-dataFile.close()
+## The data file is kept open; records are buffered and committed in groups (see LoggerStore)
+dataWriter = Store.dataWriter(dataFilename, journal=journal)  ## CSV or binary, per dataFormat
+dataWriter.writeHeader(recordSchema)  ## not if carrying on in this hour's/day's file after a restart
+dataWriters = [dataWriter]  ## everything records are stored to
+database = None
+if Store.SQLITE:
+    try:
+        database = Store.SqliteWriter(Store.databaseFilename(Conf.savePath, BBBsiteName))
+        database.writeHeader(recordSchema, dataFilename)
+        dataWriters.append(database)
+    except Exception, err:
+        print("Unable to open DATABASE: {}".format(err))
+if Store.CHUNKS:
+    chunkWriter = Chunks.ChunkWriter(Conf.savePath, BBBsiteName)  ## hour chunks are written as each hour ends
+    chunkWriter.writeHeader(recordSchema)
+    dataWriters.append(chunkWriter)
+for writer in dataWriters:
+    writer.flush()
+rollups = [Rollup(level, seconds) for level, seconds in enumerate(Lib.ROLLUPS)]  ## 1-sec/1-min/1-hour files, if any
+## Each scan's values go to the shared-memory sample bus for other processes (see LoggerBus), if set
+bus = None
+if getattr(Conf, "sampleBus", False):
+    try:
+        bus = Bus.Publisher(Bus.busFilename(BBBsiteName), recordSchema.describe())
+    except EnvironmentError, err: ## mmap errors included
+        print("Unable to open sample BUS: {}".format(err))
 #TODO Record Units Somewhere.  Where?
 
 ## determine the current state
@@ -615,14 +793,16 @@ dataFile.close()
 ## Initialize
 
 # and/or
-pressstarttime = math.trunc(time.time())  # Obviates pressstarttime = None AND press_elapsed  = None
-valvepress = 0
+## The pressure sequence starts now (obviates press_elapsed = None); its switchTime bounds the sampler window
+pressureValves = valveSequencer("pressure", PRESSURE_VALVES, PRESSVALVECYCLE, PRESSCLEARTIME, Lib.p_valve_pos, Lib.p_valve_time)
+pressureValves.start(0, math.trunc(time.time()))
+pressureWindowStart = time.time()
+pressureCountMin = sys.maxsize
+pressureSpreadMax = NaN
 Lib.p_zero.setCurrentVal(0)  ## Initialize zero offset
+zeroOffset = 0.0
 ## Set valves to zero offset measurement 
-Lib.p_zero_valve.setValue(1)
-Lib.p_whvent_valve.setValue(0)
-Lib.p_fvent_valve.setValue(0)
-Lib.p_zone_valve.setValue(0)     
+pressureValves.apply(force=True)
 valvepressname = "-"
 
     ## None of these should be needed:
@@ -633,10 +813,9 @@ valvepressname = "-"
     #    pressstarttime = scantime
 
 
-co2starttime   = None      ## DWC used to avoid error on first scan
 currentCO2value = Decimal("NaN") ## used in handoff between function calls within PythonMain
-valveindexco2  = None
-valveco2       = -1   ## CO2 sampling inactive when -1
+co2Valves = valveSequencer("CO2", CO2_VALVES, CO2VALVECYCLE, CO2CLEARTIME, Lib.co2_valve_pos, Lib.co2_valve_time)
+co2Valves.apply(force=True)  ## CO2 sampling inactive (position -1): valves and pump off
 valveCO2name = "-"
 co2_elapsed    = 0   # Need to initialize to allow inclusion in std out 
 cnt = 0
@@ -652,8 +831,13 @@ headerString = "\
 print(headerString)
 
 ## main loop
-Lib.Timer.start()
+if STAGE_THREADS:
+    for stage in stages:
+        stage.start()
+Lib.Timer.start(TIMER_MODE, TIMER_POLICY)
 Lib.Timer.sleep()
+lastScantime = Lib.Timer.second - 1
+lastProfileTime = Lib.Timer.second
 while True:
   try:  #NOTE this is for debug, except Keyboard Interrupt 
     ## Capture time at top of second
@@ -661,15 +845,23 @@ while True:
     ## scantimeusec now used for high-resolution timestamp, and scantime for 1-sec resolution
     scantimeusec = time.time()     
     ## DWC create scantimesec (integer seconds) for valve control; fractional seconds throw it off
-    scantime = math.trunc(scantimeusec)
+    ## scantime is the UTC second the tick is for: one more than the last, unless the Timer skipped some
+    scantime = Lib.Timer.second
     ## DWC 02.01 change timest to timestamp
     Lib.timestamp.setValue(Lib.TIME(scantime)) # track/record latest timestamp  (Is this used?)
+    profiler.begin()
+    ## Rollups of the periods that ended with the last scan (before this scan's values come in)
+    for rollup in rollups:
+        rollup.tick(scantime)
+    profiler.lap("rollups")
     #Lib.timestamp.setSavedVal(scantime)
     
     ## Scan all adc inputs
     fetchAdcInputs() 
+    profiler.lap("fetchAdcInputs")
     ## DWC 01.30 new function to build capture list (doesn't include CO2, since it's processed later)
     buildAdcCaptureList()
+    profiler.lap("buildAdcCaptureList")
     ## Sort these by name
     ## Edit sorting and remove
     #adcCaptureList.sort(key=lambda x: x[0])  # Sort list by first element, sensor.name
@@ -679,20 +871,21 @@ while True:
     ## DWC 01.22 moved std out print statements to end of Main
                                                                         
     currentpressure = fetchPressure()
-    currentpressurevalve = valvepress
-    Lib.setCurrentPressureValve(valvepress)
-    press_elapsed = scantime - pressstarttime
-    Lib.p_valve_pos.setValue(valvepress)
-    Lib.p_valve_time.setValue(press_elapsed)
+    profiler.lap("fetchPressure")
+    ## The valve positions this scan's readings are for (also reported to loc_p/sec_p and loc_co2/sec_co2)
+    currentpressurevalve, press_elapsed = pressureValves.report(scantime)
+    Lib.setCurrentPressureValve(currentpressurevalve)
+    currentCO2valve, co2_elapsed = co2Valves.report(scantime)  ## Carries value through valve setting process to records
   
     try:
         ## Set current value (including zero offset) to NaN during clearance period
-        if (press_elapsed < 2):
+        if not pressureValves.settled(scantime):
             currentpressure = NaN
         else:
             ## Update zero offset (but not wtih a NaN) to the most recent (single-second) value
             if currentpressurevalve == 0:
-                zeroOffset = currentpressure
+                if not math.isnan(currentpressure):
+                    zeroOffset = currentpressure
                 ## This still needed to pass value to sensor(?):
             else:
                 currentpressure = (currentpressure - zeroOffset)  ## Apply zero offset to stick through end of scan incl std out
@@ -708,15 +901,13 @@ while True:
         Lib.p_sensors[currentpressurevalve].appendValue(currentpressure)
 
 
-    currentCO2valve = valveco2    ## Carries value through valve setting process to records
     ## Lib.setCurrentPressureValve(valvepress)  CO2 equivalent needed?
 
-    if valveco2 != -1:    ##  CO2 monitoring is active
-        co2_elapsed = scantime - co2starttime   ## Does not need to be repeated later
+    if co2Valves.active():    ##  CO2 monitoring is active
         ## Generate value of co2filtered, set to NaN during clearance period
         ## currentCO2value is preserved to allow all CO2 values to show in std out
         ##  co2_sensors = [co2_whvent, co2_fvent, co2_zone]                                                                                                            
-        if (co2_elapsed < CO2CLEARTIME):
+        if not co2Valves.settled(scantime):
             co2filtered = NaN
         else: 
             co2filtered = currentCO2value
@@ -730,6 +921,7 @@ while True:
     ## Process data
     ## Determine status of both burners
     ## Assign operating mode of wh and furnace
+    profiler.skip()
     whmode = wh.calcMode() ## also updates status (if burner is present) ## TODO
     Lib.whburner_stat.setValue(int(wh.getStatus())) ## update params to record
     Lib.whburner_mode.setValue(int(whmode))
@@ -743,6 +935,7 @@ while True:
     ## DWC 02.02 after running calcMode(), set param values for run time and cooldown time
     Lib.sec_frun.setValue(f.timeOn) 
     Lib.sec_fcooldown.setValue(f.timeCooling)     
+    profiler.lap("calcMode")
 
     #print("timeOn {} timeCooling {} mode {} status {} startTime {} stopTime {} ".format(wh.timeOn, wh.timeCooling, wh.mode, wh.status, wh.startTime,  wh.stopTime))
     #print("Could not access wh & f mode variables")    
@@ -810,6 +1003,8 @@ while True:
     ## else no change
     ## record the params for states 
     Lib.monitor.setValue(int(mon.state))
+    if journal is not None:
+        writerStage.offer("journalState", journal.setState, journalState())
     ## DWC 12.16 moved print statement to after state is set
     if False:         ## TEST PRINT
         print("time {:>12.1f} mon state: {}  prevState: {}  sw1: {}"\
@@ -822,106 +1017,35 @@ while True:
             else:
                 print("{}".format(sensor.name))
     		       
+    profiler.lap("state") ## monitor state, and its journal entry
     ## Pressure control routine
-    ## set up initialization of valve list to reflect presence of wh and/or furn
-    valvelistpress = [0,1,2,3]       ## Pressure controls are 0, 1, 2, 3
-    if Conf.waterHeaterIsPresent == False:
-        valvelistpress.remove(1)  # Solenoid 1 serves WH sampling
-    if Conf.furnaceIsPresent == False:
-        valvelistpress.remove(2) # Solenoid 2 is the Furnace sampling
-
-    ## DWC 01.28 move this calc of press_elapsed up to allow its use in pressure assignment
-    #press_elapsed = scantime - pressstarttime
-    if (((press_elapsed) >= PRESSVALVECYCLE) or ((press_elapsed) < 0)):
-        ## DWC 01.25 reduce this to just switching valves
-        valveindexpress = valvelistpress.index(valvepress)
-        valveindexpress += 1
-        if valveindexpress == (len(valvelistpress)):
-            valveindexpress = 0
-        valvepress = valvelistpress[valveindexpress]  
-        pressstarttime = scantime
-        
-    ## Set pressure valves
-    if (valvepress == 0):
-        Lib.p_zero_valve.setValue(1)
-        Lib.p_whvent_valve.setValue(0)
-        Lib.p_fvent_valve.setValue(0)
-        Lib.p_zone_valve.setValue(0)     
-    elif (valvepress == 1):
-        Lib.p_zero_valve.setValue(0)
-        Lib.p_whvent_valve.setValue(1)
-        Lib.p_fvent_valve.setValue(0)
-        Lib.p_zone_valve.setValue(0)     
-    elif (valvepress == 2):
-        Lib.p_zero_valve.setValue(0)
-        Lib.p_whvent_valve.setValue(0)
-        Lib.p_fvent_valve.setValue(1)
-        Lib.p_zone_valve.setValue(0)     
-    elif (valvepress == 3):
-        Lib.p_zero_valve.setValue(0)
-        Lib.p_whvent_valve.setValue(0)
-        Lib.p_fvent_valve.setValue(0)
-        Lib.p_zone_valve.setValue(1)     
-    else:
-        print("No pressure valve set")
+    ## The next valve in turn once PRESSVALVECYCLE is up (valves of absent appliances are left out, see
+    ## valveSequencer()); only the valves that change are written
+    pressureValves.step(scantime)
+    pressureValves.apply()
 
     
     ## CO2 control routine
-    ## Moved up from below:
-    Lib.co2_valve_pos.setValue(int(valveco2)) ## set initial value of Parameter "loc_co2"
-    Lib.co2_valve_time.setValue(co2_elapsed)
-    
     ## CO2 valve control 
     ## initial valve setting    
     if (mon.getprevState() in [4,6]):    ## States w/ no CO2 monitoring
         if (mon.getstate() == 1):        ## First burner just started, set up valves
             if(whmode == 1):             ## Check which appliance started, go there first.  Won't see an absent appliance.
-                valveco2 = 4             ## Verify valve numbers.
+                co2Valves.start(4, scantime)             ## Verify valve numbers.
             else: 
-                valveco2 = 5        
+                co2Valves.start(5, scantime)
         elif (mon.getstate() == 5):      ## Starting 1-min CO2 sampling during Off period
             if(Conf.waterHeaterIsPresent):    ## Priority to water heater ifpresent
-                valveco2 = 4    ## Verify valve numbers
+                co2Valves.start(4, scantime)    ## Verify valve numbers
             else: 
-                valveco2 = 5  #start at furnace if no water heater present
-        co2starttime = scantime
-        
-        ## DWC 01.31 move up to capture position BEFORE setting, since it's used to determine valve associated with current data
-        #Lib.co2_valve_pos.setValue(int(valveco2)) ## set initial value of Parameter "loc_co2"
+                co2Valves.start(5, scantime)  #start at furnace if no water heater present
      
-    ## Valve cycling 
-    ## set up initialization of valve list to reflect presence of wh and/or furn
-    valvelistco2 = [4,5,6]       ## Controls are numbered from 0; 4, 5, 6 are CO2 valves
-    if Conf.waterHeaterIsPresent == False:
-        valvelistco2.remove(4)  # Solenoid 1 serves WH sampling
-    if Conf.furnaceIsPresent == False:
-        valvelistco2.remove(5) # Solenoid 2 is the Furnace sampling
-    
+    ## Valve cycling, every CO2VALVECYCLE while CO2 monitoring is active
     ## TODO check for negative numbers in all time difference tests (in case of massive clock error)
-    ## DWC 01.28 now using valveco2 != -1 as flag for CO2 sampling active; valveco2 is initialized to -1
-    if valveco2 != -1:
-        # co2_elapsed = scantime - co2starttime  # Done earlier
-        if (((co2_elapsed) >= CO2VALVECYCLE) or ((co2_elapsed) < 0)):
-            try:
-                ## DWC 01.28 moved append up, and out of this conditional loop, which only saved one value per cycle
-                ## next, update valve index
-                valveindexco2 = valvelistco2.index(valveco2)
-                valveindexco2 += 1
-                if valveindexco2 == (len(valvelistco2)):
-                    valveindexco2 = 0
-                valveco2 = valvelistco2[valveindexco2]  
-                co2starttime = scantime
-                ## DWC 01.31 move up to capture time BEFORE re-setting, since it's used to determine valve time associated with current data 
-                #Lib.co2_valve_time.setValue(int(0)) ## reset time elapsed
-                #Lib.co2_valve_pos.setValue(int(valveco2)) ## update present valve setting
-                #print("CO2 valve indexing. Elapsed = {}" .format (scantime-co2starttime))
-            except:
-                print("could not execute CO2 valve indexing routine")
-        else: ## wait for scan cycles before changing active valve  ## DWC 01.24 I don't think this is used or needed:
-            Lib.co2_valve_time.setValue(int(round(Decimal(scantime-co2starttime),0))) ## increment valve dwell counter
+    co2Valves.step(scantime)
     ## Turn off CO2 monitoring when in state 4 or 6
     if (mon.getstate() in [4,6]):     
-        valveco2 = -1  
+        co2Valves.stop()
         co2_elapsed = 0         
     ## DWC 02.02 add timer to disable CO2 sampling 15 min after the latest burner start
     elif (mon.getstate() == 2):
@@ -929,34 +1053,21 @@ while True:
         if (wh.mode == 2 and Lib.sec_whrun.values[0] < 900) or (f.mode == 2 and Lib.sec_frun.values[0] < 900):
             pass
         else:
-            valveco2 = -1  
+            co2Valves.stop()
             co2_elapsed = 0         
 
-    ## Set co2 valves
-    if (valveco2 == 4):
-        Lib.co2_whvent_valve.setValue(1)
-        Lib.co2_fvent_valve.setValue(0)
-        Lib.co2_zone_valve.setValue(0)
-        Lib.controls[7].setValue(1)     ## Pump
-    elif (valveco2 == 5):
-        Lib.co2_whvent_valve.setValue(0)
-        Lib.co2_fvent_valve.setValue(1)
-        Lib.co2_zone_valve.setValue(0)
-        Lib.controls[7].setValue(1)     ## Pump
-    elif (valveco2 == 6):
-        Lib.co2_whvent_valve.setValue(0)
-        Lib.co2_fvent_valve.setValue(0)
-        Lib.co2_zone_valve.setValue(1)
-        Lib.controls[7].setValue(1)     ## Pump
-    else:
-        Lib.co2_whvent_valve.setValue(0)
-        Lib.co2_fvent_valve.setValue(0)
-        Lib.co2_zone_valve.setValue(0)
-        Lib.controls[7].setValue(0)     ## Pump
+    ## Set co2 valves and pump (only those that change)
+    co2Valves.apply()
 
     if False:         ## TEST PRINT
-        print("valveindexpress = {} valvepress = {} press_elapsed = {} valveindexco2 = {} valveco2 = {} co2_elapsed = {}"\
-            .format(valveindexpress, valvepress, press_elapsed, valveindexco2, valveco2, co2_elapsed))   
+        print("valvepress = {} press_elapsed = {} valveco2 = {} co2_elapsed = {}"\
+            .format(pressureValves.position, press_elapsed, co2Valves.position, co2_elapsed))   
+    profiler.lap("valves")
+
+    ## Publish this scan's values, as they stand before any record clears them
+    if bus is not None:
+        bus.publish(scantime, recordSchema.scanValues())
+    profiler.lap("bus")
  
     
     ## Record control    
@@ -971,9 +1082,21 @@ while True:
         if freeDiskSpace < FREE_BYTES_LIMIT:     
             print("Disk is full ({} bytes remaining). Exiting".format(FREE_BYTES_LIMIT))
             sys.exit()
-        diagnosticsFile= open(diagnosticsFilename,'ab')
-        diagnosticsFile.write(Lib.diag_record(SINGLE_SCAN_REC)+"\n")
-        diagnosticsFile.close()
+        BBB_valve_writes.values = [pressureValves.writesIssued + co2Valves.writesIssued]
+        BBB_valve_skips.values = [pressureValves.writesSkipped + co2Valves.writesSkipped]
+        BBB_dlvr_good.values = [pressureSampler.goodReads]
+        BBB_dlvr_stale.values = [pressureSampler.staleReads]
+        BBB_dlvr_notready.values = [pressureSampler.notReadyReads]
+        BBB_dlvr_errors.values = [pressureSampler.errors]
+        BBB_dlvr_scan_min.values = [pressureCountMin if pressureCountMin != sys.maxsize else 0]
+        BBB_dlvr_spread_max.values = [round(pressureSpreadMax, 3)]
+        pressureCountMin = sys.maxsize
+        pressureSpreadMax = NaN
+        BBB_tick_overruns.values = [Lib.Timer.overruns]
+        BBB_tick_caughtup.values = [Lib.Timer.caughtUp]
+        BBB_tick_skipped.values = [Lib.Timer.skipped]
+        BBB_tick_late_max.values = [round(Lib.Timer.maxLateness, 3)]
+        writerStage.put(appendDiagnostics, Lib.diag_record(SINGLE_SCAN_REC)) ## never shed: the stall counters are in it
         lastDiagTime = scantime
         #TODO: clear/zero any diagParams or sensor data?
         for sensor in Lib.sensors:
@@ -990,12 +1113,32 @@ while True:
     
          
 
+    ## Scan phase profile row, when due
+    if (PROFILE_INTERVAL > 0) and ((scantime - lastProfileTime) >= PROFILE_INTERVAL):
+        writerStage.put(appendDiagnostics, Lib.diag_record(SINGLE_SCAN_REC)) ## the histograms are in it: never shed
+        profiler.clear()
+        for stage in stages:
+            stage.clear()
+        lastProfileTime = scantime
+
+    ## Start a new data file at a UTC hour/day boundary (hourly/daily files) or on reaching the size limit
+    ## (the size check is queued too: the writer stage knows the size once the records ahead of it are in)
+    profiler.skip()
+    scanPeriod = Store.periodStart(scantime)
+    if (scanPeriod != dataPeriod):
+        dataPeriod = scanPeriod
+        writerStage.put(rotateDataFile, Store.dataFilename(Conf.savePath, BBBsiteName, scantime))
+    else:
+        writerStage.offer("checkDataFileSize", checkDataFileSize)
+
+    profiler.lap("rotation")
     # Define 2 lists for state tests:
     prev_state_60sec   = [5,6]      # Monitoring states with 60-sec record interval
     current_state_1sec = [1,2,3,4]  # Monitoring states with 1-sec record interval
     
     ## Check triggers for closing out a 60-sec record 
-    if ((mon.getprevState() in prev_state_60sec) and ((scantime % 60) == 0)):  
+    ## (the minute turned since the last scan--the top-of-minute second itself, unless the Timer skipped it)
+    if ((mon.getprevState() in prev_state_60sec) and ((scantime // 60) != (lastScantime // 60))):  
         #print("Closing out Record")  ## DEBUG
         closeOutRecord()    ## close out accumulated record
         lastRecordTime = scantime
@@ -1027,27 +1170,14 @@ while True:
     ## DWC 02.01 save as start time for following record - drop for now
     # Lib.timestamp.setSavedVal(Lib.TIME(lastRecordTime))                    
 
-  
-    ## Check Filesize and Decide to create a new File
-    try:
-        statInfo = os.stat(dataFilename)
-        #print "filesize is: ", statInfo.st_size
-        dataFileSize = statInfo.st_size
-    except:
-        print("Unable to read filesize for {}".format(dataFilename))
-        dataFileSize = 0
-    if dataFileSize > Conf.maxFileSize:
-            try: 
-                dataFile.close()
-            except:
-                print("Unable to close old DATA file")
-            print("Reached max Data filesize of {} Creating a new file.".format(Conf.maxFileSize))
-            dataFilename = Conf.savePath+time.strftime("%Y-%m-%d_%H_%M_%S_",time.gmtime())+BBBsiteName+"_Data.csv"
-            print("New file is: {}".format(dataFilename))
-            #Record headers to Data File (for Records)
-            dataFile = open(dataFilename,'ab')
-            dataFile.write(Lib.record(HEADER_REC)+"\n")
-            dataFile.close()
+    profiler.lap("record")
+
+    if mon.getstate() != mon.getprevState():
+        writerStage.put(commitRecords, True) ## the flush of a state change is never shed
+    else:
+        writerStage.offer("commitRecords", commitRecords, False)
+    profiler.lap("commit")
+
 
     #Service watchdog
     try: 
@@ -1057,12 +1187,14 @@ while True:
         print("unable to write to watchdog")
 
     executiontime = time.time()-scantimeusec
+    profiler.skip()
 
     
     ## DWC 01.22 move all normal std out to here
+    ## The status line is put together here, from this scan's values, and printed by the console stage
     #print("time at top of loop: {}".format(scantime))
     if (math.trunc(scantime % 30)) == 0:
-        print(headerString)
+        consoleStage.put(print, headerString)
 
     ## DWC 01.24 add valve designations to allow tracking valve positions in std out
     ## Note currentpressurevalve is set when pressure is measured, not updated later
@@ -1081,46 +1213,49 @@ while True:
 
     #print("adcCaptureList: {}".format(adcCaptureList))  ## DEBUG
 
+    statusLine = ""
     if True:     ## TEST PRINT
         scantimeSTRING = time.strftime("%y-%m-%d %H:%M:%S",time.gmtime(scantime))
-        print("{}".format(scantimeSTRING), end='')    ## % 86400 converts to seconds into GMT day, for testing only
+        statusLine += "{}".format(scantimeSTRING)    ## % 86400 converts to seconds into GMT day, for testing only
                     
     for item in adcCaptureList: 
         #print("{:4.1f} ".format(item[1]), end='') 
         ## [0] us proper reference to name
         ## Look at sensor name to determine resolution
         if item[0][0:2] == 'TC':  #if temps
-            print("{:>4.0f}" .format(item[1]), end='')
+            statusLine += "{:>4.0f}" .format(item[1])
         elif (item[0][0:4] == 'DOOR'):
-            print("{:>5.0f}" .format(item[1]), end='')
+            statusLine += "{:>5.0f}" .format(item[1])
         elif (item[0][0:3] == 'AIN'):
-            print("{:>6.2f}" .format(item[1]), end='')
+            statusLine += "{:>6.2f}" .format(item[1])
         else:
-            print("{:>4.0f}" .format(item[1]), end='')
+            statusLine += "{:>4.0f}" .format(item[1])
         #print("in print adcCaptureList")
     #print()    
     adcCaptureList = list() # empty list
 
     ## DWC 01.24 insert pressure valve info (valve name for last value, new valve #, time on new valve
-    print(" {:>s}{:>1d}".format(valvepressname, press_elapsed), end='')
-    print("{:>6.1f}".format(currentpressure), end='') # local conversion to Pascals, inH2O sensor range +/- 2inH2O
+    statusLine += " {:>s}{:>1d}".format(valvepressname, press_elapsed)
+    statusLine += "{:>6.1f}".format(currentpressure) # local conversion to Pascals, inH2O sensor range +/- 2inH2O
     ## Deliver any xbee values to std out
                                                                                                                                                 
     for item in xbeeCaptureList:
         if (math.isnan(item)):
-            print("     ",end='')   ## Try dropping Decimal for nan formatting
+            statusLine += "     "   ## Try dropping Decimal for nan formatting
         else:
-            print ("{:>5.0f}".format(Decimal(item)),end='')
+            statusLine += "{:>5.0f}".format(item)
             #print("     ",end='')   ## Try dropping Decimal for nan formatting
             
     ## Cleanup
     xbeeCaptureList = [NaN,NaN,NaN]  ## Reset values after stdout output.
     ## DWC 01.24 insert CO2 valve info (valve name for last value, new valve #, time on new valve
-    print(" {:>s}{:>02d} {:>4.0f} ".format(valveCO2name, co2_elapsed, currentCO2value), end='') # *** TODO  integer formatting of output 
-    print(" {:>1d}{:>1d}{:>1d}{:>1d}".format(wh.status, whmode, f.status, fmode), end='')
-    print("{:>2d} ".format(mon.state), end='')
-    print(" {:>4.2f}".format(round(Decimal(executiontime),3)), end='')
-    print()
+    statusLine += " {:>s}{:>02d} {:>4.0f} ".format(valveCO2name, co2_elapsed, currentCO2value) # *** TODO  integer formatting of output 
+    statusLine += " {:>1d}{:>1d}{:>1d}{:>1d}".format(wh.status, whmode, f.status, fmode)
+    statusLine += "{:>2d} ".format(mon.state)
+    statusLine += " {:>4.2f}".format(round(executiontime,3))
+    consoleStage.put(print, statusLine)
+    profiler.lap("console")
+    profiler.end()
     
     ## Check pressure values
     ## THIS MAKES FOR A COOL CUMULATIVE PRINT OF PRESSURES AS THEY ACCUMULATE OVER A 60-SEC PERIOD 
@@ -1147,6 +1282,7 @@ while True:
        
            
                     
+    lastScantime = scantime
     Lib.Timer.sleep()
     pass
     #print()      
@@ -1158,7 +1294,19 @@ while True:
 xbee.halt()  # Stop connection to Xbee
 ser.close()  # Close Serial connection (also to Xbee)
 Lib.controls[7].setValue(0)  # stop pumps
-try: 
-    dataFile.close()
-except:
-    print("Unable to close the DAT file currently being used")
+for stage in stages:
+    stage.close() ## runs what's still queued, so the writers below close after the last record
+for writer in dataWriters:
+    try: 
+        writer.close() ## commits any buffered records
+    except:
+        print("Unable to close the DAT file currently being used")
+for rollup in rollups:
+    try:
+        rollup.close()
+    except:
+        print("Unable to close ROLLUP file")
+if journal is not None:
+    journal.close()
+if bus is not None:
+    bus.close()
@@ -0,0 +1,131 @@
+#! /usr/bin/python
+
+## LoggerProfile.py -- Scan phase profiler for Combustion Monitoring
+## using BeagleBone Black (BBB) platform
+##
+## The main loop marks the end of each phase of a scan; the time since the previous mark goes into that
+## phase's histogram (log-spaced bins, BINS_PER_OCTAVE to a doubling, from 1 usec up), and the whole scan
+## into "scan":
+##   profiler.begin(); fetchAdcInputs(); profiler.lap("fetchAdcInputs"); ...; profiler.end()
+## skip() moves the mark on without timing anything (for code between the phases of interest).
+## A lap costs a clock reading and a log(), a couple of usec on the BBB.
+## With profileInterval in LoggerConfig (sec, 0 for none) the main loop writes a row to the _Info.csv
+## diagnostics file that often, the profiler being one of its params: for each phase the count of laps and
+## the p50, p95, p99 (upper edge of the bin they fall in, so at most ~9% high) and max in msec--then
+## starts the histograms over.
+
+from __future__ import print_function
+import math, time
+from array import array
+
+BINS_PER_OCTAVE = 8
+SMALLEST = 1e-6 ## sec, upper edge of the first bin
+OCTAVES = 28 ## up to ~4 min
+PERCENTILES = [50, 95, 99]
+SCAN = "scan"
+
+class Histogram(object):
+    """includes the count of durations per log-spaced bin, and the longest"""
+    __slots__ = ('bins', 'count', 'max')
+
+    def __init__(self):
+        self.bins = array('L', [0] * (BINS_PER_OCTAVE * OCTAVES + 1))
+        self.clear()
+        pass
+
+    def clear(self):
+        for index in range(len(self.bins)):
+            self.bins[index] = 0
+        self.count = 0
+        self.max = 0.0
+        pass
+
+    def add(self, seconds):
+        if seconds <= SMALLEST:
+            index = 0
+        else:
+            index = min(int(math.ceil(math.log(seconds / SMALLEST, 2) * BINS_PER_OCTAVE)), len(self.bins) - 1)
+        self.bins[index] += 1
+        self.count += 1
+        if seconds > self.max:
+            self.max = seconds
+        pass
+
+    def percentile(self, percent):
+        """the upper edge of the bin the percent'th percentile falls in (no more than the max), or NaN"""
+        if self.count == 0:
+            return float('NaN')
+        rank = max(1, int(math.ceil(self.count * percent / 100.0)))
+        seen = 0
+        for index, count in enumerate(self.bins):
+            seen += count
+            if seen >= rank:
+                return min(SMALLEST * 2.0 ** (float(index) / BINS_PER_OCTAVE), self.max)
+        return self.max
+
+class Profiler(object):
+    """includes a histogram per phase of the scan, timed as laps between marks. Reports as a diagnostics
+    param (reportHeaders() etc., see LoggerLib.diag_record())."""
+
+    def __init__(self, phases, clock=time.time):
+        self.phases = list(phases) + [SCAN]
+        self.clock = clock
+        self.histograms = dict([[phase, Histogram()] for phase in self.phases])
+        self.mark = clock()
+        self.scanStart = self.mark
+        pass
+
+    def begin(self):
+        """marks the start of a scan"""
+        self.mark = self.clock()
+        self.scanStart = self.mark
+        pass
+
+    def lap(self, phase):
+        """marks the end of phase: its time is that since the last mark"""
+        t = self.clock()
+        self.histograms[phase].add(t - self.mark)
+        self.mark = t
+        pass
+
+    def skip(self):
+        self.mark = self.clock()
+        pass
+
+    def end(self):
+        """marks the end of the scan"""
+        t = self.clock()
+        self.histograms[SCAN].add(t - self.scanStart)
+        self.mark = t
+        pass
+
+    def clear(self):
+        for histogram in self.histograms.values():
+            histogram.clear()
+        pass
+
+    def summary(self, phase):
+        """[count, p50, p95, p99, max] of phase, in msec"""
+        histogram = self.histograms[phase]
+        if histogram.count == 0:
+            return [0] + [float('NaN')] * (len(PERCENTILES) + 1)
+        return ([histogram.count] + [round(histogram.percentile(percent) * 1000, 3) for percent in PERCENTILES]
+                + [round(histogram.max * 1000, 3)])
+
+    def reportHeaders(self):
+        headers = list()
+        for phase in self.phases:
+            headers.extend([phase+"_n"] + [phase+"_p{}".format(percent) for percent in PERCENTILES] + [phase+"_max"])
+        return headers
+
+    def reportUnits(self):
+        return (["count"] + ["msec"] * (len(PERCENTILES) + 1)) * len(self.phases)
+
+    def reportScanData(self):
+        fields = list()
+        for phase in self.phases:
+            fields.extend(self.summary(phase))
+        return fields
+
+    def reportStatData(self):
+        return self.reportScanData()
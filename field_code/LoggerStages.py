@@ -0,0 +1,180 @@
+#! /usr/bin/python
+
+## LoggerStages.py -- Pipeline stages for the main loop of Combustion Monitoring
+## using BeagleBone Black (BBB) platform
+##
+## A stage is a worker thread and a bounded queue of jobs (a function and its arguments) it runs in
+## order. The main loop keeps the acquisition and the state/valve control, which must happen every tick,
+## and hands the rest to stages:
+##   writerStage.put(dataWriter.writeRecord, recordSchema, fields)   ## returns at once
+## so a slow SD card write or a blocked console doesn't hold up the next scan. Jobs the next scan
+## repeats anyway--commit and size checks, rollup ticks, journal state--are offer()ed under a key
+## instead: one still queued under the same key takes the new arguments in its place, and when the
+## queue is full it's dropped. Anything that isn't repeated (records, diagnostics rows) is put().
+## When the queue is full, put() drops the oldest job (the console: a status line is only worth
+## seeing now), or (the writer: records are never dropped) sheds the offered jobs still queued, waits for
+## room for no longer than the budget (the time left in the scan's tick), and then queues the job anyway,
+## past capacity--an overflow.
+## Until start() (or after close()) put() and offer() run the job right away, on the caller's thread.
+## A stage is a diagnostics param (see LoggerLib.diag_record()): its queue depth now, the deepest it's
+## been since clear(), how often and how long put() waited for room and overflowed, and the jobs
+## dropped, coalesced and failed.
+
+from __future__ import print_function
+import threading, collections, time
+
+WRITER_JOBS = 1200 ## ~5 min of records, commits and rollups at a few jobs a scan
+CONSOLE_JOBS = 30 ## status lines
+CLOSE_SECONDS = 30.0 ## how long close() waits for the queue to drain
+WAIT_SECONDS = 1.0 ## put() checks the stage is still running this often while it waits for room
+
+class Stage(threading.Thread):
+    """includes a worker thread, the bounded queue of jobs it runs in order, and its queue metrics"""
+
+    def __init__(self, name, capacity, drop=False, clock=time.time, budget=None):
+        threading.Thread.__init__(self, name=name+"Stage")
+        self.daemon = True
+        self.stage = name
+        self.capacity = capacity
+        self.drop = drop ## when full: drop the oldest job (True) or wait for room (False)
+        self.clock = clock
+        self.budget = budget ## sec put() may wait for room, now (None: until there's room)
+        self.jobs = collections.deque() ## [function, args, key, offered]
+        self.keyed = dict() ## key: the offered job queued under it
+        self.ready = threading.Condition()
+        self.closing = False
+        self.puts = 0
+        self.maxDepth = 0
+        self.waits = 0 ## puts that waited for room
+        self.waitTime = 0.0 ## sec
+        self.overflows = 0 ## puts queued past capacity, having waited out the budget
+        self.drops = 0
+        self.coalesced = 0 ## offers merged into a job still queued
+        self.errors = 0
+        pass
+
+    def put(self, function, *args):
+        """queues function(*args), or runs it now if the stage isn't running"""
+        if not self.is_alive():
+            self.call(function, args)
+            return
+        with self.ready:
+            if len(self.jobs) >= self.capacity:
+                if self.drop:
+                    self.forget(self.jobs.popleft())
+                    self.drops += 1
+                else:
+                    self.shed()
+                    if len(self.jobs) >= self.capacity:
+                        self.wait()
+            self.queue([function, args, None, False])
+        pass
+
+    def offer(self, key, function, *args):
+        """queues function(*args), a job the next scan repeats, unless a job of key is still queued--that
+        one takes these arguments instead--or the queue is full; never waits"""
+        if not self.is_alive():
+            self.call(function, args)
+            return
+        with self.ready:
+            job = self.keyed.get(key)
+            if job is not None:
+                job[0], job[1] = function, args
+                self.coalesced += 1
+            elif len(self.jobs) >= self.capacity:
+                self.drops += 1
+            else:
+                job = [function, args, key, True]
+                self.keyed[key] = job
+                self.queue(job)
+        pass
+
+    def queue(self, job):
+        self.jobs.append(job)
+        self.puts += 1
+        if len(self.jobs) > self.maxDepth:
+            self.maxDepth = len(self.jobs)
+        self.ready.notify_all()
+        pass
+
+    def shed(self):
+        """drops the offered jobs still queued, to make room for a put()"""
+        jobs = [job for job in self.jobs if not job[3]]
+        self.drops += len(self.jobs) - len(jobs)
+        self.jobs = collections.deque(jobs)
+        self.keyed.clear()
+        pass
+
+    def wait(self):
+        """waits for room for up to the budget; counts an overflow if there's still none"""
+        self.waits += 1
+        start = self.clock()
+        end = None if self.budget is None else start + max(0.0, self.budget())
+        while (len(self.jobs) >= self.capacity) and self.is_alive():
+            timeout = WAIT_SECONDS if end is None else min(WAIT_SECONDS, end - self.clock())
+            if timeout <= 0:
+                self.overflows += 1
+                break
+            self.ready.wait(timeout)
+        self.waitTime += self.clock() - start
+        pass
+
+    def forget(self, job):
+        if (job[2] is not None) and (self.keyed.get(job[2]) is job):
+            del self.keyed[job[2]]
+        pass
+
+    def run(self):
+        while True:
+            with self.ready:
+                while len(self.jobs) == 0:
+                    if self.closing:
+                        return
+                    self.ready.wait()
+                job = self.jobs.popleft()
+                self.forget(job)
+                self.ready.notify_all() ## room for a waiting put()
+            self.call(job[0], job[1])
+
+    def call(self, function, args):
+        try:
+            function(*args)
+        except Exception as err:
+            print("{} stage: {} failed: {}".format(self.stage, getattr(function, "__name__", function), err))
+            self.errors += 1
+        pass
+
+    def close(self, timeout=CLOSE_SECONDS):
+        """runs the jobs still queued and stops the thread; True if it drained in time"""
+        if not self.is_alive():
+            return True
+        with self.ready:
+            self.closing = True
+            self.ready.notify_all()
+        self.join(timeout)
+        if self.is_alive():
+            print("{} stage: {} jobs left after {} sec".format(self.stage, len(self.jobs), timeout))
+            return False
+        return True
+
+    def depth(self):
+        return len(self.jobs)
+
+    def clear(self):
+        """starts the deepest-queue metric over"""
+        self.maxDepth = len(self.jobs)
+        pass
+
+    def reportHeaders(self):
+        return [self.stage+suffix for suffix in ["_depth", "_depth_max", "_waits", "_wait_sec", "_overflows", "_drops",
+                                                 "_coalesced", "_errors"]]
+
+    def reportUnits(self):
+        return ["count", "count", "count", "sec", "count", "count", "count", "count"]
+
+    def reportScanData(self):
+        return [len(self.jobs), self.maxDepth, self.waits, round(self.waitTime, 3), self.overflows, self.drops,
+                self.coalesced, self.errors]
+
+    def reportStatData(self):
+        return self.reportScanData()
@@ -0,0 +1,477 @@
+#! /usr/bin/python
+
+## LoggerStore.py -- Data file storage for Combustion Monitoring
+## using BeagleBone Black (BBB) platform
+##
+## Keeps the current data file open and commits records to it in groups, rather than opening,
+## appending one line and closing the file every second (which updates the file's metadata on the
+## microSD card every tick).
+##
+## A group is committed once any of these is reached (LoggerConfig, Default Settings):
+##   dataCommitRecords - records waiting
+##   dataCommitBytes   - bytes waiting
+##   dataCommitSeconds - seconds since the last commit
+## and is forced on monitor state changes and file changes, so a burner start is on the card at once.
+##
+## dataFsync says when a commit also waits for the card (os.fsync):
+##   "commit" - every commit: a watchdog reset loses at most dataCommitSeconds of records
+##   "forced" - forced commits only: routine commits are left to the kernel's writeback (~30 sec more)
+##   "never"  - never
+##
+## dataRotate says when the main loop starts a new data file, besides on reaching maxFileSize:
+##   "hourly"/"daily" - also at each UTC hour/day; files are named for the start of their hour/day
+##   "size"           - only on size; files are named for the time they were started
+## The writer counts the bytes it writes, so the size check needs no os.stat() of the file.
+##
+## dataIndexEvery: CSV data files get a time index sidecar (<data file>.idx; see LoggerIndex) with an
+## entry for every dataIndexEvery'th record and every sys_state change (0 for none).
+##
+## dataFormat says how records are stored:
+##   "csv"    - text, a line per record (_Data.csv)
+##   "binary" - fixed-width packed rows under a schema block, with a CRC per commit (_Data.bin; see
+##              LoggerCodec). LoggerConvert.py turns a .bin file back into the exact CSV text.
+##   "columns" - each column compressed on its own, Gorilla style, a block per column per commit
+##              (_Data.gor; see LoggerColumns): a fraction of the CSV's size, and one column can be
+##              read back for a time range alone. LoggerConvert.py turns it back into the CSV too.
+##
+## dataSqlite adds an SQLite database (<siteName>_Data.sqlite in savePath) next to the data files, for
+## queries on the BBB. It spans file rotations and restarts: a segments row is added for each start and
+## each new data file (with its file name and headers), and each record points at its segment, so
+## rec_num (which restarts with the logger, unless taken from the journal) is unique per segment. Columns are added to the records
+## table as new params appear; old columns are kept. Records are inserted in a transaction per commit,
+## as for the data files, in WAL mode. time, sys_state, wh_mode and f_mode are indexed. E.g. the
+## water heater burner starts of the past week:
+##   SELECT r.time FROM records r JOIN records p ON p.id = r.id - 1
+##    WHERE r.time >= datetime('now', '-7 days') AND r.wh_mode = 1 AND p.wh_mode != 1;
+##
+## dataRollups adds rollup levels: for each (seconds), a record per period with every sensor's stats over all
+## its values in the period (kept by the sensors alongside the record's, see Sensor.rollups), written to
+## its own daily file (rollupFilename()) in dataFormat--e.g. [1, 60, 3600] for raw 1-sec, 1-min and 1-hour
+## files, whatever the monitor state. Other columns hold their values as of the period's last scan.
+##
+## dataJournal keeps a journal of the records since the last synced commit (<siteName>_Journal.bin; see
+## LoggerJournal). After a reset, recover() cuts the data file back to its last whole commit and writes the
+## journaled records after it again, before the main loop opens a data file.
+
+from __future__ import print_function
+import os, time, math, json, sqlite3
+from decimal import Decimal
+import LoggerConfig as Conf
+import LoggerCodec as Codec
+import LoggerColumns as Columns
+import LoggerIndex as Index
+import LoggerJournal as Journal
+
+FSYNC_NEVER = "never"
+FSYNC_FORCED = "forced"
+FSYNC_COMMIT = "commit"
+
+ROTATE_SIZE = "size"
+ROTATE_HOURLY = "hourly"
+ROTATE_DAILY = "daily"
+ROTATE_SECONDS = {ROTATE_HOURLY: 3600, ROTATE_DAILY: 86400}
+
+FORMAT_CSV = "csv"
+FORMAT_BINARY = "binary"
+FORMAT_COLUMNS = "columns"
+FORMAT_EXTENSIONS = {FORMAT_CSV: "_Data.csv", FORMAT_BINARY: "_Data.bin", FORMAT_COLUMNS: "_Data.gor"}
+
+## defaults for sites whose LoggerConfig predates these settings
+COMMIT_RECORDS = getattr(Conf, "dataCommitRecords", 60)
+COMMIT_BYTES = getattr(Conf, "dataCommitBytes", 64*1024)
+COMMIT_SECONDS = getattr(Conf, "dataCommitSeconds", 30)
+FSYNC = getattr(Conf, "dataFsync", FSYNC_COMMIT)
+ROTATE = getattr(Conf, "dataRotate", ROTATE_SIZE)
+FORMAT = getattr(Conf, "dataFormat", FORMAT_CSV)
+INDEX_EVERY = getattr(Conf, "dataIndexEvery", Index.INDEX_EVERY)
+SQLITE = getattr(Conf, "dataSqlite", False)
+CHUNKS = getattr(Conf, "dataChunks", False)
+JOURNAL = getattr(Conf, "dataJournal", True)
+JOURNAL_SYNC = getattr(Conf, "dataJournalSync", Journal.SYNC_SECONDS)
+
+SQLITE_INDEXED = ["time", "sys_state", "wh_mode", "f_mode"]
+SQLITE_SYNCHRONOUS = {FSYNC_COMMIT: "FULL", FSYNC_FORCED: "NORMAL", FSYNC_NEVER: "OFF"} ## for routine commits
+
+def periodStart(t, rotate=ROTATE):
+    """start (UTC epoch sec) of the hour/day t falls in, or None if files only rotate on size"""
+    seconds = ROTATE_SECONDS.get(rotate)
+    return None if seconds is None else int(t) - (int(t) % seconds)
+
+def dataFilename(savePath, siteName, t, rotate=ROTATE, dataFormat=FORMAT):
+    """name of the data file started at t: named for the start of its hour/day, or for t itself"""
+    start = periodStart(t, rotate)
+    return (savePath+time.strftime("%Y-%m-%d_%H_%M_%S_",time.gmtime(t if start is None else start))+siteName
+            +FORMAT_EXTENSIONS[dataFormat])
+
+def rollupLabel(seconds):
+    if seconds % 3600 == 0:
+        return "{}h".format(seconds // 3600)
+    elif seconds % 60 == 0:
+        return "{}m".format(seconds // 60)
+    return "{}s".format(seconds)
+
+def rollupFilename(savePath, siteName, t, seconds, dataFormat=FORMAT):
+    """name of the daily file of a rollup level: <UTC day>_<siteName>_Data_1m.csv (for 60 sec) etc."""
+    extension = FORMAT_EXTENSIONS[dataFormat]
+    return (savePath+time.strftime("%Y-%m-%d_%H_%M_%S_",time.gmtime(periodStart(t, ROTATE_DAILY)))+siteName
+            +extension.replace("_Data.", "_Data_"+rollupLabel(seconds)+"."))
+
+def databaseFilename(savePath, siteName):
+    return savePath+siteName+"_Data.sqlite"
+
+def dataWriter(filename, dataFormat=FORMAT, **settings):
+    """the writer for the configured data format"""
+    if dataFormat == FORMAT_BINARY:
+        return BinaryDataWriter(filename, **settings)
+    elif dataFormat == FORMAT_COLUMNS:
+        return ColumnDataWriter(filename, **settings)
+    return DataWriter(filename, **settings)
+
+class DataWriter(object):
+    """includes the open data file and the records waiting to be committed to it"""
+
+    indexed = True ## CSV files get a time index sidecar
+    dataFormat = FORMAT_CSV
+
+    def __init__(self, filename, commitRecords=COMMIT_RECORDS, commitBytes=COMMIT_BYTES,
+                 commitSeconds=COMMIT_SECONDS, fsync=FSYNC, indexEvery=INDEX_EVERY, journal=None):
+        self.journal = journal ## records are journaled until their commit is synced (see LoggerJournal)
+        self.commitRecords = commitRecords
+        self.commitBytes = commitBytes
+        self.commitSeconds = commitSeconds
+        self.fsync = fsync
+        self.indexEvery = indexEvery if self.indexed else 0
+        self.indexer = None ## from the header, by writeHeader()
+        self.indexFile = None
+        self.pending = list() ## lines waiting to be committed
+        self.pendingBytes = 0
+        self.commits = 0
+        self.syncs = 0
+        self.bytesWritten = 0 ## size of the current file, including records still waiting
+        self.file = None
+        self.filename = None
+        self.open(filename)
+        pass
+
+    def open(self, filename):
+        """commits and closes the current file (if any), and opens filename for appending"""
+        self.close()
+        self.filename = filename
+        self.file = open(filename, 'ab')
+        self.file.seek(0, os.SEEK_END)
+        self.bytesWritten = self.file.tell() ## nonzero if appending to a file started before a restart
+        self.lastCommit = time.time()
+        self.indexer = None
+        if self.indexEvery > 0:
+            try:
+                self.indexFile = open(Index.indexFilename(filename), 'ab')
+                self.indexFile.seek(0, os.SEEK_END)
+                if self.indexFile.tell() == 0:
+                    self.indexFile.write(Index.MAGIC)
+            except (IOError, OSError), err:
+                print("Unable to open INDEX of {}: {}".format(filename, err))
+                self.indexFile = None
+        pass
+
+    def close(self):
+        if self.file is not None:
+            self.commit(forced=True)
+            self.file.close()
+            self.file = None
+        if self.indexFile is not None:
+            self.indexFile.close()
+            self.indexFile = None
+        pass
+
+    def writeHeader(self, schema):
+        """starts a new file with the header row (a file carried on after a restart already has it)"""
+        if self.journal is not None:
+            self.journal.startFile(self.filename, self.dataFormat, schema.describe(), self.file.tell())
+        if self.bytesWritten == 0:
+            self.write(schema.header())
+        if self.indexFile is not None:
+            self.indexer = Index.Indexer(schema.headers, self.indexEvery)
+        pass
+
+    def writeRecord(self, schema, fields):
+        """buffers one record, from schema.values()--taken once per record, as it bumps rec_num"""
+        if self.journal is not None:
+            self.journal.record(fields)
+        if self.indexer is not None:
+            self.indexer.add(self.bytesWritten, fields) ## where its line will start
+        self.write(Codec.formatRow(schema.formats, fields))
+        pass
+
+    def write(self, line):
+        """buffers one record (without its newline); commits if the group is full"""
+        self.pending.append(line+'\n')
+        self.pendingBytes += len(line) + 1
+        self.bytesWritten += len(line) + 1
+        if (len(self.pending) >= self.commitRecords) or (self.pendingBytes >= self.commitBytes):
+            self.commit()
+        pass
+
+    def tick(self):
+        """commits if the oldest waiting record has waited long enough--call once a scan"""
+        if (len(self.pending) > 0) and ((time.time() - self.lastCommit) >= self.commitSeconds):
+            self.commit()
+        if self.journal is not None:
+            self.journal.tick()
+        pass
+
+    def flush(self):
+        """commits now (state changes, shutdown)"""
+        self.commit(forced=True)
+        pass
+
+    def commit(self, forced=False):
+        if len(self.pending) > 0:
+            synced = False
+            try:
+                self.file.write(self.encode(self.pending))
+                self.file.flush()
+                if ((self.fsync == FSYNC_COMMIT) or (forced and self.fsync == FSYNC_FORCED)
+                    or ((self.journal is not None) and self.journal.full() and (self.fsync != FSYNC_NEVER))):
+                    os.fsync(self.file.fileno())
+                    self.syncs += 1
+                    synced = True
+                self.commits += 1
+            except (IOError, OSError), err:
+                print("Unable to write to DATA file {}: {}".format(self.filename, err))
+                return ## keep the records for the next commit
+            if self.journal is not None:
+                self.journal.committed(self.file.tell(), synced or (self.fsync == FSYNC_NEVER))
+            self.pending = list()
+            self.pendingBytes = 0
+            if (self.indexer is not None) and (len(self.indexer.pending) > 0):
+                try:
+                    self.indexFile.write(self.indexer.take()) ## only now: entries never point past the data
+                    self.indexFile.flush()
+                except (IOError, OSError), err:
+                    print("Unable to write INDEX of {}: {}".format(self.filename, err))
+        self.lastCommit = time.time()
+        pass
+
+    def encode(self, pending):
+        return ''.join(pending)
+
+class BinaryDataWriter(DataWriter):
+    """includes an open binary data file: each commit is one CRC'd block of packed rows"""
+
+    indexed = False
+    dataFormat = FORMAT_BINARY
+
+    def __init__(self, filename, **settings):
+        self.codec = None
+        self.textRows = 0 ## rows that couldn't be packed exactly, stored as their CSV text
+        DataWriter.__init__(self, filename, **settings)
+        pass
+
+    def writeHeader(self, schema):
+        """writes the schema block--every time a file is opened, as the layout may have changed since
+        a restart; LoggerConvert only repeats the header row if it did"""
+        self.codec = self.newCodec(schema.describe())
+        preamble = self.codec.schemaBlock()
+        if self.bytesWritten == 0:
+            preamble = self.magic + preamble
+        self.commit(forced=True) ## rows already waiting belong under the previous schema block
+        if self.journal is not None:
+            self.journal.startFile(self.filename, self.dataFormat, schema.describe(), self.file.tell())
+        try:
+            self.file.write(preamble)
+            self.file.flush()
+        except (IOError, OSError), err:
+            print("Unable to write to DATA file {}: {}".format(self.filename, err))
+            return
+        self.bytesWritten += len(preamble)
+        pass
+
+    magic = Codec.MAGIC
+
+    def newCodec(self, layout):
+        return Codec.RowCodec(layout)
+
+    def writeRecord(self, schema, fields):
+        """buffers one record as a packed row; commits if the group is full"""
+        if self.journal is not None:
+            self.journal.record(fields)
+        entry = self.codec.encode(fields)
+        if entry is None:
+            entry = [Codec.formatRow(schema.formats, fields)]
+            size = 1 + Codec.countField.size + len(entry[0])
+            self.textRows += 1
+        else:
+            size = 1 + len(entry)
+        if len(self.pending) == 0:
+            size += Codec.blockHead.size + Codec.countField.size + Codec.blockTail.size ## the group's block
+        self.pending.append(entry)
+        self.pendingBytes += size
+        self.bytesWritten += size
+        if (len(self.pending) >= self.commitRecords) or (self.pendingBytes >= self.commitBytes):
+            self.commit()
+        pass
+
+    def encode(self, pending):
+        return self.codec.rowsBlock(pending)
+
+class ColumnDataWriter(BinaryDataWriter):
+    """includes an open column data file: each commit is a compressed block per column"""
+
+    magic = Columns.MAGIC
+    dataFormat = FORMAT_COLUMNS
+
+    def newCodec(self, layout):
+        return Columns.ColumnCodec(layout)
+
+    def writeRecord(self, schema, fields):
+        """buffers one record's fields; commits if the group is full. The group is only compressed
+        when committed, so bytesWritten counts it then, and dataCommitBytes doesn't apply."""
+        if self.journal is not None:
+            self.journal.record(fields)
+        self.pending.append(fields)
+        if len(self.pending) >= self.commitRecords:
+            self.commit()
+        pass
+
+    def encode(self, pending):
+        times = list()
+        for fields in pending:
+            try:
+                times.append(Columns.recordTime(fields[self.codec.timeColumn]))
+            except ValueError:
+                times.append(times[-1] if times else 0)
+        data = self.codec.group(times, pending)
+        self.bytesWritten += len(data)
+        return data
+
+def sqlValue(field):
+    """field as SQLite stores it: NaN as NULL, Decimals as floats, the time without its quotes"""
+    if isinstance(field, float):
+        return None if math.isnan(field) else field
+    elif isinstance(field, Decimal):
+        return None if field.is_nan() else float(field)
+    elif isinstance(field, str) and (len(field) >= 2) and field.startswith('"') and field.endswith('"'):
+        return field[1:-1]
+    return field
+
+class SqliteWriter(DataWriter):
+    """includes the open SQLite database and the records waiting to be inserted in one transaction"""
+
+    indexed = False
+
+    def __init__(self, filename, **settings):
+        self.db = None
+        self.segment = None
+        self.insert = None
+        DataWriter.__init__(self, filename, **settings)
+        pass
+
+    def open(self, filename):
+        self.close()
+        self.filename = filename
+        self.db = sqlite3.connect(filename, isolation_level=None) ## transactions are begun by commit()
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS segments (id INTEGER PRIMARY KEY, started TEXT, file TEXT, headers TEXT)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS records (id INTEGER PRIMARY KEY, segment INTEGER NOT NULL)")
+        self.bytesWritten = os.path.getsize(filename)
+        self.lastCommit = time.time()
+        pass
+
+    def close(self):
+        if self.db is not None:
+            self.commit(forced=True)
+            self.db.close()
+            self.db = None
+        pass
+
+    def writeHeader(self, schema, dataFile=""):
+        """starts a segment: at each start and each new data file. Adds columns for new headers."""
+        self.commit(forced=True) ## records waiting belong to the previous segment
+        try:
+            self.db.execute("BEGIN") ## the new columns, indexes and segment in one transaction (one WAL commit)
+            columns = [row[1] for row in self.db.execute("PRAGMA table_info(records)")]
+            for header, kind in zip(schema.headers, schema.kinds):
+                if header not in columns:
+                    self.db.execute('ALTER TABLE records ADD COLUMN "{}" {}'.format(header,
+                                    "TEXT" if kind == Codec.KIND_STRING else "NUMERIC"))
+                    columns.append(header)
+            for header in SQLITE_INDEXED:
+                if header in columns:
+                    self.db.execute('CREATE INDEX IF NOT EXISTS records_{0} ON records ("{0}")'.format(header))
+            self.segment = self.db.execute("INSERT INTO segments (started, file, headers) VALUES (?, ?, ?)",
+                [time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime()), dataFile, json.dumps(schema.headers)]).lastrowid
+            self.db.execute("COMMIT")
+        except sqlite3.Error, err:
+            print("Unable to set up DATABASE {}: {}".format(self.filename, err))
+            try:
+                self.db.execute("ROLLBACK")
+            except sqlite3.Error: ## no transaction left to roll back
+                pass
+            return
+        self.insert = 'INSERT INTO records (segment, {}) VALUES (?{})'.format(
+            ', '.join(['"{}"'.format(header) for header in schema.headers]), ', ?' * len(schema.headers))
+        pass
+
+    def writeRecord(self, schema, fields):
+        """buffers one record; inserts the group if full"""
+        self.pending.append([self.segment] + [sqlValue(field) for field in fields])
+        if len(self.pending) >= self.commitRecords:
+            self.commit()
+        pass
+
+    def commit(self, forced=False):
+        if (len(self.pending) > 0) and (self.insert is not None):
+            try:
+                self.db.execute("PRAGMA synchronous={}".format("FULL" if (forced and self.fsync != FSYNC_NEVER)
+                                                               else SQLITE_SYNCHRONOUS[self.fsync]))
+                self.db.execute("BEGIN")
+                self.db.executemany(self.insert, self.pending)
+                self.db.execute("COMMIT")
+                self.commits += 1
+            except sqlite3.Error, err:
+                print("Unable to write to DATABASE {}: {}".format(self.filename, err))
+                try:
+                    self.db.execute("ROLLBACK")
+                except sqlite3.Error: ## no transaction left to roll back
+                    pass
+                return ## keep the records for the next commit
+            self.pending = list()
+            self.bytesWritten = os.path.getsize(self.filename)
+        self.lastCommit = time.time()
+        pass
+
+def recover(journalFilename):
+    """finishes the data files of the journal left by the last run: cuts each back to the last commit it
+    holds whole and writes the journaled records after it again. Returns the journal's state machine and
+    rec_num (see LoggerJournal.lastState), or None if there's no journal."""
+    if not os.path.exists(journalFilename):
+        return None
+    entries = Journal.repair(journalFilename)
+    for fileEntry, commits in Journal.files(entries):
+        filename = fileEntry["file"]
+        if not os.path.exists(filename):
+            print("JOURNAL: DATA file {} is gone; not recovering its records".format(filename))
+            continue
+        size = os.path.getsize(filename)
+        if size < commits[0][0]:
+            print("JOURNAL: DATA file {} is shorter than journaled; not recovering its records".format(filename))
+            continue
+        index = Journal.lost(commits, size)
+        if index is None:
+            continue
+        records = [fields for commitSize, commitRecords in commits[index:] for fields in commitRecords]
+        print("JOURNAL: recovering DATA file {}: {} bytes cut, {} records written again".format(
+              filename, size - commits[index][0], len(records)))
+        try:
+            with open(filename, 'r+b') as dataFile:
+                dataFile.truncate(commits[index][0])
+            Index.cut(filename, commits[index][0]) ## the replayed records get their entries again
+            layout = Codec.Layout(fileEntry["layout"])
+            writer = dataWriter(filename, fileEntry["format"], fsync=FSYNC_COMMIT)
+            writer.writeHeader(layout) ## the header row only if the file is empty; binary rows need a schema block
+            for fields in records:
+                writer.writeRecord(layout, fields)
+            writer.close()
+        except (IOError, OSError, ValueError, KeyError), err:
+            print("Unable to recover DATA file {}: {}".format(filename, err))
+    return Journal.lastState(entries, journalFilename)
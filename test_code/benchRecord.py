@@ -0,0 +1,77 @@
+#! /usr/bin/python
+
+## Microbenchmark of the data record pipeline (Sensor -> Param -> record text)
+## Times Lib.record() for 1-sec and multi-sec records on the float path, and again with every reported
+## value wrapped in a Decimal (the old path), and checks both give the same text. Then compares the size of
+## binary rows (dataFormat = "binary") with the CSV lines of the same records, and checks they convert back.
+## Run on the BBB from this directory:  python benchRecord.py [records] [values per sensor]
+
+from __future__ import print_function
+import sys, os, time, random
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "field_code"))
+os.chdir(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "field_code"))
+import LoggerLib as Lib
+import LoggerCodec as Codec
+
+records = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+valuesPerSensor = int(sys.argv[2]) if len(sys.argv) > 2 else 60
+
+## fill every sensor with a record's worth of values (a few NaN, as from out-of-range readings)
+rng = random.Random(2445)
+for sensor in Lib.sensors:
+    if isinstance(sensor, Lib.Gpi):
+        continue
+    for x in range(valuesPerSensor):
+        if rng.random() < 0.02:
+            sensor.appendValue(float('NaN'))
+        elif isinstance(sensor, Lib.Dlvr):
+            sensor.appendValue(rng.uniform(-30.0, 30.0))
+        elif sensor in [Lib.fan1, Lib.fan2]: ## fan currents, as ADC volts
+            sensor.appendValue(rng.uniform(0.0, 10.0))
+        else:
+            sensor.appendValue(rng.uniform(40.0, 600.0))
+Lib.timestamp.setValue("\"2015-01-01 00:00:00\"")
+Lib.compileSchema()
+
+def timeRecords(recType):
+    Lib.recnum.setValue(0)
+    text = Lib.record(recType)
+    start = time.time()
+    for x in range(records):
+        Lib.record(recType)
+    return [text, (time.time() - start) / records]
+
+results = dict()
+floatNUM = Lib.NUM
+for path, wrap in [["float", floatNUM], ["Decimal", Lib.DEC]]:
+    Lib.NUM = wrap ## what SampledParam wraps each reported value in
+    for recType, name in [[Lib.SingleScanRec, "1-sec"], [Lib.MultiScanRec, "multi-sec"]]:
+        results[(path, name)] = timeRecords(recType)
+Lib.NUM = floatNUM
+
+print("{} columns, {} values per sensor, {} records each".format(len(Lib.schema.headers), valuesPerSensor, records))
+for name in ["1-sec", "multi-sec"]:
+    before = results[("Decimal", name)]
+    after = results[("float", name)]
+    print("{:>10s} record: Decimal {:8.1f} us  float {:8.1f} us  ({:.1f}x)  text {}".format(name,
+        before[1] * 1e6, after[1] * 1e6, before[1] / after[1], "identical" if before[0] == after[0] else "DIFFERS"))
+
+## binary rows against CSV lines, for the same records
+codec = Codec.RowCodec(Lib.schema.describe())
+for recType, name in [[Lib.SingleScanRec, "1-sec"], [Lib.MultiScanRec, "multi-sec"]]:
+    csvBytes = binaryBytes = textRows = 0
+    same = True
+    for x in range(records):
+        fields = Lib.schema.values(recType)
+        line = Codec.formatRow(Lib.schema.formats, fields)
+        row = codec.encode(fields)
+        csvBytes += len(line) + 1
+        if row is None:
+            textRows += 1
+            binaryBytes += 1 + Codec.countField.size + len(line)
+        else:
+            binaryBytes += 1 + len(row)
+            same = same and (','.join(codec.decode(row)) == line)
+    print("{:>10s} record: CSV {:6.1f} bytes  binary {:6.1f} bytes  ({:.2f}x)  {} text rows  text {}".format(name,
+        float(csvBytes) / records, float(binaryBytes) / records, float(binaryBytes) / csvBytes, textRows,
+        "identical" if same else "DIFFERS"))